@@ -0,0 +1,72 @@
+from time import perf_counter
+from typing import Callable, Dict
+
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.http import HttpRequest, HttpResponse
+from django.test import RequestFactory, override_settings
+
+from myauth.views import get_session_view, set_session_view
+
+
+def set_counter_view(request: HttpRequest) -> HttpResponse:
+    request.session['counter'] = request.session.get('counter', 0) + 1
+    return HttpResponse()
+
+
+class Command(BaseCommand):
+    """
+    Compares session engines
+    """
+    help = (
+        'Runs the session views through SessionMiddleware with every SESSION_ENGINES mode '
+        'and reports requests per second and database queries per request. '
+        'Changes are rolled back; run bench_http against a deployed server for end-to-end numbers'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per engine and scenario')
+
+    def handle(self, *args, **options):
+        scenarios: Dict[str, Callable[[HttpRequest], HttpResponse]] = {
+            'read': get_session_view,
+            'same write': set_session_view,
+            'new write': set_counter_view,
+        }
+        self.stdout.write(f'{options["requests"]} запросов на движок и сценарий, кеш {settings.CACHES["default"]["BACKEND"]}')
+        # the stock database store, which saves every modified session, as a baseline
+        engines = {'db (django)': 'django.contrib.sessions.backends.db', **settings.SESSION_ENGINES}
+        for mode, engine in engines.items():
+            with override_settings(SESSION_ENGINE=engine), transaction.atomic():
+                for label, view in scenarios.items():
+                    seconds, queries = self.run(view, options['requests'])
+                    self.stdout.write(
+                        f'  {mode:<15} {label:<11} {options["requests"] / seconds:9.0f} запр/с, '
+                        f'запросов к БД на запрос: {queries / options["requests"]:.2f}'
+                    )
+                transaction.set_rollback(True)
+
+    @staticmethod
+    def run(view: Callable[[HttpRequest], HttpResponse], total: int):
+        factory = RequestFactory()
+        # the session is created before timing, as after a login
+        response = SessionMiddleware(set_counter_view)(factory.get('/'))
+        factory.cookies[settings.SESSION_COOKIE_NAME] = response.cookies[settings.SESSION_COOKIE_NAME].value
+
+        middleware = SessionMiddleware(view)
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            started = perf_counter()
+            for _ in range(total):
+                response = middleware(factory.get('/'))
+                if settings.SESSION_COOKIE_NAME in response.cookies:
+                    factory.cookies[settings.SESSION_COOKIE_NAME] = response.cookies[settings.SESSION_COOKIE_NAME].value
+            seconds = perf_counter() - started
+        return seconds, len(queries)
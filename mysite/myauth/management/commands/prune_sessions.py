@@ -0,0 +1,56 @@
+from importlib import import_module
+from time import sleep
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+
+def session_model():
+    """ Модель сессий текущего движка; для cache и signed_cookies - таблица, оставшаяся от db-режимов """
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    if hasattr(store, 'get_model_class'):
+        return store.get_model_class()
+    return Session
+
+
+def prune_expired(batch_size: int, pause: float = 0.0) -> int:
+    """
+    Удаляет истёкшие сессии пачками по ``batch_size`` строк.
+
+    Каждая пачка - отдельный короткий DELETE по первичному ключу, поэтому
+    блокировка записи SQLite не удерживается на всё время очистки
+    """
+    model = session_model()
+    now = timezone.now()
+    deleted = 0
+    while True:
+        keys = list(
+            model.objects.filter(expire_date__lt=now)
+            .order_by('expire_date')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not keys:
+            return deleted
+        deleted += model.objects.filter(pk__in=keys).delete()[0]
+        if pause:
+            sleep(pause)
+
+
+class Command(BaseCommand):
+    """
+    Deletes expired sessions in batches
+    """
+    help = (
+        'Batched replacement of clearsessions: deletes expired database sessions '
+        'in short transactions, so requests are not blocked while it runs'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        deleted = prune_expired(options['batch_size'], options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено истёкших сессий: {deleted}'))
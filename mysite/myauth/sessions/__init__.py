@@ -0,0 +1,40 @@
+"""
+Хранилища сессий myauth.
+
+Движок выбирается настройкой ``DJANGO_SESSION_ENGINE`` (см. ``SESSION_ENGINES``
+в настройках). Хранилища ``db`` и ``cached_db`` из этого пакета не записывают
+сессию повторно, если её данные не изменились с момента загрузки: присваивание
+того же значения или ``session.modified = True`` без изменений не приводит
+к UPDATE в базе данных и записи в кеш
+"""
+
+from copy import deepcopy
+from typing import Optional
+
+from django.conf import settings
+
+
+class CoalescingSessionMixin:
+    """ Пропускает сохранение сессии без изменений """
+    _stored: Optional[dict] = None
+
+    def load(self):
+        data = super().load()
+        # session_key is reset by the store when the session was not found
+        self._stored = deepcopy(data) if self.session_key is not None else None
+        return data
+
+    def is_unchanged(self) -> bool:
+        # with SESSION_SAVE_EVERY_REQUEST every save also extends the expiry, so it is kept
+        return (
+            not settings.SESSION_SAVE_EVERY_REQUEST
+            and self.session_key is not None
+            and self._stored is not None
+            and self._session == self._stored
+        )
+
+    def save(self, must_create=False):
+        if not must_create and self.is_unchanged():
+            return
+        super().save(must_create)
+        self._stored = deepcopy(self._session)
@@ -1,3 +1,94 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .management.commands.prune_sessions import prune_expired
+from .sessions.cached_db import SessionStore as CachedDBStore
+from .sessions.db import SessionStore as DBStore
+
+
+@override_settings(LANGUAGE_CODE='en', SESSION_ENGINE='myauth.sessions.db')
+class CoalescingSessionTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def create_session(self, store_class, **data):
+        session = store_class()
+        session.update(data)
+        session.create()
+        return session.session_key
+
+    def test_unchanged_session_is_not_saved(self):
+        session = DBStore(self.create_session(DBStore, myuser='mysession'))
+        session['myuser'] = 'mysession'
+        self.assertTrue(session.modified)
+        with self.assertNumQueries(0):
+            session.save()
+
+    def test_changed_session_is_saved(self):
+        session_key = self.create_session(DBStore, myuser='mysession')
+        session = DBStore(session_key)
+        session['myuser'] = 'another'
+        with self.assertNumQueries(3):
+            session.save()
+        self.assertEqual(DBStore(session_key)['myuser'], 'another')
+
+    def test_cached_db_session_is_read_and_kept_in_cache(self):
+        session_key = self.create_session(CachedDBStore, myuser='mysession')
+        session = CachedDBStore(session_key)
+        with self.assertNumQueries(0):
+            session['myuser'] = 'mysession'
+            session.save()
+
+    def test_set_session_view_writes_once(self):
+        url = reverse('myauth:set_session')
+        self.client.get(url)
+        self.assertEqual(Session.objects.count(), 1)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('myauth:get_session'))
+        self.assertContains(response, 'mysession')
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=True)
+    def test_save_every_request_is_respected(self):
+        session = DBStore(self.create_session(DBStore, myuser='mysession'))
+        session['myuser'] = 'mysession'
+        with self.assertNumQueries(3):
+            session.save()
+
+
+@override_settings(SESSION_ENGINE='myauth.sessions.db')
+class PruneSessionsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            Session(session_key=f'expired{index}', session_data='', expire_date=now - timedelta(days=index + 1))
+            for index in range(5)
+        )
+        Session.objects.bulk_create(
+            Session(session_key=f'active{index}', session_data='', expire_date=now + timedelta(days=1))
+            for index in range(2)
+        )
+
+    def test_prune_expired_in_batches(self):
+        with self.assertNumQueries(7):
+            deleted = prune_expired(batch_size=2)
+        self.assertEqual(deleted, 5)
+        self.assertQuerysetEqual(
+            Session.objects.order_by('session_key').values_list('session_key', flat=True),
+            ['active0', 'active1'],
+        )
+
+    def test_command_reports_deleted(self):
+        stdout = StringIO()
+        call_command('prune_sessions', batch_size=3, stdout=stdout)
+        self.assertIn('5', stdout.getvalue())
+        self.assertEqual(Session.objects.count(), 2)
@@ -5,6 +5,37 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+ASGI deployment mode: the asynchronous read API of shopapp
+(``/<lang>/shop/api/async/...``, see ``shopapp/async_api.py``) uses the async ORM
+and only frees the worker while waiting for the database under an ASGI server,
+for example gunicorn with uvicorn workers (uvicorn has to be installed in the image):
+
+    gunicorn mysite.asgi:application -k uvicorn.workers.UvicornWorker --workers 4 --bind 0.0.0.0:8000
+
+All other views stay synchronous and are run in a thread pool by Django.
+Every middleware in MIDDLEWARE has to be async-capable, otherwise Django adapts
+the whole handler to sync and the async views lose their benefit; the sync-only
+debug toolbar is therefore only enabled with DJANGO_DEBUG=1.
+Compare both modes with ``python manage.py bench_http <sync url> <async url>``.
+
+Measured on 1 vCPU, SQLite seeded by ``seed_shop --products 5000 --orders 5000``,
+2 gunicorn workers per server, 600 requests at concurrency 32, the client on the
+same machine, SENTRY_ENABLED=0 (requests per second, p50 latency, two runs):
+
+    WSGI  /en/shop/api/products/                           107-110 rps, p50 289-293 ms
+    ASGI  /en/shop/api/products/                            69-75 rps,  p50 421-455 ms
+    ASGI  /en/shop/api/async/products/, sync middleware    100-117 rps, p50 255-312 ms
+    ASGI  /en/shop/api/async/products/, async chain         79-87 rps,  p50 368-401 ms
+
+("sync middleware" is the handler adapted to sync by the toolbar and the former
+sync-only MetricsMiddleware, "async chain" - all middleware async-capable.)
+
+With a local SQLite file the database never makes the worker wait, and every
+async ORM call of Django 4.2 is still a hop to the sync_to_async thread, so the
+fully async chain is slower than one sync thread per request here. The async
+views only pay off when requests wait on the network, e.g. PostgreSQL on
+another host; sync views are best served by the WSGI server.
 """
 
 import os
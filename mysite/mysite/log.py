@@ -0,0 +1,125 @@
+"""
+Журналирование проекта без ожидания вывода в потоке запроса.
+
+``BackgroundHandler`` кладёт записи в очередь, а пишет их в поток вывода
+отдельный поток ``QueueListener``: обработчик запроса не ждёт stdout/stderr,
+общий для всех воркеров. При переполнении очереди записи отбрасываются.
+``SamplingFilter`` пропускает лишь долю записей уровня INFO и ниже от частых
+логгеров, предупреждения и ошибки проходят всегда. ``JsonFormatter`` выводит
+запись одной строкой JSON для сборщиков логов
+"""
+
+import copy
+import json
+import logging
+import os
+import random
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+from typing import Dict, Optional, TextIO
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """ ``shopapp.views=0.01,blogapp=0.1`` -> ``{'shopapp.views': 0.01, 'blogapp': 0.1}`` """
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, rate = item.split('=')
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """ Пропускает долю ``rates[logger]`` записей уровня до ``max_level`` включительно """
+
+    def __init__(self, rates: Dict[str, float], max_level: str = 'INFO'):
+        super().__init__()
+        # the most specific logger name is checked first
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self.max_level = logging.getLevelName(max_level)
+
+    def rate(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + '.'):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'line': record.lineno,
+            'process': record.process,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Обработчик, который пишет записи в ``stream`` из фонового потока.
+
+    Поток запускается при первой записи в каждом процессе, так что обработчик
+    можно создать до fork воркеров gunicorn. Оставшиеся записи выводятся
+    при закрытии обработчика, в том числе в ``logging.shutdown`` при выходе
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, queue_size: int = 10000):
+        super().__init__(Queue(queue_size))
+        self.target = logging.StreamHandler(stream)
+        self.listener: Optional[QueueListener] = None
+        self.listener_pid: Optional[int] = None
+        self.dropped = 0
+
+    def setFormatter(self, fmt: Optional[logging.Formatter]) -> None:
+        # records are formatted by the listener thread
+        self.target.setFormatter(fmt)
+
+    def start(self) -> None:
+        with self.lock:
+            if self.listener_pid != os.getpid():
+                self.listener = QueueListener(self.queue, self.target)
+                self.listener.start()
+                self.listener_pid = os.getpid()
+
+    def stop(self) -> None:
+        if self.listener is not None and self.listener_pid == os.getpid():
+            self.listener.stop()
+            self.listener, self.listener_pid = None, None
+        self.target.flush()
+
+    def close(self) -> None:
+        self.stop()
+        super().close()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """ Подставляет аргументы в сообщение сразу, они могут измениться до вывода """
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.listener_pid != os.getpid():
+            self.start()
+        super().emit(record)
@@ -0,0 +1,161 @@
+"""
+Раздача загруженных файлов (MEDIA_ROOT): изображений товаров и аватаров.
+
+Способ задаётся настройкой ``MEDIA_DELIVERY``:
+
+* ``static`` - ``django.views.static.serve``, только при DEBUG, как раньше;
+* ``file`` - ``FileResponse``: под gunicorn файл целиком отдаётся через
+  ``wsgi.file_wrapper`` (sendfile, без копирования в Python), поддерживаются
+  запросы диапазонов (Range) и условные запросы;
+* ``x-accel`` - ответ без тела с заголовком ``X-Accel-Redirect``, файл
+  отдаёт nginx из internal-location ``MEDIA_ACCEL_PREFIX``::
+
+      location /protected-media/ {
+          internal;
+          alias /app/uploads/;
+      }
+
+* ``x-sendfile`` - заголовок ``X-Sendfile`` с полным путём для Apache
+  mod_xsendfile и совместимых серверов;
+* ``none`` - файлы раздаёт внешний сервер по MEDIA_URL, Django их не обслуживает.
+
+Файлы с хешем содержимого в имени (``MEDIA_IMMUTABLE_PATTERN``, например
+рендиции изображений товаров) отдаются с ``Cache-Control: immutable``
+на год, остальные - с коротким временем жизни и проверкой по Last-Modified/ETag
+"""
+
+import mimetypes
+import posixpath
+import re
+from pathlib import Path
+from typing import IO, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.conf.urls.static import static
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.urls import URLPattern, re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+DELIVERY_MODES = 'static', 'file', 'x-accel', 'x-sendfile', 'none'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+def resolve_media_path(path: str) -> Tuple[str, Path]:
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = Path(safe_join(settings.MEDIA_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404('Media file not found')
+    if not fullpath.is_file():
+        raise Http404('Media file not found')
+    return path, fullpath
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Первый диапазон из ``Range: bytes=...`` как (начало, конец включительно).
+
+    None - заголовок не разобран и отдаётся файл целиком, ``(size, size)`` -
+    диапазон за пределами файла
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)(?:,.*)?', header.strip())
+    if match is None or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        length = int(end)
+        if length == 0:
+            return size, size
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        return size, size
+    if end < start:
+        return None
+    return start, end
+
+
+def iter_file_range(file: IO[bytes], start: int, length: int) -> Iterator[bytes]:
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(request: HttpRequest, fullpath: Path, size: int, content_type: str, etag: str, mtime: float):
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and if_range and if_range != etag and parse_http_date_safe(if_range) != int(mtime):
+        range_header = None
+    byte_range = parse_range(range_header, size) if range_header else None
+
+    if byte_range is None:
+        response = FileResponse(fullpath.open('rb'), content_type=content_type)
+    elif byte_range[0] >= size:
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_file_range(fullpath.open('rb'), start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response.headers['Content-Length'] = str(end - start + 1)
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_media(request: HttpRequest, path: str) -> HttpResponse:
+    path, fullpath = resolve_media_path(path)
+    stat = fullpath.stat()
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    immutable = re.match(settings.MEDIA_IMMUTABLE_PATTERN, path) is not None
+
+    # lists, weak tags and "*" in If-None-Match, If-Modified-Since only without it
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(str(fullpath))
+        content_type = content_type or 'application/octet-stream'
+        if settings.MEDIA_DELIVERY == 'x-accel':
+            response = HttpResponse(content_type=content_type)
+            response.headers['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + path)
+        elif settings.MEDIA_DELIVERY == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response.headers['X-Sendfile'] = str(fullpath)
+        else:
+            response = file_response(request, fullpath, stat.st_size, content_type, etag, stat.st_mtime)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    response.headers['Cache-Control'] = (
+        IMMUTABLE_CACHE_CONTROL if immutable else f'public, max-age={settings.MEDIA_MAX_AGE}'
+    )
+    return response
+
+
+def media_urlpatterns() -> List[URLPattern]:
+    """ Адреса MEDIA_URL для выбранного способа раздачи """
+    if settings.MEDIA_DELIVERY not in DELIVERY_MODES:
+        raise ValueError(f'Unknown MEDIA_DELIVERY {settings.MEDIA_DELIVERY!r}, expected one of {DELIVERY_MODES}')
+    if settings.MEDIA_DELIVERY == 'none':
+        return []
+    if settings.MEDIA_DELIVERY == 'static':
+        return static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    return [
+        re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.*)$', serve_media, name='media'),
+    ]
@@ -0,0 +1,190 @@
+"""
+Метрики запросов в памяти процесса, без внешних сервисов.
+
+``MetricsMiddleware`` измеряет время ответа и число запросов к базе данных
+и передаёт их хранилищу ``METRICS_BACKEND`` (по умолчанию ``InMemoryMetrics``)
+с разбивкой по имени адреса представления. Медленные запросы
+(``METRICS_SLOW_REQUEST_MS``) дополнительно пишутся в журнал.
+Middleware работает и в синхронном, и в асинхронном режиме, поэтому под ASGI
+не переводит обработку запроса в поток. Запросы к базе считаются обёрткой
+на каждом соединении и переменной контекста, так что учитываются и запросы
+асинхронных представлений, выполненные в потоке ``sync_to_async``.
+Снимок отдаёт ``metrics_view`` по адресу ``/metrics/`` только персоналу:
+за локальным прокси все запросы приходят с 127.0.0.1, поэтому адрес
+клиента для доступа не учитывается. Каждый воркер gunicorn хранит свои метрики
+"""
+
+import logging
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter, time
+from typing import Callable, Dict, List, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_MS = 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000
+
+
+class ViewStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.slow = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets: List[int] = [0] * (len(BUCKETS_MS) + 1)
+        self.queries = 0
+        self.max_queries = 0
+
+    def observe(self, duration_ms: float, queries: int, status: int) -> None:
+        self.count += 1
+        self.errors += status >= 500
+        self.slow += duration_ms >= settings.METRICS_SLOW_REQUEST_MS
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.buckets[bisect_left(BUCKETS_MS, duration_ms)] += 1
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+
+    def as_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'slow': self.slow,
+            'mean_ms': round(self.total_ms / self.count, 2),
+            'max_ms': round(self.max_ms, 2),
+            # requests per bucket, each bucket is "up to N ms"
+            'histogram_ms': dict(zip([*map(str, BUCKETS_MS), '+Inf'], self.buckets)),
+            'queries_mean': round(self.queries / self.count, 2),
+            'queries_max': self.max_queries,
+        }
+
+
+class InMemoryMetrics:
+    """ Хранилище метрик текущего процесса """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.started = time()
+        self.views: Dict[str, ViewStats] = {}
+
+    def observe(self, view: str, duration_ms: float, queries: int, status: int) -> None:
+        with self.lock:
+            self.views.setdefault(view, ViewStats()).observe(duration_ms, queries, status)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'since': self.started,
+                'views': {view: stats.as_dict() for view, stats in sorted(self.views.items())},
+            }
+
+    def reset(self) -> None:
+        with self.lock:
+            self.started = time()
+            self.views.clear()
+
+
+_metrics = None
+
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        _metrics = import_string(settings.METRICS_BACKEND)()
+    return _metrics
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+
+# counter of the current request, copied into sync_to_async threads with the context
+request_queries: ContextVar[Optional[QueryCounter]] = ContextVar('request_queries', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    counter = request_queries.get()
+    if counter is not None:
+        counter.count += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(connection: BaseDatabaseWrapper) -> None:
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection: BaseDatabaseWrapper, **kwargs):
+    install_query_counter(connection)
+
+
+def request_view_name(request: HttpRequest) -> str:
+    match = getattr(request, 'resolver_match', None)
+    return '<unresolved>' if match is None else match.view_name
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
+        self.get_response = get_response
+        self.metrics = get_metrics()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # connections opened before this middleware was loaded
+        for connection in connections.all(initialized_only=True):
+            install_query_counter(connection)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self.is_async:
+            return self.__acall__(request)
+        counter = QueryCounter()
+        token = request_queries.set(counter)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_queries.reset(token)
+        self.observe(request, response, (perf_counter() - started) * 1000, counter.count)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        counter = QueryCounter()
+        token = request_queries.set(counter)
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_queries.reset(token)
+        self.observe(request, response, (perf_counter() - started) * 1000, counter.count)
+        return response
+
+    def observe(self, request: HttpRequest, response: HttpResponse, duration_ms: float, queries: int) -> None:
+        view = request_view_name(request)
+        self.metrics.observe(view, duration_ms, queries, response.status_code)
+        if duration_ms >= settings.METRICS_SLOW_REQUEST_MS:
+            logger.warning(
+                'Slow request %s %s (%s): %.0f ms, %s queries',
+                request.method, request.path, view, duration_ms, queries,
+            )
+
+
+def metrics_view(request: HttpRequest) -> JsonResponse:
+    if not request.user.is_staff:
+        raise Http404
+    return JsonResponse(get_metrics().snapshot())
@@ -13,17 +13,14 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 from os import getenv
 import logging.config
+import sys
 
+from django.core.exceptions import ImproperlyConfigured
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
-import sentry_sdk
 
-# SENTRY
-
-sentry_sdk.init(
-    dsn="https://0d7f5ec4f6b35e7258972bd05eb8d505@o4505776875896832.ingest.sentry.io/4505776881664000",
-    traces_sample_rate=1.0,
-)
+from .log import parse_sample_rates
+from .tracing import init_sentry
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -41,6 +38,10 @@ SECRET_KEY = getenv(
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = getenv('DJANGO_DEBUG', '0') == '1'
 
+TESTING = sys.argv[1:2] == ['test']
+# management commands other than runserver, tests included
+RUNNING_COMMAND = Path(sys.argv[0]).name == 'manage.py' and sys.argv[1:2] != ['runserver']
+
 ALLOWED_HOSTS = [
     '0.0.0.0',
     '127.0.0.1',
@@ -72,7 +73,6 @@ INSTALLED_APPS = [
     'rest_framework',
     'django_filters',
     'drf_spectacular',
-    'debug_toolbar',
 
     'myauth.apps.MyauthConfig',
     'shopapp.apps.ShopappConfig',
@@ -80,6 +80,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mysite.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,9 +90,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.contrib.admindocs.middleware.XViewMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# The toolbar middleware is sync-only: under ASGI it would switch every request,
+# the async API included, to a thread, so it is only enabled for debugging.
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
@@ -116,25 +122,115 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite is the default, tuned for several gunicorn workers (see mysite/sqlite3/base.py).
+# PostgreSQL needs the psycopg package; connections are kept open by every worker
+# for CONN_MAX_AGE seconds and checked before reuse. With pgbouncer in transaction
+# pooling mode set DJANGO_DATABASE_PGBOUNCER=1, it can't keep server-side cursors.
+
 DATABASE_DIR = BASE_DIR / 'database'
 DATABASE_DIR.mkdir(exist_ok=True)
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': DATABASE_DIR / 'db.sqlite3',
+DATABASE_ENGINE = getenv('DJANGO_DATABASE_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': getenv('DJANGO_DATABASE_NAME', 'mysite'),
+            'USER': getenv('DJANGO_DATABASE_USER', 'mysite'),
+            'PASSWORD': getenv('DJANGO_DATABASE_PASSWORD', ''),
+            'HOST': getenv('DJANGO_DATABASE_HOST', '127.0.0.1'),
+            'PORT': getenv('DJANGO_DATABASE_PORT', '5432'),
+            'CONN_MAX_AGE': int(getenv('DJANGO_DATABASE_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': getenv('DJANGO_DATABASE_PGBOUNCER', '0') == '1',
+        }
     }
-}
+elif DATABASE_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'mysite.sqlite3',
+            'NAME': DATABASE_DIR / 'db.sqlite3',
+            # seconds to wait for the write lock before "database is locked"
+            'OPTIONS': {'timeout': int(getenv('DJANGO_SQLITE_TIMEOUT', '20'))},
+            'PRAGMAS': {
+                'journal_mode': getenv('DJANGO_SQLITE_JOURNAL_MODE', 'WAL'),
+                'synchronous': 'NORMAL',
+                'cache_size': -20000,
+                'temp_store': 'MEMORY',
+                'mmap_size': 128 * 1024 * 1024,
+            },
+            'TRANSACTION_MODE': 'IMMEDIATE',
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'Unknown DJANGO_DATABASE_ENGINE {DATABASE_ENGINE!r}, expected sqlite or postgres')
 
 # Caching
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The cache must be shared by all gunicorn workers, so locmem is only used for tests.
+# The "db" backend needs `python manage.py createcachetable`,
+# the "redis" backend needs the redis package and a running server.
+# Only redis (and locmem within one process) increments counters atomically;
+# "file" and "db" implement incr() as get-then-set, which loses concurrent updates
+# across workers, so with them counters are deleted and recounted instead.
+
+CACHE_BACKENDS = {
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', '/var/tmp/django_cache'),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'django_cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'mysite'),
+}
+CACHE_BACKEND, CACHE_LOCATION = CACHE_BACKENDS[
+    getenv('DJANGO_CACHE_BACKEND') or ('locmem' if TESTING else 'file')
+]
+
+CACHE_ATOMIC_INCR_BACKENDS = {
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+}
 
-CACHING = {
+CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
-        'LOCATION': '/var/tmp/django_cache',
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': getenv('DJANGO_CACHE_LOCATION') or CACHE_LOCATION,
+        'KEY_PREFIX': getenv('DJANGO_CACHE_KEY_PREFIX', 'mysite'),
+        'VERSION': int(getenv('DJANGO_CACHE_VERSION', '1')),
     },
 }
 
+# Sessions
+# https://docs.djangoproject.com/en/4.2/topics/http/sessions/
+# "cached_db" reads sessions from the shared cache and writes them through to the database,
+# "cache" keeps them only in the cache (lost on eviction or restart),
+# "signed_cookies" stores them in the client cookie and needs no storage at all.
+# The myauth stores skip saving sessions whose data did not change.
+
+SESSION_ENGINES = {
+    'db': 'myauth.sessions.db',
+    'cached_db': 'myauth.sessions.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[getenv('DJANGO_SESSION_ENGINE', 'cached_db')]
+SESSION_CACHE_ALIAS = 'default'
+
+SHOP_CACHE_ALIAS = 'default'
+SHOP_CACHE_ATOMIC_INCR = CACHES[SHOP_CACHE_ALIAS]['BACKEND'] in CACHE_ATOMIC_INCR_BACKENDS
+# Per-user order caches are evicted by shopapp.signals, so they can live long
+SHOP_CACHE_TIMEOUTS = {
+    'orders_export': 6 * 60 * 60,
+    'orders_list_fragment': 6 * 60 * 60,
+    # maintained incrementally with an atomic incr, otherwise recounted after changes
+    # (the file cache has no atomic incr, see shopapp.cache.adjust_available_products_count)
+    'available_products_count': 24 * 60 * 60,
+    # products/orders change stamps behind sitemap caching and list ETags
+    'change_stamps': 24 * 60 * 60,
+    'sitemap': 24 * 60 * 60,
+    # keyed by the products revision, so only bounds the stale entries
+    'products_feed': 24 * 60 * 60,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -186,6 +282,25 @@ STATIC_URL = 'static/'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'uploads/'
 
+# Product image renditions (see shopapp/thumbnails.py): name -> (max width, max height)
+SHOP_THUMBNAIL_PRESETS = {
+    'small': (160, 160),
+    'medium': (480, 480),
+    'large': (1200, 1200),
+}
+SHOP_THUMBNAIL_QUALITY = 85
+SHOP_THUMBNAIL_DIR = 'renditions'
+# generate renditions in a background thread after upload, otherwise only by `generate_thumbnails`
+SHOP_THUMBNAIL_WORKER = getenv('SHOP_THUMBNAIL_WORKER', '1') == '1' and not TESTING
+
+# How MEDIA_URL is served, see mysite/media.py: static, file, x-accel, x-sendfile or none
+MEDIA_DELIVERY = getenv('DJANGO_MEDIA_DELIVERY', 'static' if DEBUG else 'file')
+# nginx internal location aliased to MEDIA_ROOT for the x-accel mode
+MEDIA_ACCEL_PREFIX = getenv('DJANGO_MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_MAX_AGE = 60 * 60
+# content-hashed files are cached by clients forever
+MEDIA_IMMUTABLE_PATTERN = rf'^{SHOP_THUMBNAIL_DIR}/.+\.[0-9a-f]{{12}}\.\w+$'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -198,6 +313,13 @@ LOGIN_URL = reverse_lazy('myauth:about_me')
 # Logging
 
 LOGLEVEL = getenv('DJANGO_LOGLEVEL', 'info').upper()
+# "verbose" or "json", one record per line
+LOG_FORMAT = getenv('DJANGO_LOG_FORMAT', 'verbose')
+# "background" writes from a separate thread, "console" writes in the request thread
+LOG_HANDLER = getenv('DJANGO_LOG_HANDLER', 'background')
+# share of INFO and lower records kept per logger, e.g. "shopapp.views=0.01,blogapp=0.1"
+LOG_SAMPLE_RATES = parse_sample_rates(getenv('DJANGO_LOG_SAMPLE_RATES', ''))
+
 logging.config.dictConfig({
     'version': 1,
     'disable_existing_loggers': False,
@@ -205,24 +327,61 @@ logging.config.dictConfig({
         'verbose': {
             'format': '%(asctime)s [%(levelname)s] %(name)s:%(lineno)s %(module)s \"%(message)s\"',
         },
+        'json': {
+            '()': 'mysite.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'mysite.log.SamplingFilter',
+            'rates': LOG_SAMPLE_RATES,
+        },
     },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'formatter': LOG_FORMAT,
+            'filters': ['sampling'],
+        },
+        'background': {
+            '()': 'mysite.log.BackgroundHandler',
+            'formatter': LOG_FORMAT,
+            'filters': ['sampling'],
         },
     },
     'loggers': {
         '': {
             'level': LOGLEVEL,
             'handlers': [
-                'console',
+                LOG_HANDLER,
             ],
         },
     },
 })
 
 
+# Sentry
+# Errors are always reported, requests are traced by view with SENTRY_TRACES_SAMPLE_RATES,
+# e.g. "ProductListView=0.01,OrderViewSet=0.5", and SENTRY_TRACES_SAMPLE_RATE for the rest.
+
+SENTRY_ENABLED = getenv('SENTRY_ENABLED', '1') == '1' and not RUNNING_COMMAND
+SENTRY_DSN = getenv(
+    'SENTRY_DSN',
+    'https://0d7f5ec4f6b35e7258972bd05eb8d505@o4505776875896832.ingest.sentry.io/4505776881664000',
+)
+SENTRY_ENVIRONMENT = getenv('SENTRY_ENVIRONMENT', 'development' if DEBUG else 'production')
+SENTRY_TRACES_SAMPLE_RATE = float(getenv('SENTRY_TRACES_SAMPLE_RATE', '0.1'))
+SENTRY_TRACES_SAMPLE_RATES = parse_sample_rates(getenv('SENTRY_TRACES_SAMPLE_RATES', 'ProductListView=0.01'))
+
+if SENTRY_ENABLED and SENTRY_DSN:
+    init_sentry(SENTRY_DSN, SENTRY_ENVIRONMENT)
+
+# Request metrics, see mysite/metrics.py
+
+METRICS_BACKEND = 'mysite.metrics.InMemoryMetrics'
+METRICS_SLOW_REQUEST_MS = int(getenv('DJANGO_METRICS_SLOW_REQUEST_MS', '500'))
+
+
 # REST Framework
 
 REST_FRAMEWORK = {
@@ -234,6 +393,9 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+# Upper bound for ?page_size= in the shop API, raised for bulk sync jobs
+SHOP_API_MAX_PAGE_SIZE = int(getenv('SHOP_API_MAX_PAGE_SIZE', '1000'))
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'My Site Project API',
     'DESCRIPTION': 'My site project with shopp app and custom auth and profiles',
@@ -1,6 +1,88 @@
+"""
+Карта сайта проекта: индекс ``sitemap.xml`` со ссылками на страницы разделов.
+
+Отрисованные страницы кешируются с ключом по отметке последнего изменения
+раздела, которую обновляют сигналы shopapp, поэтому изменение товара или заказа
+сразу делает старые страницы недоступными. Та же отметка отдаётся в ETag
+и Last-Modified, и повторный запрос поисковика получает ответ 304 без обращения
+к базе данных
+"""
+
+from datetime import datetime
+from hashlib import md5
+from typing import List, Optional
+
+from django.contrib.sitemaps import views as sitemap_views
+from django.http import Http404, HttpRequest, HttpResponse
+from django.utils.translation import get_language
+from django.views.decorators.http import condition
+
+from shopapp.cache import get_cache, get_changed, get_timeout, make_key
 from shopapp.sitemap import ShopProductSitemap, ShopOrderSitemap
 
 sitemaps = {
     'shopapp_product': ShopProductSitemap,
     'shopapp_order': ShopOrderSitemap,
 }
+SECTION_URL_NAME = 'sitemap-section'
+
+
+def get_sections(section: Optional[str] = None) -> List[str]:
+    if section is None:
+        return list(sitemaps)
+    if section not in sitemaps:
+        raise Http404(f'No sitemap available for section: {section!r}')
+    return [section]
+
+
+def sitemap_changed(request: HttpRequest, section: Optional[str] = None) -> datetime:
+    return max(get_changed(sitemaps[name].stamp) for name in get_sections(section))
+
+
+def sitemap_cache_key(request: HttpRequest, section: Optional[str] = None) -> str:
+    """ Страница зависит от раздела, номера страницы, домена, языка ссылок и отметки изменения """
+    return make_key(
+        'sitemap',
+        section or 'index',
+        request.GET.get('p', '1'),
+        request.get_host(),
+        get_language(),
+        sitemap_changed(request, section).timestamp(),
+    )
+
+
+def sitemap_etag(request: HttpRequest, section: Optional[str] = None) -> str:
+    return md5(sitemap_cache_key(request, section).encode()).hexdigest()
+
+
+def cached_sitemap_response(request: HttpRequest, render, section: Optional[str] = None) -> HttpResponse:
+    cache = get_cache()
+    key = sitemap_cache_key(request, section)
+    content = cache.get(key)
+    if content is None:
+        response = render()
+        response.render()
+        if response.status_code != 200:
+            return response
+        content = response.content
+        cache.set(key, content, get_timeout('sitemap'))
+    response = HttpResponse(content, content_type='application/xml')
+    response.headers['X-Robots-Tag'] = 'noindex, noodp, noarchive'
+    return response
+
+
+@condition(etag_func=sitemap_etag, last_modified_func=sitemap_changed)
+def sitemap_index(request: HttpRequest) -> HttpResponse:
+    return cached_sitemap_response(
+        request,
+        lambda: sitemap_views.index(request, sitemaps, sitemap_url_name=SECTION_URL_NAME),
+    )
+
+
+@condition(etag_func=sitemap_etag, last_modified_func=sitemap_changed)
+def sitemap_section(request: HttpRequest, section: str) -> HttpResponse:
+    return cached_sitemap_response(
+        request,
+        lambda: sitemap_views.sitemap(request, sitemaps, section=section),
+        section,
+    )
@@ -0,0 +1,28 @@
+"""
+SQLite с настройками для нескольких воркеров gunicorn.
+
+``PRAGMAS`` из настроек базы выполняются на каждом новом соединении
+(WAL: читатели не блокируют писателя, ``synchronous=NORMAL``, размер кеша
+страниц и т.п.), время ожидания блокировки задаётся ``OPTIONS['timeout']``.
+``TRANSACTION_MODE`` меняет ``BEGIN`` в ``atomic()``: с ``IMMEDIATE`` блокировка
+записи берётся в начале транзакции и ожидает освобождения, а не завершается
+ошибкой "database is locked" при попытке чтения перейти к записи
+"""
+
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = 'DEFERRED', 'IMMEDIATE', 'EXCLUSIVE'
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get('PRAGMAS', {}).items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict.get('TRANSACTION_MODE') or 'DEFERRED'
+        if mode not in TRANSACTION_MODES:
+            raise ValueError(f'Unknown SQLite TRANSACTION_MODE {mode!r}, expected one of {TRANSACTION_MODES}')
+        self.cursor().execute(f'BEGIN {mode}')
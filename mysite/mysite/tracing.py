@@ -0,0 +1,54 @@
+"""
+Трассировка запросов в Sentry.
+
+SDK подключается из настроек только если задан ``SENTRY_DSN`` и включён
+``SENTRY_ENABLED``, и не подключается в тестах и management-командах, кроме
+runserver. Долю трассируемых запросов определяет ``traces_sampler``: по имени
+класса или функции представления из ``SENTRY_TRACES_SAMPLE_RATES``, для
+остальных - ``SENTRY_TRACES_SAMPLE_RATE``. Решение вызывающего сервиса
+(``sentry-trace``) соблюдается. Ошибки отправляются всегда, независимо от
+трассировки
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from django.utils import translation
+
+
+@lru_cache(maxsize=2048)
+def view_name_for_path(path: str) -> Optional[str]:
+    """ ``/en/shop/products/`` -> ``ProductListView`` """
+    language = translation.get_language_from_path(path) or settings.LANGUAGE_CODE
+    try:
+        with translation.override(language):
+            match = resolve(path)
+    except Resolver404:
+        return None
+    # Django views keep the class in view_class, DRF viewsets in cls
+    view = getattr(match.func, 'view_class', None) or getattr(match.func, 'cls', None) or match.func
+    return view.__name__
+
+
+def traces_sampler(sampling_context: Dict[str, Any]) -> float:
+    parent_sampled = sampling_context.get('parent_sampled')
+    if parent_sampled is not None:
+        return float(parent_sampled)
+    environ = sampling_context.get('wsgi_environ') or {}
+    scope = sampling_context.get('asgi_scope') or {}
+    path = environ.get('PATH_INFO') or scope.get('path')
+    if path is None:
+        return settings.SENTRY_TRACES_SAMPLE_RATE
+    return settings.SENTRY_TRACES_SAMPLE_RATES.get(view_name_for_path(path), settings.SENTRY_TRACES_SAMPLE_RATE)
+
+
+def init_sentry(dsn: str, environment: str) -> None:
+    import sentry_sdk
+
+    sentry_sdk.init(
+        dsn=dsn,
+        environment=environment,
+        traces_sampler=traces_sampler,
+    )
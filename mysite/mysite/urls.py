@@ -17,12 +17,13 @@ Including another URLconf
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.contrib.sitemaps.views import sitemap
 from django.urls import path, include
 from django.conf.urls.i18n import i18n_patterns
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
-from .sitemaps import sitemaps
+from .media import media_urlpatterns
+from .metrics import metrics_view
+from .sitemaps import SECTION_URL_NAME, sitemap_index, sitemap_section
 
 urlpatterns = [
     path('accounts/', include('myauth.urls')),
@@ -30,7 +31,9 @@ urlpatterns = [
     path('api/', SpectacularAPIView.as_view(), name='api'),
     path('api/swagger/', SpectacularSwaggerView.as_view(url_name='api'), name='swagger'),
     path('blog/', include('blogapp.urls')),
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='sitemap'),
+    path('metrics/', metrics_view, name='metrics'),
+    path('sitemap.xml', sitemap_index, name='sitemap'),
+    path('sitemap-<section>.xml', sitemap_section, name=SECTION_URL_NAME),
 ]
 
 urlpatterns += i18n_patterns(
@@ -38,10 +41,9 @@ urlpatterns += i18n_patterns(
     path('shop/', include('shopapp.urls')),
 )
 
+urlpatterns.extend(media_urlpatterns())
+
 if settings.DEBUG:
-    urlpatterns.extend(
-        static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT),
-    )
     urlpatterns.extend(
         static(settings.STATIC_URL, document_root=settings.STATIC_ROOT),
     )
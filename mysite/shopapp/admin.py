@@ -1,34 +1,77 @@
 from io import TextIOWrapper
-from csv import DictReader
 
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
 from django.db.models import QuerySet
+from django.forms import BaseInlineFormSet
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render, redirect
 from django.urls import path
 
+from . import search
+from .bulk import archive_products
 from .forms import CSVImportForm
 from .models import Product, Order, ProductImage
+from .order_import import OrderImportError, import_orders
+from .order_products import order_products_bulk_changed
 
 
 @admin.action(description='Archive products')
 def mark_archived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
-    queryset.update(archived=True)
+    archive_products(queryset)
 
 
 @admin.action(description='Unarchive products')
 def mark_unarchived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
-    queryset.update(archived=False)
+    archive_products(queryset, archived=False)
+
+
+class OrderProductsFormSet(BaseInlineFormSet):
+    """
+    Формсет связей заказ-товар.
+
+    Django не отправляет сигналы сохранения и удаления для автоматической
+    промежуточной модели, поэтому изменённые связи передаются обработчику
+    ``order_products_bulk_changed``, как при массовом изменении заказов
+    """
+
+    def save(self, commit=True):
+        links = super().save(commit)
+        removed, added = set(), {(link.order_id, link.product_id) for link in self.new_objects}
+        for form in self.initial_forms:
+            if self._should_delete_form(form) or form.has_changed():
+                removed.add((form.initial['order'], form.initial['product']))
+            if not self._should_delete_form(form) and form.has_changed():
+                added.add((form.instance.order_id, form.instance.product_id))
+        for action, changed in (('remove', removed), ('add', added)):
+            if commit and changed:
+                order_products_bulk_changed.send(
+                    sender=Order,
+                    action=action,
+                    order_ids={order_id for order_id, _ in changed},
+                    product_ids={product_id for _, product_id in changed},
+                )
+        return links
 
 
 class OrderInline(admin.StackedInline):
     model = Product.orders.through
+    formset = OrderProductsFormSet
 
 
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
 
 
+class ProductChangeList(ChangeList):
+    """ Список товаров, в котором результаты поиска идут по релевантности, пока не выбрана сортировка по колонке """
+
+    def get_ordering(self, request: HttpRequest, queryset: QuerySet):
+        if ORDER_VAR not in self.params and 'search_rank' in queryset.query.annotations:
+            return ['search_rank', 'pk']
+        return super().get_ordering(request, queryset)
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     actions = [
@@ -42,7 +85,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = 'pk', 'name', 'description_short', 'price', 'discount', 'archived'
     list_display_links = 'pk', 'name'
     ordering = 'price', 'pk'
-    search_fields = 'name', 'description', 'discount'
+    search_fields = 'name', 'description'
     fieldsets = [
         (None, {
             'fields': ('name', 'description'),
@@ -58,14 +101,50 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     ]
 
+    def get_changelist(self, request: HttpRequest, **kwargs):
+        return ProductChangeList
+
+    def get_search_results(self, request: HttpRequest, queryset: QuerySet, search_term: str):
+        if not search.is_available(queryset.db):
+            return super().get_search_results(request, queryset, search_term)
+        return search.search_queryset(queryset, search_term), False
+
     def description_short(self, obj: Product) -> str:
         if len(obj.description) > 50:
             return obj.description[:50] + '...'
         return obj.description
 
 
+class TotalRangeFilter(admin.SimpleListFilter):
+    title = 'total'
+    parameter_name = 'total_range'
+    ranges = {
+        'under-100': (None, 100),
+        '100-1000': (100, 1000),
+        'over-1000': (1000, None),
+    }
+
+    def lookups(self, request: HttpRequest, model_admin: admin.ModelAdmin):
+        return [
+            ('under-100', 'Under 100'),
+            ('100-1000', '100 to 1000'),
+            ('over-1000', '1000 and over'),
+        ]
+
+    def queryset(self, request: HttpRequest, queryset: QuerySet):
+        if self.value() not in self.ranges:
+            return queryset
+        low, high = self.ranges[self.value()]
+        if low is not None:
+            queryset = queryset.filter(total__gte=low)
+        if high is not None:
+            queryset = queryset.filter(total__lt=high)
+        return queryset
+
+
 class ProductInline(admin.StackedInline):
     model = Order.products.through
+    formset = OrderProductsFormSet
 
 
 @admin.register(Order)
@@ -74,7 +153,11 @@ class OrderAdmin(admin.ModelAdmin):
     inlines = [
         ProductInline,
     ]
-    list_display = 'pk', 'delivery_address', 'promocode', 'datetime_formatted', 'user_verbose'
+    list_display = (
+        'pk', 'delivery_address', 'promocode', 'datetime_formatted', 'user_verbose',
+        'products_count', 'subtotal', 'total',
+    )
+    list_filter = TotalRangeFilter, 'products_count'
     list_display_links = 'pk', 'user_verbose'
     ordering = '-creation_time', 'pk'
     search_fields = 'delivery_address', 'pk'
@@ -117,26 +200,16 @@ class OrderAdmin(admin.ModelAdmin):
             encoding=request.encoding,
         )
 
-        csv_reader = DictReader(csv_file)
-
-        orders_data, product_ids = [], []
-        fields_to_unpack = ('delivery_address', 'promocode', 'user_id')
-        for row in csv_reader:
-            orders_data.append(
-                {field: row[field] for field in fields_to_unpack}
-            )
-            products = row['products']
-            product_ids.append(list(map(int, products.split(','))))
-
-        orders = [Order(**order_row) for order_row in orders_data]
-        Order.objects.bulk_create(orders)
-
-        for order_num in range(len(orders)):
-            order_delivery_address = orders[order_num].delivery_address
-            order_products = product_ids[order_num]
-            Order.objects.filter(delivery_address=order_delivery_address).first().products.set(order_products)
+        try:
+            stats = import_orders(csv_file, atomic=True)
+        except OrderImportError as exc:
+            form.add_error('csv_file', str(exc))
+            context = {
+                'form': form,
+            }
+            return render(request, 'admin/csv_form.html', context=context, status=400)
 
-        self.message_user(request, 'Orders data from CSV file imported successfully')
+        self.message_user(request, f'Orders data from CSV file imported successfully: {stats.orders} orders')
         return redirect('..')
 
     def get_urls(self):
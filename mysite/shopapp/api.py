@@ -4,39 +4,170 @@
 Содержит ViewSet для моделей Product и Order
 """
 
+from typing import List, Optional
+
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS, IsAdminUser
+from rest_framework.request import Request
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import extend_schema, OpenApiResponse
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
 
+from .bulk import archive_products_by_pk, create_orders, create_products, update_orders, update_products
+from .conditional import get_validators, lists_changed, not_modified, order_changed, product_changed, set_validators
 from .models import Product, Order
-from .serializers import ProductSerializer, OrderSerializer
+from .order_products import OrderProductsError, change_order_products
+from .pagination import ShopPagination
+from .search import ProductSearchFilter
+from .serializers import (
+    ProductSerializer,
+    OrderSerializer,
+    ProductValuesSerializer,
+    OrderValuesSerializer,
+    OrderProductsBulkSerializer,
+    ProductBulkSerializer,
+    ProductBulkUpdateSerializer,
+    OrderBulkSerializer,
+    OrderBulkUpdateSerializer,
+    BulkArchiveSerializer,
+    BulkResultSerializer,
+)
+
+FIELD_SELECTION_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        str,
+        description='Comma separated fields to return, nested fields use a dot: `pk,products.price`',
+    ),
+    OpenApiParameter(
+        'expand',
+        str,
+        description='Comma separated relations to return as objects instead of ids',
+    ),
+]
+
+
+BULK_RESPONSES = {
+    200: BulkResultSerializer,
+    400: OpenApiResponse(description='The payload is not a list'),
+}
+
+
+def parse_list_param(request: Request, name: str) -> Optional[List[str]]:
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class FieldSelectionMixin:
+    """
+    Выбор полей ``?fields=`` и раскрытие связей ``?expand=`` при чтении.
+
+    Queryset сужается методом ``setup_queryset`` сериализатора, а список
+    без раскрытых связей отдаётся через ``values_serializer_class``
+    без создания экземпляров моделей
+    """
+    values_serializer_class = None
+
+    def get_field_selection(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None, None
+        return parse_list_param(request, 'fields'), parse_list_param(request, 'expand')
+
+    def get_queryset(self):
+        fields, expand = self.get_field_selection()
+        return self.get_serializer_class().setup_queryset(super().get_queryset(), fields, expand)
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_field_selection()
+        kwargs.setdefault('fields', fields)
+        kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        fields, expand = self.get_field_selection()
+        if expand:
+            return super().list(request, *args, **kwargs)
+
+        reader = self.values_serializer_class(fields=fields)
+        queryset = reader.values(
+            self.filter_queryset(self.get_queryset()),
+            extra_sources=self.ordering_fields,
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(reader.to_representation(page))
+        return Response(reader.to_representation(list(queryset)))
+
+
+def bulk_items(request: Request) -> list:
+    if not isinstance(request.data, list):
+        raise ValidationError({'detail': 'Expected a list of items'})
+    return request.data
+
+
+class ConditionalGetMixin:
+    """
+    ETag и Last-Modified для чтения списка и записи.
+
+    Отметка списка - самое позднее из изменений ``changed_lists``, записи -
+    результат ``object_changed(pk)``. При актуальной копии у клиента
+    ответ 304 отдаётся до выборки и сериализации
+    """
+    changed_lists = ()
+    object_changed = None
+
+    def list(self, request, *args, **kwargs):
+        validators = get_validators(request, lists_changed(*self.changed_lists), request.accepted_media_type)
+        response = not_modified(request, validators)
+        if response is None:
+            response = set_validators(super().list(request, *args, **kwargs), validators)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        validators = get_validators(request, self.object_changed(pk), request.accepted_media_type)
+        response = not_modified(request, validators)
+        if response is None:
+            response = set_validators(super().retrieve(request, *args, **kwargs), validators)
+        return response
 
 
 @extend_schema(description='Product CRUD viewset')
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, FieldSelectionMixin, ModelViewSet):
     """
     Набор представлений для действий над сущностями модели Product.
 
     Предоставляет полный набор CRUD для товаров
     """
 
-    queryset = (
-        Product.objects.all()
-        .select_related('created_by')
-        .prefetch_related('images')
-    )
+    queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    values_serializer_class = ProductValuesSerializer
+    pagination_class = ShopPagination
     filter_backends = [
-        SearchFilter,
+        ProductSearchFilter,
         OrderingFilter,
     ]
     search_fields = ['name', 'description']
-    ordering_fields = ['name', 'price', 'discount', 'creation_time']
+    ordering_fields = ['name', 'price', 'discount', 'creation_time', 'updated_at']
+    changed_lists = 'products',
+    object_changed = staticmethod(product_changed)
 
     @extend_schema(
         summary='Product list',
-        description='Returns full list of all the existing products',
+        description=(
+            'Returns full list of all the existing products. '
+            'Pass `search` to find products by words or word prefixes in name and description, '
+            'best matches first. '
+            'Pass `pagination=cursor` to page through it with a cursor instead of page numbers'
+        ),
+        parameters=FIELD_SELECTION_PARAMETERS,
     )
     def list(self, *args, **kwargs):
         return super().list(*args, **kwargs)
@@ -44,6 +175,7 @@ class ProductViewSet(ModelViewSet):
     @extend_schema(
         summary='Get product by ID',
         description='Retrieves **product** by its ID, returns **404** if product not found',
+        parameters=FIELD_SELECTION_PARAMETERS,
         responses={
             200: ProductSerializer,
             404: OpenApiResponse(description='Product with this ID is not found'),
@@ -80,31 +212,84 @@ class ProductViewSet(ModelViewSet):
     def destroy(self, *args, **kwargs):
         return super().destroy(*args, **kwargs)
 
+    @extend_schema(
+        methods=['POST'],
+        summary='Create many products',
+        description=(
+            'Creates products from a list, saved in chunks with one insert each. '
+            'Invalid items are skipped and reported with their index. Staff only'
+        ),
+        request=ProductBulkSerializer(many=True),
+        responses=BULK_RESPONSES,
+    )
+    @extend_schema(
+        methods=['PATCH'],
+        summary='Partially update many products',
+        description=(
+            'Partially updates products by `pk`, saved in chunks with one update each. '
+            'Invalid items and unknown ids are skipped and reported with their index. Staff only'
+        ),
+        request=ProductBulkUpdateSerializer(many=True),
+        responses=BULK_RESPONSES,
+    )
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk', permission_classes=[IsAdminUser])
+    def bulk(self, request):
+        if request.method == 'POST':
+            return Response(create_products(bulk_items(request)).as_dict())
+        return Response(update_products(bulk_items(request)).as_dict())
+
+    @extend_schema(
+        summary='Archive many products',
+        description=(
+            'Archives products by `pk` like the admin action, or returns them to sale with `archived: false`. '
+            'Unknown ids are reported with their index. Staff only'
+        ),
+        request=BulkArchiveSerializer,
+        responses=BULK_RESPONSES,
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-archive', permission_classes=[IsAdminUser])
+    def bulk_archive(self, request):
+        serializer = BulkArchiveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = archive_products_by_pk(serializer.validated_data['pks'], serializer.validated_data['archived'])
+        return Response(result.as_dict())
+
 
 @extend_schema(description='Order CRUD viewset')
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(ConditionalGetMixin, FieldSelectionMixin, ModelViewSet):
     """
     Набор представлений для действий над сущностями модели Order.
 
     Предоставляет полный набор CRUD для заказов
     """
 
-    queryset = (
-        Order.objects.all()
-        .select_related('user')
-        .prefetch_related('products')
-    )
+    queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    values_serializer_class = OrderValuesSerializer
+    pagination_class = ShopPagination
     filter_backends = [
         DjangoFilterBackend,
         OrderingFilter,
     ]
-    filterset_fields = ['delivery_address', 'promocode']
-    ordering_fields = ['delivery_address', 'creation_time']
+    filterset_fields = {
+        'delivery_address': ['exact'],
+        'promocode': ['exact'],
+        'total': ['gte', 'lte'],
+        'products_count': ['exact', 'gte', 'lte'],
+    }
+    ordering_fields = ['delivery_address', 'creation_time', 'updated_at', 'total', 'products_count']
+    # orders are listed with their products
+    changed_lists = 'orders', 'products'
+    object_changed = staticmethod(order_changed)
 
     @extend_schema(
         summary='Order list',
-        description='Returns full list of all the existing orders',
+        description=(
+            'Returns full list of all the existing orders. '
+            'Filter and sort by the stored `total` and `products_count` without loading products. '
+            'Pass `pagination=cursor` to page through it with a cursor instead of page numbers'
+        ),
+        parameters=FIELD_SELECTION_PARAMETERS,
     )
     def list(self, *args, **kwargs):
         return super().list(*args, **kwargs)
@@ -112,6 +297,7 @@ class OrderViewSet(ModelViewSet):
     @extend_schema(
         summary='Get order by ID',
         description='Retrieves **order** by its ID, returns **404** if order not found',
+        parameters=FIELD_SELECTION_PARAMETERS,
         responses={
             200: OrderSerializer,
             404: OpenApiResponse(description='Order with this ID is not found'),
@@ -147,3 +333,55 @@ class OrderViewSet(ModelViewSet):
     )
     def destroy(self, *args, **kwargs):
         return super().destroy(*args, **kwargs)
+
+    @extend_schema(
+        summary='Add or remove products in many orders',
+        description=(
+            'Adds `products` to every order in `orders` or removes them, '
+            'with one insert or delete per batch of orders. Staff only'
+        ),
+        request=OrderProductsBulkSerializer,
+        responses={
+            200: OpenApiResponse(description='Numbers of changed orders, changed links and batches'),
+            400: OpenApiResponse(description='Invalid parameters or unknown order or product ids'),
+        },
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-products', permission_classes=[IsAdminUser])
+    def bulk_products(self, request):
+        serializer = OrderProductsBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            stats = change_order_products(
+                serializer.validated_data['action'],
+                serializer.validated_data['products'],
+                serializer.validated_data.get('orders'),
+            )
+        except OrderProductsError as exc:
+            raise ValidationError({'detail': str(exc)}) from exc
+        return Response(stats._asdict())
+
+    @extend_schema(
+        methods=['POST'],
+        summary='Create many orders',
+        description=(
+            'Creates orders with their products from a list, saved in chunks with one insert each. '
+            'Invalid items are skipped and reported with their index. Staff only'
+        ),
+        request=OrderBulkSerializer(many=True),
+        responses=BULK_RESPONSES,
+    )
+    @extend_schema(
+        methods=['PATCH'],
+        summary='Partially update many orders',
+        description=(
+            'Partially updates orders by `pk`, saved in chunks with one update each. '
+            'Invalid items and unknown ids are skipped and reported with their index. Staff only'
+        ),
+        request=OrderBulkUpdateSerializer(many=True),
+        responses=BULK_RESPONSES,
+    )
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk', permission_classes=[IsAdminUser])
+    def bulk(self, request):
+        if request.method == 'POST':
+            return Response(create_orders(bulk_items(request)).as_dict())
+        return Response(update_orders(bulk_items(request)).as_dict())
@@ -0,0 +1,122 @@
+"""
+Модуль с асинхронными представлениями API приложения shopapp только для чтения.
+
+Списки и карточки товаров и заказов читаются асинхронным ORM Django
+и сериализуются через ``values()`` без создания экземпляров моделей,
+поэтому при запуске под ASGI-сервером (см. ``mysite/asgi.py``) ожидание
+базы данных не занимает поток воркера. Списки разбиваются на страницы
+keyset-курсором, как ``?pagination=cursor`` в синхронном API
+"""
+
+from typing import List, Optional
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.http import HttpRequest, JsonResponse
+from django.views import View
+from rest_framework.exceptions import ValidationError
+
+from .models import Order, Product
+from .pagination import InvalidCursor, KeysetPaginator
+from .serializers import OrderValuesSerializer, ProductValuesSerializer, ValuesSerializer
+
+
+def parse_list_param(request: HttpRequest, name: str) -> Optional[List[str]]:
+    value = request.GET.get(name)
+    if not value:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class AsyncReadView(View):
+    """ Асинхронное чтение записей модели с выбором полей ``?fields=`` """
+    http_method_names = ['get', 'head', 'options']
+    queryset: QuerySet = None
+    values_serializer_class = ValuesSerializer
+
+    def get_reader(self) -> ValuesSerializer:
+        return self.values_serializer_class(fields=parse_list_param(self.request, 'fields'))
+
+    def get_queryset(self) -> QuerySet:
+        return self.queryset.all()
+
+    @staticmethod
+    def error_response(detail, status: int) -> JsonResponse:
+        return JsonResponse(detail if isinstance(detail, dict) else {'detail': detail}, status=status)
+
+
+class AsyncListView(AsyncReadView):
+    """
+    Страница списка по курсору ``?cursor=`` без подсчёта общего числа записей.
+
+    Размер страницы задаётся ``?page_size=`` в пределах SHOP_API_MAX_PAGE_SIZE
+    """
+    ordering = '-pk',
+    page_size = 10
+
+    def get_page_size(self) -> int:
+        try:
+            page_size = int(self.request.GET.get('page_size', self.page_size))
+        except ValueError:
+            page_size = self.page_size
+        return min(max(page_size, 1), settings.SHOP_API_MAX_PAGE_SIZE)
+
+    def get_page_url(self, cursor: Optional[str]) -> Optional[str]:
+        if cursor is None:
+            return None
+        query = self.request.GET.copy()
+        query['cursor'] = cursor
+        return self.request.build_absolute_uri(f'{self.request.path}?{query.urlencode()}')
+
+    async def get(self, request: HttpRequest) -> JsonResponse:
+        try:
+            reader = self.get_reader()
+        except ValidationError as exc:
+            return self.error_response(exc.detail, status=400)
+
+        queryset = reader.values(self.get_queryset(), extra_sources=[field.lstrip('-') for field in self.ordering])
+        paginator = KeysetPaginator(queryset, self.ordering, self.get_page_size())
+        try:
+            page = await paginator.aget_page(request.GET.get('cursor'))
+        except InvalidCursor:
+            return self.error_response('Invalid cursor', status=404)
+
+        return JsonResponse({
+            'next': self.get_page_url(page.next_cursor),
+            'previous': self.get_page_url(page.previous_cursor),
+            'results': await reader.ato_representation(page.object_list),
+        })
+
+
+class AsyncDetailView(AsyncReadView):
+    async def get(self, request: HttpRequest, pk: int) -> JsonResponse:
+        try:
+            reader = self.get_reader()
+        except ValidationError as exc:
+            return self.error_response(exc.detail, status=400)
+
+        rows = [row async for row in reader.values(self.get_queryset().filter(pk=pk))]
+        if not rows:
+            return self.error_response('Not found.', status=404)
+        data = await reader.ato_representation(rows)
+        return JsonResponse(data[0])
+
+
+class AsyncProductListView(AsyncListView):
+    queryset = Product.objects.all()
+    values_serializer_class = ProductValuesSerializer
+
+
+class AsyncProductDetailView(AsyncDetailView):
+    queryset = Product.objects.all()
+    values_serializer_class = ProductValuesSerializer
+
+
+class AsyncOrderListView(AsyncListView):
+    queryset = Order.objects.all()
+    values_serializer_class = OrderValuesSerializer
+
+
+class AsyncOrderDetailView(AsyncDetailView):
+    queryset = Order.objects.all()
+    values_serializer_class = OrderValuesSerializer
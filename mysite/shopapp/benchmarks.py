@@ -0,0 +1,271 @@
+"""
+Модуль с инструментами нагрузочных замеров.
+
+Содержит генератор синтетического набора данных, обход всех страниц
+приложений shopapp, myauth и blogapp и замер числа запросов, времени
+в базе данных и полного времени ответа для каждой страницы.
+Бюджеты представлений хранятся в ``view_budgets.json`` рядом с модулем
+"""
+
+import json
+import random
+from datetime import timedelta
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from blogapp.models import Article, Author, Category, Tag
+from myauth.models import Profile
+from .models import Order, Product
+from .totals import update_order_totals
+
+BUDGETS_PATH = Path(__file__).resolve().parent / 'view_budgets.json'
+BENCHMARK_APPS = 'shopapp', 'myauth', 'blogapp'
+
+
+class DatasetScale(NamedTuple):
+    users: int = 200
+    products: int = 2000
+    orders: int = 2000
+    products_per_order: int = 3
+    articles: int = 200
+
+
+class Dataset(NamedTuple):
+    """ Объекты, на которые ссылаются адреса страниц при обходе """
+    user: User
+    product: Product
+    order: Order
+    profile: Profile
+
+
+def build_dataset(scale: DatasetScale = DatasetScale(), seed: int = 0, batch_size: int = 1000) -> Dataset:
+    """
+    Создаёт пользователей с профилями, товары, заказы со связями и статьи блога.
+
+    Данные детерминированы значением ``seed``, вставка идёт через ``bulk_create``
+    """
+    rnd = random.Random(seed)
+    now = timezone.now()
+    with transaction.atomic():
+        users = User.objects.bulk_create(
+            [User(username=f'bench_user_{num}', password='!') for num in range(scale.users)],
+            batch_size=batch_size,
+        )
+        Profile.objects.bulk_create(
+            [Profile(user=user) for user in users],
+            batch_size=batch_size,
+        )
+        products = Product.objects.bulk_create(
+            [
+                Product(
+                    name=f'Bench product {num}',
+                    description=f'Synthetic product number {num} for benchmarks',
+                    price=rnd.randint(100, 100000) / 100,
+                    discount=rnd.choice((0, 0, 0, 5, 10, 25)),
+                    archived=rnd.random() < 0.1,
+                    created_by=rnd.choice(users),
+                )
+                for num in range(scale.products)
+            ],
+            batch_size=batch_size,
+        )
+        orders = Order.objects.bulk_create(
+            [
+                Order(
+                    delivery_address=f'Bench street, {num}',
+                    promocode=rnd.choice(('', '', 'BENCH10')),
+                    user=rnd.choice(users),
+                )
+                for num in range(scale.orders)
+            ],
+            batch_size=batch_size,
+        )
+        # creation_time is auto_now_add, spread it over the last year afterwards
+        for order in orders:
+            order.creation_time = now - timedelta(minutes=rnd.randint(0, 365 * 24 * 60))
+        Order.objects.bulk_update(orders, ['creation_time'], batch_size=batch_size)
+        through = Order.products.through
+        through.objects.bulk_create(
+            [
+                through(order_id=order.pk, product_id=product.pk)
+                for order in orders
+                for product in rnd.sample(products, min(scale.products_per_order, len(products)))
+            ],
+            batch_size=batch_size,
+        )
+        update_order_totals(order.pk for order in orders)
+
+        authors = Author.objects.bulk_create([Author(name=f'Bench author {num}') for num in range(10)])
+        categories = Category.objects.bulk_create([Category(name=f'Category {num}') for num in range(10)])
+        tags = Tag.objects.bulk_create([Tag(name=f'tag{num}') for num in range(20)])
+        articles = Article.objects.bulk_create(
+            [
+                Article(
+                    title=f'Bench article {num}',
+                    content='Lorem ipsum ' * 50,
+                    pub_date=now,
+                    author=rnd.choice(authors),
+                    category=rnd.choice(categories),
+                )
+                for num in range(scale.articles)
+            ],
+            batch_size=batch_size,
+        )
+        Article.tags.through.objects.bulk_create(
+            [
+                Article.tags.through(article_id=article.pk, tag_id=tag.pk)
+                for article in articles
+                for tag in rnd.sample(tags, 2)
+            ],
+            batch_size=batch_size,
+        )
+
+    user = users[0]
+    return Dataset(
+        user=user,
+        product=products[0],
+        order=orders[0],
+        profile=Profile.objects.get(user=user),
+    )
+
+
+def url_kwargs(dataset: Dataset) -> Dict[str, Dict]:
+    """ Аргументы адресов с параметрами по их полному имени """
+    product = {'pk': dataset.product.pk}
+    order = {'pk': dataset.order.pk}
+    user = {'user_id': dataset.order.user_id}
+    profile = {'pk': dataset.profile.pk}
+    return {
+        'shopapp:product-detail': product,
+        'shopapp:product_details': product,
+        'shopapp:product_update': product,
+        'shopapp:product_delete': product,
+        'shopapp:async_product_details': product,
+        'shopapp:order-detail': order,
+        'shopapp:order_details': order,
+        'shopapp:order_update': order,
+        'shopapp:order_delete': order,
+        'shopapp:async_order_details': order,
+        'shopapp:orders_by_user': user,
+        'shopapp:export_orders_by_user': user,
+        'myauth:profile_details': profile,
+        'myauth:update_profile': profile,
+    }
+
+
+def iter_url_names(patterns, namespace: str) -> Iterator[str]:
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_url_names(pattern.url_patterns, namespace)
+        elif isinstance(pattern, URLPattern) and pattern.name and 'format' not in pattern.pattern.regex.groupindex:
+            yield f'{namespace}:{pattern.name}'
+
+
+def benchmark_url_names() -> List[str]:
+    """ Имена всех страниц приложений из BENCHMARK_APPS, кроме вариантов с суффиксом формата """
+    resolver = get_resolver()
+    names = []
+    for namespace in BENCHMARK_APPS:
+        for _, (prefix, sub_resolver) in resolver.namespace_dict.items():
+            if sub_resolver.namespace == namespace:
+                names.extend(iter_url_names(sub_resolver.url_patterns, namespace))
+    return sorted(set(names))
+
+
+class QueryRecorder:
+    """ Обёртка выполнения запросов, считающая их число и суммарное время """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += perf_counter() - started
+
+
+class Measurement(NamedTuple):
+    status: int
+    queries: int
+    db_ms: float
+    wall_ms: float
+
+
+def measure_request(client: Client, url: str) -> Measurement:
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        started = perf_counter()
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        wall = perf_counter() - started
+    return Measurement(response.status_code, recorder.count, recorder.duration * 1000, wall * 1000)
+
+
+def measure_views(
+    client: Client,
+    user: User,
+    dataset: Dataset,
+    repeat: int = 3,
+    before_request: Optional[Callable[[], None]] = None,
+) -> Dict[str, Measurement]:
+    """
+    Обходит все страницы от имени ``user``.
+
+    Число запросов берётся из первого запроса (с холодным кешем, если
+    ``before_request`` очищает кеш), время - медиана по ``repeat`` запросам
+    """
+    kwargs = url_kwargs(dataset)
+    results = {}
+    for name in benchmark_url_names():
+        url = reverse(name, kwargs=kwargs.get(name))
+        runs = []
+        for _ in range(repeat):
+            if before_request is not None and not runs:
+                before_request()
+            # logout view ends the session, so log in before every request
+            client.force_login(user)
+            runs.append(measure_request(client, url))
+        results[name] = Measurement(
+            status=runs[0].status,
+            queries=runs[0].queries,
+            db_ms=round(median(run.db_ms for run in runs), 2),
+            wall_ms=round(median(run.wall_ms for run in runs), 2),
+        )
+    return results
+
+
+def load_budgets(path: Path = BUDGETS_PATH) -> Dict:
+    if not path.exists():
+        return {'scale': DatasetScale()._asdict(), 'views': {}}
+    with open(path) as budgets_file:
+        return json.load(budgets_file)
+
+
+def save_budgets(scale: DatasetScale, results: Dict[str, Measurement], path: Path = BUDGETS_PATH) -> None:
+    budgets = {
+        'scale': scale._asdict(),
+        'views': {
+            name: {
+                'queries': result.queries,
+                'db_ms': result.db_ms,
+                'wall_ms': result.wall_ms,
+            }
+            for name, result in sorted(results.items())
+        },
+    }
+    with open(path, 'w') as budgets_file:
+        json.dump(budgets, budgets_file, indent=2)
+        budgets_file.write('\n')
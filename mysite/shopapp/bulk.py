@@ -0,0 +1,229 @@
+"""
+Модуль массового создания, изменения и архивации товаров и заказов для API.
+
+Каждый элемент списка проверяется отдельно, ошибки возвращаются с его
+индексом, а корректные элементы сохраняются пачками по ``BULK_CHUNK_SIZE``
+через ``bulk_create``/``bulk_update``, каждая пачка - в своей транзакции.
+Ссылки на пользователей и товары проверяются одним запросом на пачку.
+
+Эти методы не отправляют сигналы моделей, поэтому поисковый индекс,
+кеши и итоги заказов, число товаров в продаже, ``updated_at`` и отметки
+изменения списков обновляются здесь явно, как в ``admin`` и ``order_import``
+"""
+
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple, Type
+
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import Serializer
+
+from . import search
+from .cache import adjust_available_products_count, invalidate_products_orders, invalidate_user_orders, touch_changed
+from .models import Order, Product
+from .serializers import (
+    OrderBulkSerializer,
+    OrderBulkUpdateSerializer,
+    ProductBulkSerializer,
+    ProductBulkUpdateSerializer,
+)
+from .totals import product_order_ids, update_order_totals
+
+BULK_CHUNK_SIZE = 1000
+
+# validated items with their indexes in the request
+Items = List[Tuple[int, Dict[str, Any]]]
+
+
+class BulkResult:
+    """ Итог массовой операции: id сохранённых записей и ошибки по индексам элементов """
+
+    def __init__(self):
+        self.pks: List[int] = []
+        self.errors: List[Dict[str, Any]] = []
+
+    def add_error(self, index: int, field: str, message: str) -> None:
+        self.errors.append({'index': index, 'errors': {field: [message]}})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'count': len(self.pks),
+            'pks': self.pks,
+            'errors': sorted(self.errors, key=lambda error: error['index']),
+        }
+
+
+def iter_chunks(items: Iterable, size: int) -> Iterator[List]:
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_items(serializer: Serializer, items: List[Any], result: BulkResult, require_pk: bool = False) -> Items:
+    valid = []
+    for index, item in enumerate(items):
+        try:
+            data = serializer.run_validation(item)
+        except ValidationError as exc:
+            result.errors.append({'index': index, 'errors': exc.detail})
+            continue
+        if require_pk and 'pk' not in data:
+            result.add_error(index, 'pk', 'This field is required.')
+            continue
+        valid.append((index, data))
+    return valid
+
+
+def check_references(items: Items, field: str, model: Type[models.Model], result: BulkResult) -> Items:
+    """ Отбрасывает элементы со ссылками ``field`` (id или список id) на несуществующие записи ``model`` """
+    def referenced(data: Dict[str, Any]) -> Set[int]:
+        value = data.get(field)
+        if value is None:
+            return set()
+        return set(value) if isinstance(value, list) else {value}
+
+    ids = set().union(*(referenced(data) for _, data in items))
+    known = set(model.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+    checked = []
+    for index, data in items:
+        missing = referenced(data) - known
+        if missing:
+            result.add_error(index, field, f'{model.__name__} with ids {sorted(missing)} does not exist')
+        else:
+            checked.append((index, data))
+    return checked
+
+
+def load_instances(items: Items, queryset: QuerySet, result: BulkResult) -> Tuple[Items, Dict[int, models.Model]]:
+    instances = queryset.in_bulk([data['pk'] for _, data in items])
+    found = []
+    for index, data in items:
+        if data['pk'] in instances:
+            found.append((index, data))
+        else:
+            result.add_error(index, 'pk', f'{queryset.model.__name__} with id {data["pk"]} does not exist')
+    return found, instances
+
+
+def apply_changes(items: Items, instances: Dict[int, models.Model]) -> Set[str]:
+    """ Переносит значения полей в записи и возвращает имена изменённых полей """
+    fields = set()
+    for _, data in items:
+        instance = instances[data['pk']]
+        for name, value in data.items():
+            if name != 'pk':
+                setattr(instance, name, value)
+                fields.add(name)
+    return fields
+
+
+def archive_products(queryset: QuerySet, archived: bool = True) -> int:
+    """ Архивирует товары ``queryset`` или возвращает их в продажу, возвращает число изменённых """
+    # update() bypasses post_save, so caches are invalidated and adjusted here
+    invalidate_products_orders(queryset.values_list('pk', flat=True))
+    changed = queryset.filter(archived=not archived).update(archived=archived, updated_at=timezone.now())
+    adjust_available_products_count(-changed if archived else changed)
+    touch_changed('products')
+    return changed
+
+
+def archive_products_by_pk(pks: List[int], archived: bool = True) -> BulkResult:
+    """ ``archive_products`` пачками по id, неизвестные id возвращаются ошибками """
+    result = BulkResult()
+    for chunk in iter_chunks(enumerate(pks), BULK_CHUNK_SIZE):
+        known = set(Product.objects.filter(pk__in=[pk for _, pk in chunk]).values_list('pk', flat=True))
+        for index, pk in chunk:
+            if pk not in known:
+                result.add_error(index, 'pk', f'Product with id {pk} does not exist')
+        with transaction.atomic():
+            archive_products(Product.objects.filter(pk__in=known), archived)
+        result.pks.extend(dict.fromkeys(pk for _, pk in chunk if pk in known))
+    return result
+
+
+def create_products(items: List[Any]) -> BulkResult:
+    result = BulkResult()
+    valid = validate_items(ProductBulkSerializer(), items, result)
+    for chunk in iter_chunks(valid, BULK_CHUNK_SIZE):
+        chunk = check_references(chunk, 'created_by_id', User, result)
+        with transaction.atomic():
+            products = Product.objects.bulk_create(Product(**data) for _, data in chunk)
+            search.index_products(products)
+            adjust_available_products_count(sum(not product.archived for product in products))
+            touch_changed('products')
+        result.pks.extend(product.pk for product in products)
+    return result
+
+
+def update_products(items: List[Any]) -> BulkResult:
+    result = BulkResult()
+    valid = validate_items(ProductBulkUpdateSerializer(partial=True), items, result, require_pk=True)
+    for chunk in iter_chunks(valid, BULK_CHUNK_SIZE):
+        chunk = check_references(chunk, 'created_by_id', User, result)
+        chunk, products = load_instances(chunk, Product.objects.all(), result)
+        changed = {data['pk']: products[data['pk']] for _, data in chunk}
+        was_available = sum(not product.archived for product in changed.values())
+        fields = apply_changes(chunk, products)
+        now = timezone.now()
+        for product in changed.values():
+            product.updated_at = now
+        with transaction.atomic():
+            Product.objects.bulk_update(changed.values(), [*fields, 'updated_at'])
+            search.index_products(changed.values())
+            invalidate_products_orders(changed)
+            if fields & {'price', 'discount'}:
+                update_order_totals(product_order_ids(changed))
+            adjust_available_products_count(sum(not product.archived for product in changed.values()) - was_available)
+            touch_changed('products')
+        result.pks.extend(changed)
+    return result
+
+
+def create_orders(items: List[Any]) -> BulkResult:
+    result = BulkResult()
+    valid = validate_items(OrderBulkSerializer(), items, result)
+    through = Order.products.through
+    for chunk in iter_chunks(valid, BULK_CHUNK_SIZE):
+        chunk = check_references(chunk, 'user_id', User, result)
+        chunk = check_references(chunk, 'products', Product, result)
+        product_ids = [data.pop('products', []) for _, data in chunk]
+        with transaction.atomic():
+            orders = Order.objects.bulk_create(Order(**data) for _, data in chunk)
+            through.objects.bulk_create(
+                through(order_id=order.pk, product_id=product_id)
+                for order, order_product_ids in zip(orders, product_ids)
+                for product_id in dict.fromkeys(order_product_ids)
+            )
+            update_order_totals(order.pk for order in orders)
+            invalidate_user_orders(order.user_id for order in orders)
+            touch_changed('orders')
+        result.pks.extend(order.pk for order in orders)
+    return result
+
+
+def update_orders(items: List[Any]) -> BulkResult:
+    result = BulkResult()
+    valid = validate_items(OrderBulkUpdateSerializer(partial=True), items, result, require_pk=True)
+    for chunk in iter_chunks(valid, BULK_CHUNK_SIZE):
+        chunk = check_references(chunk, 'user_id', User, result)
+        chunk, orders = load_instances(chunk, Order.objects.all(), result)
+        changed = {data['pk']: orders[data['pk']] for _, data in chunk}
+        # both the previous and the new owner see the order in their cached lists
+        user_ids = {order.user_id for order in changed.values()}
+        fields = apply_changes(chunk, orders)
+        now = timezone.now()
+        for order in changed.values():
+            order.updated_at = now
+            user_ids.add(order.user_id)
+        with transaction.atomic():
+            Order.objects.bulk_update(changed.values(), [*fields, 'updated_at'])
+            invalidate_user_orders(user_ids)
+            touch_changed('orders')
+        result.pks.extend(changed)
+    return result
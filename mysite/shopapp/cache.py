@@ -0,0 +1,163 @@
+"""
+Модуль с ключами и функциями кеширования приложения shopapp.
+
+Все ключи строятся через ``make_key`` и содержат версию схемы ``KEY_SCHEMA``:
+при изменении формата кешируемых данных достаточно поднять версию,
+и старые записи перестанут читаться. Время жизни записей задаётся
+в настройке ``SHOP_CACHE_TIMEOUTS``
+"""
+
+from datetime import datetime, timezone
+from time import time
+from typing import Any, Callable, Iterable
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+
+from .models import Order, Product
+
+KEY_SCHEMA = 'shop:v1'
+
+
+def get_cache() -> BaseCache:
+    return caches[settings.SHOP_CACHE_ALIAS]
+
+
+def get_timeout(name: str) -> int:
+    return settings.SHOP_CACHE_TIMEOUTS[name]
+
+
+def make_key(*parts: Any) -> str:
+    return ':'.join((KEY_SCHEMA, *map(str, parts)))
+
+
+def user_orders_export_key(user_id: int) -> str:
+    return make_key('orders_export', 'user', user_id)
+
+
+def user_orders_fragment_key(user_id: int) -> str:
+    """ Ключ фрагмента ``{% cache ... orders_list owner.pk %}`` в orders_by_user_list.html """
+    return make_template_fragment_key('orders_list', [user_id])
+
+
+def available_products_count_key() -> str:
+    return make_key('products', 'available_count')
+
+
+def available_products_count_version_key() -> str:
+    return make_key('products', 'available_count_version')
+
+
+def changed_key(name: str) -> str:
+    return make_key('changed', name)
+
+
+def get_or_set(key: str, builder: Callable[[], Any], timeout_name: str) -> Any:
+    """ Возвращает значение из кеша, вычисляя и сохраняя его при промахе """
+    cache = get_cache()
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, get_timeout(timeout_name))
+    return value
+
+
+def delete_many(keys: Iterable[str]) -> None:
+    keys = list(keys)
+    if keys:
+        get_cache().delete_many(keys)
+
+
+def invalidate_user_orders(user_ids: Iterable[int]) -> None:
+    """
+    Удаляет кешированные выгрузку и список заказов пользователей.
+
+    Удаление откладывается до фиксации транзакции, чтобы параллельный запрос
+    не успел положить в кеш ещё не изменённые данные
+    """
+    keys = [
+        key
+        for user_id in set(user_ids)
+        for key in (user_orders_export_key(user_id), user_orders_fragment_key(user_id))
+    ]
+    if keys:
+        transaction.on_commit(lambda: delete_many(keys))
+
+
+def invalidate_products_orders(product_ids: Iterable[int]) -> None:
+    """ Удаляет кеш заказов всех пользователей, в чьих заказах есть эти товары """
+    user_ids = (
+        Order.objects
+        .filter(products__in=list(product_ids))
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+    invalidate_user_orders(user_ids)
+
+
+def get_available_products_count() -> int:
+    """
+    Число товаров в продаже: из кеша, а при промахе - одним COUNT.
+
+    Результат сохраняется, только если за время подсчёта не сменилась версия
+    из ``available_products_count_version_key``: иначе изменение, зафиксированное
+    во время подсчёта, было бы перезаписано устаревшим числом
+    """
+    cache = get_cache()
+    key, version_key = available_products_count_key(), available_products_count_version_key()
+    count = cache.get(key)
+    if count is not None:
+        return count
+    version = cache.get(version_key)
+    count = Product.objects.filter(archived=False).count()
+    if cache.get(version_key) == version:
+        cache.set(key, count, get_timeout('available_products_count'))
+    return count
+
+
+def adjust_available_products_count(delta: int) -> None:
+    """
+    Изменяет закешированное число товаров в продаже после фиксации транзакции.
+
+    С атомарным incr в бэкенде кеша (``SHOP_CACHE_ATOMIC_INCR``) значение
+    изменяется на месте. Иначе, а также когда значения в кеше нет, меняется
+    версия и значение удаляется: оно будет посчитано заново при следующем
+    чтении, а уже идущий подсчёт не сохранит устаревшее число. У файлового
+    кеша incr не атомарен, поэтому с ним каждое изменение стоит одного COUNT
+    """
+    if not delta:
+        return
+
+    def adjust():
+        cache = get_cache()
+        if settings.SHOP_CACHE_ATOMIC_INCR:
+            try:
+                cache.incr(available_products_count_key(), delta)
+                return
+            except ValueError:
+                pass
+        cache.set(available_products_count_version_key(), uuid4().hex, get_timeout('available_products_count'))
+        cache.delete(available_products_count_key())
+
+    transaction.on_commit(adjust)
+
+
+def get_changed(name: str) -> datetime:
+    """
+    Время последнего изменения данных ``name`` (``'products'`` или ``'orders'``).
+
+    По этой отметке строятся ключи страниц карты сайта и ETag списков.
+    Если отметки нет в кеше, изменением считается текущий момент
+    """
+    stamp = get_or_set(changed_key(name), time, 'change_stamps')
+    return datetime.fromtimestamp(stamp, tz=timezone.utc)
+
+
+def touch_changed(name: str) -> None:
+    """ Отмечает изменение данных ``name`` после фиксации транзакции """
+    transaction.on_commit(
+        lambda: get_cache().set(changed_key(name), time(), get_timeout('change_stamps'))
+    )
@@ -0,0 +1,111 @@
+"""
+Модуль условных запросов (ETag и Last-Modified) для страниц и API shopapp.
+
+Отметка изменения карточки читается из поля ``updated_at`` одним лёгким
+запросом, отметка списка берётся из кеша (см. ``cache.get_changed``).
+Если клиент прислал актуальные If-None-Match или If-Modified-Since,
+ответ 304 отдаётся до выборки объектов, сериализации и отрисовки шаблона
+"""
+
+from datetime import datetime
+from hashlib import md5
+from typing import Any, NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import Max
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+
+from .cache import get_changed
+from .models import Order, Product
+
+
+class Validators(NamedTuple):
+    etag: str
+    last_modified: datetime
+
+
+def product_changed(pk: Any) -> Optional[datetime]:
+    return Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+
+
+def order_changed(pk: Any) -> Optional[datetime]:
+    """ Заказ считается изменённым и при изменении любого из его товаров """
+    stamps = Order.objects.filter(pk=pk).aggregate(
+        order=Max('updated_at'),
+        products=Max('products__updated_at'),
+    )
+    return max(filter(None, stamps.values()), default=None)
+
+
+def lists_changed(*names: str) -> datetime:
+    return max(get_changed(name) for name in names)
+
+
+def products_revision() -> datetime:
+    """
+    Последняя ревизия товаров: самое позднее ``updated_at`` по индексу.
+
+    Удаление товара не оставляет ``updated_at``, поэтому учитывается и отметка списка
+    """
+    latest = Product.objects.order_by('-updated_at').values_list('updated_at', flat=True).first()
+    return max(filter(None, (latest, get_changed('products'))))
+
+
+def get_validators(request: HttpRequest, changed: Optional[datetime], *parts: Any) -> Optional[Validators]:
+    """
+    Валидаторы ответа на ``request`` для данных, изменённых в ``changed``.
+
+    ETag зависит также от адреса с параметрами, сессии, языка и ``parts``.
+    Сессия берётся из cookie, чтобы не загружать пользователя из базы
+    """
+    if changed is None:
+        return None
+    key = ':'.join(map(str, (
+        changed.timestamp(),
+        request.get_full_path(),
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME, ''),
+        get_language(),
+        *parts,
+    )))
+    return Validators(quote_etag(md5(key.encode()).hexdigest()), changed)
+
+
+def not_modified(request: HttpRequest, validators: Optional[Validators]) -> Optional[HttpResponse]:
+    """ Ответ 304, если у клиента актуальная версия, иначе None """
+    if validators is None or request.method not in ('GET', 'HEAD'):
+        return None
+    return get_conditional_response(
+        request,
+        etag=validators.etag,
+        last_modified=int(validators.last_modified.timestamp()),
+    )
+
+
+def set_validators(response: HttpResponse, validators: Optional[Validators]) -> HttpResponse:
+    if validators is not None and response.status_code == 200:
+        response.headers.setdefault('ETag', validators.etag)
+        response.headers.setdefault('Last-Modified', http_date(validators.last_modified.timestamp()))
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Условный GET для представлений на классах.
+
+    Подкласс возвращает валидаторы из ``get_validators``, по ним до вызова
+    ``get`` родителя отдаётся 304, а к полному ответу добавляются заголовки.
+    Без валидаторов (None) ответ отдаётся как обычно
+    """
+
+    def get_validators(self) -> Optional[Validators]:
+        return None
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        response = not_modified(request, validators)
+        if response is None:
+            response = set_validators(super().get(request, *args, **kwargs), validators)
+        return response
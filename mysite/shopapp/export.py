@@ -0,0 +1,106 @@
+"""
+Модуль с утилитами для выгрузки заказов.
+
+Заказы читаются пачками с keyset-пагинацией по pk, а идентификаторы товаров
+для всей пачки получаются одним запросом, поэтому память не растёт вместе
+с таблицей заказов, а число запросов зависит только от числа пачек
+"""
+
+import csv
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+
+from .models import Order
+
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FIELDS = 'pk', 'delivery_address', 'promocode', 'user_id'
+CSV_HEADER = 'pk', 'delivery_address', 'promocode', 'user_id', 'products'
+
+
+def iter_order_chunks(
+    queryset: Optional[QuerySet] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> Iterator[List[Dict]]:
+    """
+    Проходит по заказам пачками по возрастанию pk.
+
+    Каждая пачка стоит двух запросов: сами заказы и их связи с товарами.
+    Товары внутри заказа идут в порядке модели Product (по цене)
+    """
+    if queryset is None:
+        queryset = Order.objects.all()
+    orders = queryset.order_by('pk').values(*EXPORT_FIELDS)
+    through = Order.products.through
+    last_pk = 0
+    while True:
+        chunk = list(orders.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        products_by_order = {row['pk']: [] for row in chunk}
+        links = (
+            through.objects
+            .filter(order_id__in=products_by_order.keys())
+            .order_by('order_id', 'product__price', 'product_id')
+            .values_list('order_id', 'product_id')
+        )
+        for order_id, product_id in links:
+            products_by_order[order_id].append(product_id)
+        for row in chunk:
+            row['products_id'] = products_by_order[row['pk']]
+        yield chunk
+        last_pk = chunk[-1]['pk']
+
+
+def stream_json(chunks: Iterable[List[Dict]]) -> Iterator[str]:
+    """ Отдаёт объект {"orders": [...]} по частям, по одной на пачку """
+    encoder = DjangoJSONEncoder()
+    yield '{"orders": ['
+    separator = ''
+    for chunk in chunks:
+        yield separator + ', '.join(encoder.encode(row) for row in chunk)
+        separator = ', '
+    yield ']}'
+
+
+def stream_ndjson(chunks: Iterable[List[Dict]]) -> Iterator[str]:
+    """ Отдаёт заказы в формате NDJSON: один JSON-объект на строку """
+    encoder = DjangoJSONEncoder()
+    for chunk in chunks:
+        yield ''.join(encoder.encode(row) + '\n' for row in chunk)
+
+
+class _Echo:
+    """ Псевдо-файл для csv.writer, возвращающий записанную строку """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def stream_csv(chunks: Iterable[List[Dict]]) -> Iterator[str]:
+    """
+    Отдаёт заказы в CSV.
+
+    Колонка products совпадает с форматом импорта заказов из CSV
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for chunk in chunks:
+        yield ''.join(
+            writer.writerow((
+                row['pk'],
+                row['delivery_address'],
+                row['promocode'],
+                row['user_id'],
+                ','.join(map(str, row['products_id'])),
+            ))
+            for row in chunk
+        )
+
+
+EXPORT_FORMATS = {
+    'json': (stream_json, 'application/json'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+    'csv': (stream_csv, 'text/csv'),
+}
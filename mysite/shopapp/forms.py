@@ -20,3 +20,9 @@ class OrderForm(forms.ModelForm):
 
 class CSVImportForm(forms.Form):
     csv_file = forms.FileField()
+
+
+class OrderFilterForm(forms.Form):
+    since = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    until = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    user = forms.IntegerField(required=False, min_value=1, label='User ID')
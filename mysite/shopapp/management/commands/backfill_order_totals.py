@@ -0,0 +1,39 @@
+from time import perf_counter
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from shopapp.models import Order
+from shopapp.totals import TOTALS_BATCH_SIZE, update_order_totals
+
+
+class Command(BaseCommand):
+    """
+    Recalculates stored order totals
+    """
+    help = (
+        'Recalculates subtotal, total and products_count of every order from the prices '
+        'and discounts of its products, one transaction per batch of orders'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=TOTALS_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        batch_size = options['batch_size']
+        last_pk, updated = 0, 0
+        while True:
+            batch = list(
+                Order.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                updated += update_order_totals(batch, batch_size)
+            last_pk = batch[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Пересчитано заказов: {updated}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитаны итоги заказов: {updated} за {perf_counter() - started:.2f} сек'
+        ))
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from time import perf_counter
+from typing import List, NamedTuple, Optional
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from django.core.management import BaseCommand, CommandError
+
+
+class LoadResult(NamedTuple):
+    url: str
+    requests: int
+    errors: int
+    seconds: float
+    latencies_ms: List[float]
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.seconds
+
+    def percentile(self, value: int) -> float:
+        if len(self.latencies_ms) < 2:
+            return self.latencies_ms[0] if self.latencies_ms else 0.0
+        return quantiles(self.latencies_ms, n=100)[value - 1]
+
+
+def fetch(url: str, timeout: float) -> Optional[float]:
+    """ Время ответа в миллисекундах или None при ошибке """
+    started = perf_counter()
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            response.read()
+    except (URLError, OSError):
+        return None
+    return (perf_counter() - started) * 1000
+
+
+def run_load(url: str, total: int, concurrency: int, timeout: float) -> LoadResult:
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = perf_counter()
+        results = list(executor.map(lambda _: fetch(url, timeout), range(total)))
+        seconds = perf_counter() - started
+    latencies = [result for result in results if result is not None]
+    return LoadResult(url, total, total - len(latencies), seconds, latencies)
+
+
+class Command(BaseCommand):
+    """
+    Measures concurrent throughput of running server endpoints
+    """
+    help = (
+        'Sends concurrent GET requests to the given URLs and reports throughput and latency, '
+        'e.g. the same endpoint served by the WSGI and the ASGI server, '
+        'or /shop/api/products/ against /shop/api/async/products/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='Full URLs, e.g. http://127.0.0.1:8000/en/shop/api/async/products/')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per URL')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--warmup', type=int, default=20, help='Requests per URL before measuring')
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests и --concurrency должны быть положительными')
+
+        for url in options['urls']:
+            if options['warmup']:
+                run_load(url, options['warmup'], min(options['concurrency'], options['warmup']), options['timeout'])
+            result = run_load(url, options['requests'], options['concurrency'], options['timeout'])
+            self.stdout.write(
+                f'{url}\n'
+                f'  запросов: {result.requests}, ошибок: {result.errors}, '
+                f'{result.throughput:.1f} запросов/сек при {options["concurrency"]} одновременных\n'
+                f'  задержка p50 {result.percentile(50):.1f} мс, '
+                f'p95 {result.percentile(95):.1f} мс, p99 {result.percentile(99):.1f} мс'
+            )
+            if result.errors:
+                self.stdout.write(self.style.WARNING(f'  {result.errors} запросов завершились ошибкой'))
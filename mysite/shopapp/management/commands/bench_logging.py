@@ -0,0 +1,107 @@
+import logging
+import os
+from statistics import mean, median, quantiles
+from threading import Thread
+from time import perf_counter, sleep
+from typing import Dict, List, Optional
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import BaseCommand
+from django.test import RequestFactory
+
+from mysite.log import BackgroundHandler, JsonFormatter, SamplingFilter
+from shopapp.views import shop_index
+
+VERBOSE_FORMAT = '%(asctime)s [%(levelname)s] %(name)s:%(lineno)s %(module)s "%(message)s"'
+
+
+def drain(fd: int, delay: float) -> None:
+    """ Читает pipe, как сборщик логов docker читает stdout контейнера, ``delay`` - пауза между чтениями """
+    while os.read(fd, 4096):
+        if delay:
+            sleep(delay)
+
+
+class Command(BaseCommand):
+    """
+    Compares logging handlers on the request path
+    """
+    help = (
+        'Calls shop_index with the root logger writing to a pipe through the synchronous '
+        'StreamHandler and through mysite.log.BackgroundHandler, with and without sampling, '
+        'and reports the time per request'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--sample-rate', type=float, default=0.01)
+        parser.add_argument(
+            '--reader-delay-ms', type=float, default=0.0,
+            help='Pause between reads of the log pipe, models a slow log collector',
+        )
+
+    def handle(self, *args, **options):
+        cases: Dict[str, Optional[dict]] = {
+            'без логов': None,
+            'StreamHandler': {'handler': 'console', 'formatter': logging.Formatter(VERBOSE_FORMAT)},
+            'background': {'handler': 'background', 'formatter': logging.Formatter(VERBOSE_FORMAT)},
+            'background, json': {'handler': 'background', 'formatter': JsonFormatter()},
+            f'background, {options["sample_rate"]:.0%} INFO': {
+                'handler': 'background',
+                'formatter': JsonFormatter(),
+                'rates': {'shopapp.views': options['sample_rate']},
+            },
+        }
+        root = logging.getLogger()
+        saved_handlers, saved_level = root.handlers[:], root.level
+        self.stdout.write(
+            f'{options["requests"]} запросов shop_index на вариант, '
+            f'пауза чтения логов {options["reader_delay_ms"]} мс'
+        )
+        try:
+            for label, case in cases.items():
+                timings = self.run(root, case, options['requests'], options['reader_delay_ms'] / 1000)
+                self.stdout.write(
+                    f'  {label:<22} медиана {median(timings):7.1f}, среднее {mean(timings):7.1f}, '
+                    f'p99 {quantiles(timings, n=100)[98]:8.1f} мкс на запрос'
+                )
+        finally:
+            root.handlers[:] = saved_handlers
+            root.setLevel(saved_level)
+
+    @staticmethod
+    def run(root: logging.Logger, case: Optional[dict], total: int, reader_delay: float) -> List[float]:
+        read_fd, write_fd = os.pipe()
+        reader = Thread(target=drain, args=(read_fd, reader_delay), daemon=True)
+        reader.start()
+        stream = os.fdopen(write_fd, 'w')
+
+        handler = None
+        if case is None:
+            root.handlers[:] = []
+            root.setLevel(logging.WARNING)
+        else:
+            if case['handler'] == 'background':
+                handler = BackgroundHandler(stream)
+            else:
+                handler = logging.StreamHandler(stream)
+            handler.setFormatter(case['formatter'])
+            handler.addFilter(SamplingFilter(case.get('rates', {})))
+            root.handlers[:] = [handler]
+            root.setLevel(logging.INFO)
+
+        factory = RequestFactory()
+        timings = []
+        for _ in range(total):
+            request = factory.get('/shop/', HTTP_HOST='127.0.0.1')
+            request.user = AnonymousUser()
+            started = perf_counter()
+            shop_index(request)
+            timings.append((perf_counter() - started) * 1_000_000)
+
+        if handler is not None:
+            handler.close()
+        stream.close()
+        reader.join()
+        os.close(read_fd)
+        return timings
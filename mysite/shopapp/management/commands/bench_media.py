@@ -0,0 +1,69 @@
+import tempfile
+from os import urandom
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+from typing import Callable, Dict
+
+from django.core.management import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.views.static import serve
+
+from mysite.media import serve_media
+
+
+def consume(response: HttpResponse) -> int:
+    """ Читает тело ответа так же, как WSGI-сервер без file_wrapper, и возвращает его размер """
+    if response.streaming:
+        body_size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        body_size = len(response.content)
+    response.close()
+    return body_size
+
+
+class Command(BaseCommand):
+    """
+    Compares media delivery modes
+    """
+    help = (
+        'Serves a generated file through django.views.static.serve and mysite.media.serve_media '
+        'in file, x-accel and x-sendfile modes and reports time and bytes passed through Python per request. '
+        'Run bench_http against a deployed server to measure sendfile under gunicorn'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=float, default=8.0, help='Size of the served file')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        size = int(options['size_mb'] * 1024 * 1024)
+        with tempfile.TemporaryDirectory() as media_root:
+            name = 'renditions/bench/photo.large.0123456789ab.jpg'
+            path = Path(media_root, name)
+            path.parent.mkdir(parents=True)
+            path.write_bytes(urandom(size))
+
+            cases: Dict[str, Callable[[], HttpResponse]] = {
+                'static()': lambda: serve(factory.get(f'/media/{name}'), name, document_root=media_root),
+                'file': lambda: serve_media(factory.get(f'/media/{name}'), name),
+                'file, Range 1 MB': lambda: serve_media(
+                    factory.get(f'/media/{name}', HTTP_RANGE=f'bytes=0-{1024 * 1024 - 1}'), name
+                ),
+                'x-accel': lambda: serve_media(factory.get(f'/media/{name}'), name),
+                'x-sendfile': lambda: serve_media(factory.get(f'/media/{name}'), name),
+            }
+            self.stdout.write(f'Файл {options["size_mb"]} МБ, {options["repeat"]} запросов на способ')
+            for label, make_response in cases.items():
+                delivery = label.split(',')[0] if label != 'static()' else 'static'
+                with override_settings(MEDIA_ROOT=media_root, MEDIA_DELIVERY=delivery):
+                    timings, body_size = [], 0
+                    for _ in range(options['repeat']):
+                        started = perf_counter()
+                        body_size = consume(make_response())
+                        timings.append((perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f'  {label:<18} {median(timings):8.2f} мс, через Python: {body_size / 1024 / 1024:.2f} МБ'
+                )
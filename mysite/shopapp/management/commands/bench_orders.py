@@ -0,0 +1,86 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from time import perf_counter
+from typing import List, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from shopapp.models import Order, Product
+
+BENCH_USERNAME = 'bench_orders'
+
+
+def create_order(user: User, product_ids: List[int], products_per_order: int) -> Optional[float]:
+    """ Время создания заказа с товарами в миллисекундах или None, если база была заблокирована """
+    started = perf_counter()
+    try:
+        with transaction.atomic():
+            order = Order.objects.create(user=user, delivery_address='bench', promocode='BENCH')
+            order.products.add(*random.sample(product_ids, products_per_order))
+    except OperationalError:
+        return None
+    return (perf_counter() - started) * 1000
+
+
+def run_worker(user: User, product_ids: List[int], total: int, products_per_order: int) -> List[Optional[float]]:
+    try:
+        return [create_order(user, product_ids, products_per_order) for _ in range(total)]
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    """
+    Measures concurrent order creation throughput
+    """
+    help = (
+        'Creates orders from concurrent threads, each with its own database connection, '
+        'and reports orders per second, latency and "database is locked" errors. '
+        'Run it with DJANGO_DATABASE_ENGINE=sqlite (DJANGO_SQLITE_JOURNAL_MODE=WAL or DELETE) '
+        'and DJANGO_DATABASE_ENGINE=postgres to compare. The created orders are deleted afterwards'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000, help='Orders in total')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--products-per-order', type=int, default=3)
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.values_list('pk', flat=True))
+        if len(product_ids) < options['products_per_order']:
+            raise CommandError('Not enough products, run seed_shop or create_products first')
+        user, created = User.objects.get_or_create(username=BENCH_USERNAME)
+        concurrency = options['concurrency']
+        per_worker = options['orders'] // concurrency
+
+        database = settings.DATABASES['default']
+        self.stdout.write(
+            f'{database["ENGINE"]}, journal_mode={database.get("PRAGMAS", {}).get("journal_mode", "-")}: '
+            f'{per_worker * concurrency} заказов в {concurrency} потоков'
+        )
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                started = perf_counter()
+                results = [
+                    latency
+                    for worker_results in executor.map(
+                        lambda _: run_worker(user, product_ids, per_worker, options['products_per_order']),
+                        range(concurrency),
+                    )
+                    for latency in worker_results
+                ]
+                seconds = perf_counter() - started
+        finally:
+            Order.objects.filter(user=user).delete()
+            user.delete()
+
+        latencies = [latency for latency in results if latency is not None]
+        percentiles = quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+        self.stdout.write(
+            f'  {len(latencies) / seconds:.0f} заказов/с, ошибок блокировки: {len(results) - len(latencies)}, '
+            f'p50 {percentiles[49]:.1f} мс, p95 {percentiles[94]:.1f} мс, p99 {percentiles[98]:.1f} мс'
+        )
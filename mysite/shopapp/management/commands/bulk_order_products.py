@@ -0,0 +1,54 @@
+from time import perf_counter
+from typing import Set
+
+from django.core.management import BaseCommand, CommandError
+from shopapp.order_products import ACTIONS, BULK_BATCH_SIZE, ChangeStats, OrderProductsError, change_order_products
+
+
+def parse_ids(value: str) -> Set[int]:
+    """ ``1,2,10-20`` -> множество id """
+    ids = set()
+    for part in filter(None, value.split(',')):
+        low, _, high = part.partition('-')
+        ids.update(range(int(low), int(high or low) + 1))
+    return ids
+
+
+class Command(BaseCommand):
+    """
+    Adds products to or removes them from many orders
+    """
+    help = (
+        'Adds products to orders or removes them, one set-based insert or delete per batch of orders. '
+        'Without --orders, remove takes the products out of every order that has them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=ACTIONS)
+        parser.add_argument('--products', type=parse_ids, required=True, help='Product ids, e.g. 1,2,10-20')
+        parser.add_argument('--orders', type=parse_ids, help='Order ids, e.g. 1,2,10-20')
+        parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+
+        def report(stats: ChangeStats):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Пачка {stats.batches}: изменено заказов {stats.orders}, связей {stats.links}')
+
+        try:
+            stats = change_order_products(
+                options['action'],
+                options['products'],
+                options['orders'],
+                batch_size=options['batch_size'],
+                on_batch=report,
+            )
+        except OrderProductsError as exc:
+            raise CommandError(str(exc)) from exc
+
+        verb = 'добавлено' if options['action'] == 'add' else 'удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Изменено заказов: {stats.orders}, {verb} связей с товарами: {stats.links} '
+            f'за {perf_counter() - started:.2f} сек'
+        ))
@@ -0,0 +1,39 @@
+from django.core.management import BaseCommand
+from shopapp.models import ProductImage
+from shopapp.thumbnails import generate_renditions, pending_images
+
+
+class Command(BaseCommand):
+    """
+    Generates product image renditions
+    """
+    help = 'Generates missing renditions of product images for all SHOP_THUMBNAIL_PRESETS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate renditions of all images, e.g. after changing the presets quality',
+        )
+
+    def handle(self, *args, **options):
+        if options['force']:
+            images = ProductImage.objects.order_by('pk').iterator()
+        else:
+            images = pending_images()
+
+        generated = failed = 0
+        for image in images:
+            try:
+                generate_renditions(image, force=options['force'])
+            except (OSError, ValueError) as exc:
+                failed += 1
+                self.stderr.write(f'Не удалось обработать изображение №{image.pk} ({image.image.name}): {exc}')
+                continue
+            generated += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Изображение №{image.pk}: {", ".join(image.renditions)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {generated}, с ошибками: {failed}'
+        ))
@@ -0,0 +1,48 @@
+from time import perf_counter
+
+from django.core.management import BaseCommand, CommandError
+from shopapp.order_import import IMPORT_BATCH_SIZE, ImportStats, OrderImportError, import_orders
+
+
+class Command(BaseCommand):
+    """
+    Imports orders from CSV file
+    """
+    help = 'Imports orders from CSV file with delivery_address, promocode, user_id and products columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='Path to CSV file, e.g. new_orders.csv')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--encoding', default='utf-8')
+        parser.add_argument(
+            '--atomic',
+            action='store_true',
+            help='Import the whole file in one transaction instead of one per batch',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Приступаем к импорту заказов из {options["csv_path"]}')
+        started = perf_counter()
+
+        def report(stats: ImportStats):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f'Пачка {stats.batches}: импортировано заказов {stats.orders}, '
+                    f'{stats.orders / (perf_counter() - started):.0f} заказов/сек'
+                )
+
+        try:
+            with open(options['csv_path'], newline='', encoding=options['encoding']) as csv_file:
+                stats = import_orders(
+                    csv_file,
+                    batch_size=options['batch_size'],
+                    atomic=options['atomic'],
+                    on_batch=report,
+                )
+        except (OSError, OrderImportError) as exc:
+            raise CommandError(str(exc)) from exc
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано заказов: {stats.orders}, связей с товарами: {stats.links} '
+            f'за {perf_counter() - started:.2f} сек'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+from shopapp.search import is_available, rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds products full-text search index
+    """
+
+    def handle(self, *args, **options):
+        if not is_available():
+            self.stdout.write('Поисковый индекс используется только с SQLite, пропускаем')
+            return
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс товаров перестроен'))
@@ -0,0 +1,71 @@
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+
+from shopapp.seeding import DISTRIBUTIONS, SeedConfig, StageStats, seed_shop
+
+
+def products_range(value: str):
+    """ ``3`` или ``1-5`` -> (наименьшее, наибольшее) """
+    low, _, high = value.partition('-')
+    return int(low), int(high or low)
+
+
+class Command(BaseCommand):
+    """
+    Generates a large shop dataset
+    """
+    help = (
+        'Creates users, products with images, orders and order-product links in batches '
+        'and reports rows per second for every stage. The same --seed gives the same data'
+    )
+
+    def add_arguments(self, parser):
+        defaults = SeedConfig()
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--products', type=int, default=defaults.products)
+        parser.add_argument('--orders', type=int, default=defaults.orders)
+        parser.add_argument(
+            '--products-per-order', type=products_range, default=(1, 5),
+            help='Fixed number or uniform range, e.g. 3 or 1-5',
+        )
+        parser.add_argument('--images-per-product', type=int, default=defaults.images_per_product)
+        parser.add_argument('--archived-share', type=float, default=defaults.archived_share)
+        parser.add_argument('--product-popularity', choices=DISTRIBUTIONS, default=defaults.product_popularity)
+        parser.add_argument('--user-activity', choices=DISTRIBUTIONS, default=defaults.user_activity)
+        parser.add_argument('--spread-days', type=int, default=defaults.spread_days)
+        parser.add_argument('--prefix', default=defaults.username_prefix, help='Username prefix of generated users')
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--batch-size', type=int, default=defaults.batch_size)
+
+    def handle(self, *args, **options):
+        min_products, max_products = options['products_per_order']
+        config = SeedConfig(
+            users=options['users'],
+            products=options['products'],
+            orders=options['orders'],
+            min_products_per_order=min_products,
+            max_products_per_order=max_products,
+            images_per_product=options['images_per_product'],
+            archived_share=options['archived_share'],
+            product_popularity=options['product_popularity'],
+            user_activity=options['user_activity'],
+            spread_days=options['spread_days'],
+            username_prefix=options['prefix'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        if config.users < 1 or not 0 < min_products <= max_products:
+            raise CommandError('At least one user and 0 < min <= max products per order are required')
+        if User.objects.filter(username__startswith=config.username_prefix).exists():
+            raise CommandError(f'Users with prefix {config.username_prefix!r} already exist, pass another --prefix')
+
+        self.stdout.write(f'Приступаем к генерации данных: {config}')
+        stages = seed_shop(config, on_stage=self.report)
+        total = StageStats('total', sum(stage.rows for stage in stages), sum(stage.seconds for stage in stages))
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано строк: {total.rows} за {total.seconds:.1f} с ({total.throughput:.0f} строк/с). '
+            f'Рендиции изображений создаст generate_thumbnails'
+        ))
+
+    def report(self, stats: StageStats) -> None:
+        self.stdout.write(f'  {stats.name:<20} {stats.rows:>9} строк, {stats.seconds:7.2f} с, {stats.throughput:9.0f} строк/с')
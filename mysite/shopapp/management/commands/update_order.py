@@ -1,5 +1,6 @@
 from django.core.management import BaseCommand
 from shopapp.models import Order, Product
+from shopapp.order_products import change_order_products
 
 
 class Command(BaseCommand):
@@ -12,10 +13,7 @@ class Command(BaseCommand):
         if not order:
             self.stdout.write('Заказов не найдено')
             return
-        products = Product.objects.all()
-        for product in products:
-            order.products.add(product)
-        order.save()
+        stats = change_order_products('add', Product.objects.values_list('pk', flat=True), [order.pk])
         self.stdout.write(
-            self.style.SUCCESS(f'К заказу {order} добавлены продукты: {order.products.all()}')
+            self.style.SUCCESS(f'К заказу {order} добавлено продуктов: {stats.links}')
         )
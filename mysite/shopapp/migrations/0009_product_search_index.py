@@ -0,0 +1,33 @@
+from django.db import migrations
+
+SEARCH_INDEX_TABLE = 'shopapp_product_fts'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE {SEARCH_INDEX_TABLE} USING fts5('
+        "name, description, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        f'INSERT INTO {SEARCH_INDEX_TABLE} (rowid, name, description) '
+        'SELECT id, name, description FROM shopapp_product'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_INDEX_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0008_productimage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
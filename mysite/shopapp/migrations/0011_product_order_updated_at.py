@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def backfill_updated_at(apps, schema_editor):
+    for model_name in ('Product', 'Order'):
+        model = apps.get_model('shopapp', model_name)
+        model.objects.using(schema_editor.connection.alias).update(updated_at=F('creation_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0010_shop_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -15,6 +15,28 @@ class Product(models.Model):
         ordering = ['price']
         verbose_name = _('Product')
         verbose_name_plural = _('Products')
+        indexes = [
+            # product list and order form: non-archived products by price
+            models.Index(
+                fields=['price', 'id'],
+                condition=models.Q(archived=False),
+                name='shopapp_product_active_price',
+            ),
+            # sitemap: non-archived products by name
+            models.Index(
+                fields=['name'],
+                condition=models.Q(archived=False),
+                name='shopapp_product_active_name',
+            ),
+            # products feed: the newest non-archived products
+            models.Index(
+                fields=['-creation_time', '-id'],
+                condition=models.Q(archived=False),
+                name='shopapp_product_active_created',
+            ),
+            # products feed revision: the latest updated_at
+            models.Index(fields=['updated_at'], name='shopapp_product_updated'),
+        ]
 
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=False)
@@ -24,6 +46,7 @@ class Product(models.Model):
         validators=[MaxValueValidator(100)]
     )
     creation_time = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     archived = models.BooleanField(default=False)
     created_by = models.ForeignKey(User, on_delete=models.PROTECT)
 
@@ -50,6 +73,8 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to=product_images_directory_path)
     description = models.CharField(max_length=200, null=True, blank=True)
+    # preset name -> storage path of the rendition, filled by shopapp.thumbnails
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
 
 
 class Order(models.Model):
@@ -61,12 +86,25 @@ class Order(models.Model):
     class Meta:
         verbose_name = _('Order')
         verbose_name_plural = _('Orders')
+        indexes = [
+            # user's orders by creation time
+            models.Index(fields=['user', 'creation_time'], name='shopapp_order_user_created'),
+            # sitemap and admin list by creation time
+            models.Index(fields=['creation_time'], name='shopapp_order_created'),
+            # reports and lists sorted or filtered by order total
+            models.Index(fields=['total', 'id'], name='shopapp_order_total'),
+        ]
 
     delivery_address = models.TextField(blank=True, null=False)
     promocode = models.CharField(blank=True, max_length=8)
     creation_time = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.PROTECT)
     products = models.ManyToManyField(Product, related_name='orders')
+    # maintained by shopapp.totals from the prices and discounts of the products
+    subtotal = models.DecimalField(default=0, max_digits=12, decimal_places=2, editable=False)
+    total = models.DecimalField(default=0, max_digits=12, decimal_places=2, editable=False)
+    products_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         return f'Order №{self.pk} for {self.user}'
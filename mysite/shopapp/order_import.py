@@ -0,0 +1,138 @@
+"""
+Модуль импорта заказов из CSV.
+
+Файл читается потоково и обрабатывается пачками: на пачку приходится по
+одному запросу проверки пользователей и товаров, один ``bulk_create`` заказов
+и один ``bulk_create`` связей заказ-товар в рамках одной транзакции.
+Используется действием импорта в админке и командой ``import_orders``.
+Сигналы при массовой вставке не отправляются, поэтому итоги заказов
+пересчитываются, а кеш заказов затронутых пользователей сбрасывается здесь же
+"""
+
+from contextlib import nullcontext
+from csv import DictReader
+from itertools import islice
+from typing import IO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .cache import invalidate_user_orders, touch_changed
+from .models import Order, Product
+from .totals import update_order_totals
+
+IMPORT_BATCH_SIZE = 500
+REQUIRED_COLUMNS = 'delivery_address', 'promocode', 'user_id', 'products'
+
+
+class OrderImportError(ValueError):
+    """ Ошибка в данных импортируемого CSV-файла """
+
+    def __init__(self, message: str, line: Optional[int] = None):
+        if line is not None:
+            message = f'Line {line}: {message}'
+        super().__init__(message)
+        self.line = line
+
+
+class ImportStats(NamedTuple):
+    """ Итог импорта: число заказов, связей с товарами и обработанных пачек """
+    orders: int = 0
+    links: int = 0
+    batches: int = 0
+
+
+ParsedRow = Tuple[int, Dict, List[int]]
+
+
+def parse_row(row: Dict[str, str], line: int) -> ParsedRow:
+    """ Разбирает строку CSV на поля заказа и список id товаров """
+    try:
+        user_id = int(row['user_id'])
+        products = row['products'] or ''
+        product_ids = [int(pk) for pk in products.split(',') if pk.strip()]
+    except (TypeError, ValueError) as exc:
+        raise OrderImportError(f'invalid id value ({exc})', line) from exc
+    order_data = {
+        'delivery_address': row['delivery_address'] or '',
+        'promocode': row['promocode'] or '',
+        'user_id': user_id,
+    }
+    return line, order_data, list(dict.fromkeys(product_ids))
+
+
+def iter_batches(reader: DictReader, batch_size: int) -> Iterator[List[ParsedRow]]:
+    """ Разбивает строки файла на пачки разобранных строк """
+    rows = (
+        parse_row(row, reader.line_num)
+        for row in reader
+    )
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def check_references(batch: List[ParsedRow]) -> None:
+    """ Проверяет, что все пользователи и товары пачки существуют, по запросу на модель """
+    user_ids = {order_data['user_id'] for _, order_data, _ in batch}
+    product_ids = {pk for _, _, row_product_ids in batch for pk in row_product_ids}
+    known_users = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    known_products = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+    for line, order_data, row_product_ids in batch:
+        if order_data['user_id'] not in known_users:
+            raise OrderImportError(f'user with id {order_data["user_id"]} does not exist', line)
+        missing = [pk for pk in row_product_ids if pk not in known_products]
+        if missing:
+            raise OrderImportError(f'products with ids {missing} do not exist', line)
+
+
+def import_batch(batch: List[ParsedRow]) -> ImportStats:
+    """ Сохраняет пачку заказов и их связи с товарами в одной транзакции """
+    check_references(batch)
+    through = Order.products.through
+    with transaction.atomic():
+        orders = Order.objects.bulk_create(
+            Order(**order_data) for _, order_data, _ in batch
+        )
+        links = through.objects.bulk_create(
+            through(order_id=order.pk, product_id=product_id)
+            for order, (_, _, product_ids) in zip(orders, batch)
+            for product_id in product_ids
+        )
+        # bulk_create sends neither post_save nor m2m_changed
+        update_order_totals(order.pk for order in orders)
+        invalidate_user_orders(order.user_id for order in orders)
+        touch_changed('orders')
+    return ImportStats(orders=len(orders), links=len(links), batches=1)
+
+
+def import_orders(
+    csv_file: IO[str],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    atomic: bool = False,
+    on_batch: Optional[Callable[[ImportStats], None]] = None,
+) -> ImportStats:
+    """
+    Импортирует заказы из CSV-файла с колонками delivery_address, promocode,
+    user_id и products (id товаров через запятую).
+
+    По умолчанию каждая пачка фиксируется отдельно, при ``atomic=True``
+    весь файл загружается в одной транзакции.
+    ``on_batch`` вызывается с накопленной статистикой после каждой пачки
+    """
+    reader = DictReader(csv_file)
+    missing_columns = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing_columns:
+        raise OrderImportError(f'missing columns: {", ".join(missing_columns)}')
+
+    stats = ImportStats()
+    with transaction.atomic() if atomic else nullcontext():
+        for batch in iter_batches(reader, batch_size):
+            batch_stats = import_batch(batch)
+            stats = ImportStats(*(total + added for total, added in zip(stats, batch_stats)))
+            if on_batch is not None:
+                on_batch(stats)
+    return stats
+
@@ -0,0 +1,117 @@
+"""
+Модуль массового изменения состава заказов.
+
+Добавляет товары во множество заказов или убирает их оттуда пачками
+заказов: на пачку приходится один запрос существующих связей и одна
+вставка недостающих строк ``Order.products.through`` либо один DELETE,
+и всё это в одной транзакции.
+
+``m2m_changed`` описывает изменение одной записи, поэтому вместо него
+после каждой пачки один раз отправляется ``order_products_bulk_changed``
+с id затронутых заказов и товаров (см. обработчик в ``signals``)
+"""
+
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Set
+
+from django.db import transaction
+from django.dispatch import Signal
+
+from .models import Order, Product
+
+BULK_BATCH_SIZE = 500
+ACTIONS = 'add', 'remove'
+
+# sender=Order, action: 'add' or 'remove', order_ids and product_ids: sets of changed ids
+order_products_bulk_changed = Signal()
+
+
+class OrderProductsError(ValueError):
+    """ Ошибка в параметрах массового изменения заказов """
+
+
+class ChangeStats(NamedTuple):
+    """ Итог изменения: число изменённых заказов, добавленных или удалённых связей и пачек """
+    orders: int = 0
+    links: int = 0
+    batches: int = 0
+
+
+def check_ids(order_ids: Set[int], product_ids: Set[int]) -> None:
+    """ Проверяет, что все заказы и товары существуют, по запросу на модель """
+    for model, ids in ((Order, order_ids), (Product, product_ids)):
+        missing = ids - set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        if missing:
+            raise OrderProductsError(f'{model._meta.model_name}s with ids {sorted(missing)} do not exist')
+
+
+def iter_id_batches(ids: Iterable[int], batch_size: int) -> Iterator[List[int]]:
+    ids = iter(sorted(ids))
+    while True:
+        batch = list(islice(ids, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def change_batch(action: str, order_ids: List[int], product_ids: Set[int]) -> ChangeStats:
+    through = Order.products.through
+    links = through.objects.filter(order_id__in=order_ids, product_id__in=product_ids)
+    with transaction.atomic():
+        if action == 'add':
+            existing = set(links.values_list('order_id', 'product_id'))
+            created = through.objects.bulk_create(
+                through(order_id=order_id, product_id=product_id)
+                for order_id in order_ids
+                for product_id in sorted(product_ids)
+                if (order_id, product_id) not in existing
+            )
+            changed = {(link.order_id, link.product_id) for link in created}
+        else:
+            changed = set(links.values_list('order_id', 'product_id'))
+            links.delete()
+        if changed:
+            order_products_bulk_changed.send(
+                sender=Order,
+                action=action,
+                order_ids={order_id for order_id, _ in changed},
+                product_ids={product_id for _, product_id in changed},
+            )
+    return ChangeStats(orders=len({order_id for order_id, _ in changed}), links=len(changed), batches=1)
+
+
+def change_order_products(
+    action: str,
+    product_ids: Iterable[int],
+    order_ids: Optional[Iterable[int]] = None,
+    batch_size: int = BULK_BATCH_SIZE,
+    on_batch: Optional[Callable[[ChangeStats], None]] = None,
+) -> ChangeStats:
+    """
+    Добавляет товары ``product_ids`` в заказы ``order_ids`` или убирает их оттуда.
+
+    Без ``order_ids`` товары убираются из всех содержащих их заказов.
+    Каждая пачка из ``batch_size`` заказов фиксируется отдельно,
+    ``on_batch`` вызывается с накопленной статистикой после каждой пачки
+    """
+    if action not in ACTIONS:
+        raise OrderProductsError(f'unknown action {action!r}, expected one of {ACTIONS}')
+    product_ids = set(product_ids)
+    order_ids = None if order_ids is None else set(order_ids)
+    check_ids(order_ids or set(), product_ids)
+    if order_ids is None:
+        if action == 'add':
+            raise OrderProductsError('orders are required to add products')
+        order_ids = set(
+            Order.products.through.objects
+            .filter(product_id__in=product_ids)
+            .values_list('order_id', flat=True)
+        )
+
+    stats = ChangeStats()
+    for batch in iter_id_batches(order_ids, batch_size):
+        batch_stats = change_batch(action, batch, product_ids)
+        stats = ChangeStats(*(total + added for total, added in zip(stats, batch_stats)))
+        if on_batch is not None:
+            on_batch(stats)
+    return stats
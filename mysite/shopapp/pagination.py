@@ -0,0 +1,241 @@
+"""
+Модуль с классами пагинации приложения shopapp.
+
+В API список по умолчанию разбивается на страницы по номеру, как и раньше.
+Запрос с параметром ``pagination=cursor`` (или с ``cursor``, полученным
+из ссылок next/previous) переключает список в режим курсорной пагинации:
+без ``COUNT(*)`` и OFFSET, со стабильными страницами при вставке новых записей.
+Для HTML-страниц используется ``KeysetPaginator`` с тем же принципом
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+
+
+class ShopPageSizeMixin:
+    """ Разрешает клиенту выбрать размер страницы параметром page_size """
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self) -> int:
+        return settings.SHOP_API_MAX_PAGE_SIZE
+
+
+class ShopPageNumberPagination(ShopPageSizeMixin, PageNumberPagination):
+    pass
+
+
+class ShopCursorPagination(ShopPageSizeMixin, CursorPagination):
+    """
+    Курсорная пагинация по полям из ``?ordering=`` или по ``-pk``.
+
+    К сортировке добавляется pk в направлении первого поля, чтобы порядок
+    записей с одинаковыми значениями полей был однозначным
+    """
+    ordering = '-pk'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        for index, field in enumerate(ordering):
+            # fields after a unique one do not change the order
+            if field.lstrip('-') in ('pk', 'id'):
+                return ordering[:index + 1]
+        tiebreaker = '-pk' if ordering[0].startswith('-') else 'pk'
+        return ordering + (tiebreaker,)
+
+
+class ShopPagination(BasePagination):
+    """ Постраничная пагинация по умолчанию и курсорная по запросу клиента """
+    mode_query_param = 'pagination'
+
+    def __init__(self):
+        self.page_number_paginator = ShopPageNumberPagination()
+        self.cursor_paginator = ShopCursorPagination()
+        self.paginator = self.page_number_paginator
+
+    def use_cursor(self, request) -> bool:
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_paginator.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.paginator = self.cursor_paginator
+        else:
+            self.paginator = self.page_number_paginator
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    @property
+    def display_page_controls(self) -> bool:
+        return self.paginator.display_page_controls
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number_paginator.get_paginated_response_schema(schema)
+
+    def get_results(self, data):
+        return data['results']
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_schema_operation_parameters(self, view):
+        parameters = [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to "cursor" to use cursor pagination without total count',
+                'schema': {'type': 'string', 'enum': ['page', 'cursor']},
+            },
+        ]
+        seen = set()
+        for paginator in (self.page_number_paginator, self.cursor_paginator):
+            for parameter in paginator.get_schema_operation_parameters(view):
+                if parameter['name'] not in seen:
+                    seen.add(parameter['name'])
+                    parameters.append(parameter)
+        return parameters
+
+
+class InvalidCursor(ValueError):
+    """ Курсор из ссылки не удалось разобрать """
+
+
+class KeysetPage:
+    """ Страница keyset-пагинации с курсорами соседних страниц """
+
+    def __init__(self, object_list, next_cursor: Optional[str], previous_cursor: Optional[str]):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Keyset-пагинация для HTML-страниц.
+
+    Вместо номера страницы в ссылках передаётся курсор со значениями полей
+    сортировки крайней записи, и следующая страница выбирается условием
+    ``(поле1, поле2) > (значение1, значение2)`` по индексу, без COUNT и OFFSET.
+    Последнее поле сортировки должно быть уникальным, например pk
+    """
+
+    def __init__(self, queryset: QuerySet, ordering: Sequence[str], per_page: int):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+
+    @staticmethod
+    def encode_cursor(direction: str, values: Sequence) -> str:
+        data = json.dumps({'d': direction, 'v': [str(value) for value in values]})
+        return urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[str, List[str]]:
+        try:
+            data = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            direction, values = data['d'], data['v']
+        except (ValueError, TypeError, KeyError) as exc:
+            raise InvalidCursor(cursor) from exc
+        if direction not in ('next', 'previous') or not isinstance(values, list):
+            raise InvalidCursor(cursor)
+        return direction, values
+
+    def row_values(self, obj) -> List:
+        """ Значения полей сортировки записи: экземпляра модели или словаря из ``values()`` """
+        if isinstance(obj, dict):
+            return [obj[field.lstrip('-')] for field in self.ordering]
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def after_condition(self, values: Sequence, reverse: bool = False) -> Q:
+        """ Условие "запись идёт после ``values``" (или до них при ``reverse``) в порядке сортировки """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            ascending = not field.startswith('-')
+            lookup = 'gt' if ascending != reverse else 'lt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def parse_values(self, values: Sequence, cursor: str) -> List:
+        """ Приводит значения курсора к типам полей сортировки, чужие значения - ``InvalidCursor`` """
+        opts = self.queryset.model._meta
+        parsed = []
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            model_field = opts.pk if name == 'pk' else opts.get_field(name)
+            try:
+                value = model_field.to_python(value)
+            except (ValidationError, ValueError, TypeError) as exc:
+                raise InvalidCursor(cursor) from exc
+            # ordering fields are not nullable, and None cannot be compared in a filter
+            if value is None:
+                raise InvalidCursor(cursor)
+            parsed.append(value)
+        return parsed
+
+    def page_queryset(self, cursor: Optional[str] = None) -> Tuple[QuerySet, str]:
+        """ Запрос на одну запись больше страницы и направление, в котором он читает записи """
+        if not cursor:
+            return self.queryset.order_by(*self.ordering)[:self.per_page + 1], 'first'
+
+        direction, values = self.decode_cursor(cursor)
+        if len(values) != len(self.ordering):
+            raise InvalidCursor(cursor)
+        values = self.parse_values(values, cursor)
+        if direction == 'next':
+            queryset = self.queryset.filter(self.after_condition(values)).order_by(*self.ordering)
+        else:
+            reversed_ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+            queryset = self.queryset.filter(self.after_condition(values, reverse=True)).order_by(*reversed_ordering)
+        return queryset[:self.per_page + 1], direction
+
+    def get_page(self, cursor: Optional[str] = None) -> KeysetPage:
+        queryset, direction = self.page_queryset(cursor)
+        return self.make_page(list(queryset), direction)
+
+    async def aget_page(self, cursor: Optional[str] = None) -> KeysetPage:
+        """ Асинхронный вариант ``get_page`` для async-представлений """
+        queryset, direction = self.page_queryset(cursor)
+        return self.make_page([row async for row in queryset], direction)
+
+    def make_page(self, rows: List, direction: str) -> KeysetPage:
+        has_more, rows = len(rows) > self.per_page, rows[:self.per_page]
+        if direction == 'previous':
+            rows = rows[::-1]
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, direction == 'next'
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor('next', self.row_values(rows[-1]))
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor('previous', self.row_values(rows[0]))
+        return KeysetPage(rows, next_cursor, previous_cursor)
@@ -0,0 +1,94 @@
+"""
+Модуль полнотекстового поиска товаров.
+
+На SQLite названия и описания товаров хранятся в индексе FTS5
+``shopapp_product_fts`` (rowid совпадает с pk товара), который создаётся
+миграцией и обновляется сигналами при сохранении и удалении товаров.
+Поиск находит слова по префиксу и сортирует результат по релевантности,
+название весит больше описания. На других СУБД используется прежний поиск
+через ``icontains``
+"""
+
+import re
+from typing import Iterable, List
+
+from django.db import connections
+from django.db.models import QuerySet
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from .models import Product
+
+FTS_TABLE = 'shopapp_product_fts'
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def is_available(using: str = 'default') -> bool:
+    return connections[using].vendor == 'sqlite'
+
+
+def build_match_query(text: str) -> str:
+    """ Превращает строку поиска в запрос FTS5: все слова, каждое по префиксу """
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_queryset(queryset: QuerySet, text: str) -> QuerySet:
+    """ Оставляет в queryset товары, подходящие под строку поиска, лучшие первыми """
+    match = build_match_query(text)
+    if not match:
+        return queryset
+    table = queryset.model._meta.db_table
+    return (
+        queryset
+        .filter(pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+        .annotate(search_rank=RawSQL(
+            f'SELECT bm25({FTS_TABLE}, %s, %s) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.id',
+            [NAME_WEIGHT, DESCRIPTION_WEIGHT, match],
+        ))
+        .order_by('search_rank', 'pk')
+    )
+
+
+def index_products(products: Iterable[Product], using: str = 'default') -> None:
+    rows = [(product.pk, product.name, product.description) for product in products]
+    if not rows or not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+            rows,
+        )
+
+
+def remove_products(product_ids: List[int], using: str = 'default') -> None:
+    if not product_ids or not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [(pk,) for pk in product_ids],
+        )
+
+
+def rebuild_index(using: str = 'default') -> None:
+    if not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description) '
+            f'SELECT id, name, description FROM {Product._meta.db_table}'
+        )
+
+
+class ProductSearchFilter(SearchFilter):
+    """ Поиск ``?search=`` по индексу FTS5 вместо LIKE по всей таблице товаров """
+
+    def filter_queryset(self, request, queryset, view):
+        if not is_available(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+        text = ' '.join(self.get_search_terms(request))
+        return search_queryset(queryset, text)
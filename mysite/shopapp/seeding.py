@@ -0,0 +1,236 @@
+"""
+Модуль генерации больших наборов данных магазина для нагрузочных замеров.
+
+Создаёт пользователей с профилями, товары с изображениями, заказы и их связи
+с товарами пачками через ``bulk_create``, каждая пачка - в своей транзакции.
+Данные детерминированы значением ``seed``. Популярность товаров и активность
+пользователей задаются распределением: ``uniform`` - все равновероятны,
+``zipf`` - немногие товары и покупатели встречаются в большинстве заказов.
+
+``bulk_create`` не отправляет сигналы, поэтому поисковый индекс, число
+товаров в продаже, итоги заказов и отметки изменения списков обновляются
+здесь явно.
+Рендиции изображений создаёт команда ``generate_thumbnails``
+"""
+
+import random
+from bisect import bisect_left
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate, islice
+from time import perf_counter
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Sequence, TypeVar
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from myauth.models import Profile
+from . import search
+from .cache import adjust_available_products_count, touch_changed
+from .models import Order, Product, ProductImage, product_images_directory_path
+from .totals import update_order_totals
+
+DISTRIBUTIONS = 'uniform', 'zipf'
+ZIPF_EXPONENT = 1.1
+IMAGE_VARIANTS = 8
+
+T = TypeVar('T')
+
+
+class SeedConfig(NamedTuple):
+    users: int = 100
+    products: int = 1000
+    orders: int = 1000
+    min_products_per_order: int = 1
+    max_products_per_order: int = 5
+    images_per_product: int = 1
+    archived_share: float = 0.1
+    product_popularity: str = 'zipf'
+    user_activity: str = 'zipf'
+    # orders' creation_time is spread over this many last days
+    spread_days: int = 365
+    username_prefix: str = 'seed_user_'
+    seed: int = 0
+    batch_size: int = 1000
+
+
+class StageStats(NamedTuple):
+    name: str
+    rows: int
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Picker:
+    """ Случайный выбор из ``population`` по распределению ``distribution`` """
+
+    def __init__(self, rnd: random.Random, population: Sequence[int], distribution: str):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f'Unknown distribution {distribution!r}, expected one of {DISTRIBUTIONS}')
+        self.rnd = rnd
+        self.population = list(population)
+        self.cum_weights = None
+        if distribution == 'zipf':
+            # popular items are spread over the table, not the first rows
+            rnd.shuffle(self.population)
+            self.cum_weights = list(accumulate(1 / rank ** ZIPF_EXPONENT for rank in range(1, len(population) + 1)))
+
+    def pick(self) -> int:
+        if self.cum_weights is None:
+            return self.rnd.choice(self.population)
+        position = self.rnd.random() * self.cum_weights[-1]
+        return self.population[bisect_left(self.cum_weights, position)]
+
+    def sample(self, size: int) -> List[int]:
+        """ ``size`` разных значений, не больше размера совокупности """
+        size = min(size, len(self.population))
+        if self.cum_weights is None:
+            return self.rnd.sample(self.population, size)
+        picked = {}
+        while len(picked) < size:
+            picked.setdefault(self.pick(), None)
+        return list(picked)
+
+
+def make_image_variants(rnd: random.Random) -> List[bytes]:
+    """ Несколько небольших JPEG-изображений, которые раскладываются по товарам """
+    variants = []
+    for _ in range(IMAGE_VARIANTS):
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        output = BytesIO()
+        Image.new('RGB', (640, 480), color).save(output, 'JPEG', quality=80)
+        variants.append(output.getvalue())
+    return variants
+
+
+def timed(name: str, run: Callable[[], int]) -> StageStats:
+    started = perf_counter()
+    rows = run()
+    return StageStats(name, rows, perf_counter() - started)
+
+
+class ShopSeeder:
+    def __init__(self, config: SeedConfig):
+        self.config = config
+        self.rnd = random.Random(config.seed)
+        self.user_ids: List[int] = []
+        self.product_ids: List[int] = []
+
+    def create_users(self) -> int:
+        prefix, rows = self.config.username_prefix, 0
+        for numbers in batched(range(self.config.users), self.config.batch_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create(User(username=f'{prefix}{num}', password='!') for num in numbers)
+                Profile.objects.bulk_create(Profile(user=user) for user in users)
+            self.user_ids.extend(user.pk for user in users)
+            rows += 2 * len(users)
+        return rows
+
+    def create_products(self) -> int:
+        authors = Picker(self.rnd, self.user_ids, 'uniform')
+        available = 0
+        for numbers in batched(range(self.config.products), self.config.batch_size):
+            with transaction.atomic():
+                products = Product.objects.bulk_create(
+                    Product(
+                        name=f'Seed product {num}',
+                        description=f'Synthetic product number {num} for load tests',
+                        price=self.rnd.randint(100, 100000) / 100,
+                        discount=self.rnd.choice((0, 0, 0, 5, 10, 25)),
+                        archived=self.rnd.random() < self.config.archived_share,
+                        created_by_id=authors.pick(),
+                    )
+                    for num in numbers
+                )
+                search.index_products(products)
+                available += sum(not product.archived for product in products)
+            self.product_ids.extend(product.pk for product in products)
+        adjust_available_products_count(available)
+        touch_changed('products')
+        return len(self.product_ids)
+
+    def create_images(self) -> int:
+        if not self.config.images_per_product:
+            return 0
+        variants = make_image_variants(self.rnd)
+        rows = 0
+        for product_ids in batched(self.product_ids, self.config.batch_size):
+            images = []
+            for product_id in product_ids:
+                for num in range(self.config.images_per_product):
+                    image = ProductImage(product_id=product_id, description=f'Seed image {num}')
+                    name = product_images_directory_path(image, f'seed_{num}.jpg')
+                    image.image = default_storage.save(name, ContentFile(self.rnd.choice(variants)))
+                    images.append(image)
+            with transaction.atomic():
+                rows += len(ProductImage.objects.bulk_create(images))
+        touch_changed('products')
+        return rows
+
+    def create_orders(self) -> int:
+        config = self.config
+        customers = Picker(self.rnd, self.user_ids, config.user_activity)
+        products = Picker(self.rnd, self.product_ids, config.product_popularity)
+        through = Order.products.through
+        now = timezone.now()
+        rows = 0
+        for numbers in batched(range(config.orders), config.batch_size):
+            with transaction.atomic():
+                orders = Order.objects.bulk_create(
+                    Order(
+                        delivery_address=f'Seed street, {num}',
+                        promocode=self.rnd.choice(('', '', 'SEED10')),
+                        user_id=customers.pick(),
+                    )
+                    for num in numbers
+                )
+                # creation_time is auto_now_add, so it is spread in a second statement
+                if config.spread_days:
+                    for order in orders:
+                        order.creation_time = now - timedelta(minutes=self.rnd.randint(0, config.spread_days * 24 * 60))
+                    Order.objects.bulk_update(orders, ['creation_time'])
+                links = through.objects.bulk_create(
+                    through(order_id=order.pk, product_id=product_id)
+                    for order in orders
+                    for product_id in products.sample(
+                        self.rnd.randint(config.min_products_per_order, config.max_products_per_order)
+                    )
+                )
+                update_order_totals(order.pk for order in orders)
+            rows += len(orders) + len(links)
+        touch_changed('orders')
+        return rows
+
+    def run(self, on_stage: Optional[Callable[[StageStats], None]] = None) -> List[StageStats]:
+        stages = []
+        for name, step in (
+            ('users and profiles', self.create_users),
+            ('products', self.create_products),
+            ('product images', self.create_images),
+            ('orders and links', self.create_orders),
+        ):
+            stats = timed(name, step)
+            stages.append(stats)
+            if on_stage is not None:
+                on_stage(stats)
+        return stages
+
+
+def seed_shop(config: SeedConfig, on_stage: Optional[Callable[[StageStats], None]] = None) -> List[StageStats]:
+    return ShopSeeder(config).run(on_stage)
@@ -1,9 +1,130 @@
-from rest_framework.serializers import ModelSerializer
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
-from .models import Product, Order
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Prefetch, QuerySet
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import ManyRelatedField, RelatedField
+from rest_framework.serializers import (
+    BooleanField,
+    ChoiceField,
+    DictField,
+    Field,
+    IntegerField,
+    ListField,
+    ModelSerializer,
+    Serializer,
+)
 
+from .models import Product, Order, ProductImage
+from .order_products import ACTIONS
+from .thumbnails import rendition_url
+
+FieldsSpec = Optional[Iterable[str]]
+
+
+def split_fields(spec: FieldsSpec) -> Tuple[Optional[Set[str]], Dict[str, List[str]]]:
+    """
+    Делит список полей на поля верхнего уровня и вложенные.
+
+    ``['pk', 'products.price']`` -> ``({'pk', 'products'}, {'products': ['price']})``
+    """
+    if spec is None:
+        return None, {}
+    top, nested = set(), {}
+    for name in spec:
+        head, _, rest = name.partition('.')
+        top.add(head)
+        if rest:
+            nested.setdefault(head, []).append(rest)
+    return top, nested
+
+
+class DynamicFieldsMixin:
+    """
+    Сериализатор с выбором полей и раскрытием связей.
+
+    ``fields`` оставляет только перечисленные поля, вложенные указываются
+    через точку (``products.price``). ``expand`` выводит связи из
+    ``expandable_fields`` объектами вместо pk. Вложенные сериализаторы из
+    ``nested_serializers`` получают свою часть обоих списков
+    """
+    expandable_fields = {}
+    nested_serializers = {}
+
+    def __init__(self, *args, fields: FieldsSpec = None, expand: FieldsSpec = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.selected_fields, nested_fields = split_fields(fields)
+        self.expanded_fields, nested_expand = split_fields(expand or ())
+
+        unknown_expand = self.expanded_fields - set(self.expandable_fields) - set(self.nested_serializers)
+        if unknown_expand:
+            raise ValidationError({'expand': f'Unknown relations: {", ".join(sorted(unknown_expand))}'})
+        for name in self.expanded_fields & set(self.expandable_fields):
+            self.fields[name] = self.expandable_fields[name]()
+
+        if self.selected_fields is not None:
+            unknown_fields = self.selected_fields - set(self.fields)
+            if unknown_fields:
+                raise ValidationError({'fields': f'Unknown fields: {", ".join(sorted(unknown_fields))}'})
+            for name in set(self.fields) - self.selected_fields - self.expanded_fields:
+                self.fields.pop(name)
+
+        for name, serializer_class in self.nested_serializers.items():
+            if name in self.fields and (name in nested_fields or name in nested_expand):
+                self.fields[name] = serializer_class(
+                    many=True,
+                    read_only=True,
+                    fields=nested_fields.get(name),
+                    expand=nested_expand.get(name),
+                )
+
+
+class UserShortSerializer(ModelSerializer):
+    class Meta:
+        model = User
+        fields = [
+            'pk',
+            'username',
+        ]
+
+
+class RenditionsField(Field):
+    """ Адреса уменьшенных копий изображения по всем пресетам """
+
+    def __init__(self, **kwargs):
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, image: ProductImage) -> Dict[str, str]:
+        request = self.context.get('request')
+        urls = {}
+        for preset in settings.SHOP_THUMBNAIL_PRESETS:
+            url = rendition_url(image, preset)
+            urls[preset] = request.build_absolute_uri(url) if request is not None else url
+        return urls
+
+
+class ProductImageSerializer(ModelSerializer):
+    renditions = RenditionsField()
+
+    class Meta:
+        model = ProductImage
+        fields = [
+            'pk',
+            'image',
+            'description',
+            'renditions',
+        ]
+
+
+class ProductSerializer(DynamicFieldsMixin, ModelSerializer):
+    expandable_fields = {
+        'created_by': lambda: UserShortSerializer(read_only=True),
+        'images': lambda: ProductImageSerializer(many=True, read_only=True),
+    }
+    columns = 'name', 'description', 'price', 'discount', 'creation_time', 'updated_at', 'archived', 'created_by'
 
-class ProductSerializer(ModelSerializer):
     class Meta:
         model = Product
         fields = [
@@ -13,13 +134,49 @@ class ProductSerializer(ModelSerializer):
             'price',
             'discount',
             'creation_time',
+            'updated_at',
             'archived',
             'created_by',
             'images',
         ]
 
+    @classmethod
+    def setup_queryset(cls, queryset: QuerySet, fields: FieldsSpec = None, expand: FieldsSpec = None) -> QuerySet:
+        """ Загружает только нужные для выбранных полей колонки и связи """
+        selected, _ = split_fields(fields)
+        expanded, _ = split_fields(expand or ())
+        if selected is not None:
+            queryset = queryset.only('id', *(name for name in cls.columns if name in selected | expanded))
+        if 'created_by' in expanded:
+            queryset = queryset.select_related('created_by')
+        if 'images' in expanded:
+            queryset = queryset.prefetch_related('images')
+        elif selected is None or 'images' in selected:
+            queryset = queryset.prefetch_related(
+                Prefetch('images', queryset=ProductImage.objects.only('id', 'product_id'))
+            )
+        return queryset
+
+
+class OrderSerializer(DynamicFieldsMixin, ModelSerializer):
+    expandable_fields = {
+        'user': lambda: UserShortSerializer(read_only=True),
+    }
+    nested_serializers = {
+        'products': ProductSerializer,
+    }
+    columns = {
+        'delivery_address': 'delivery_address',
+        'promocode': 'promocode',
+        'creation_time': 'creation_time',
+        'updated_at': 'updated_at',
+        'user_id': 'user',
+        'user': 'user',
+        'subtotal': 'subtotal',
+        'total': 'total',
+        'products_count': 'products_count',
+    }
 
-class OrderSerializer(ModelSerializer):
     products = ProductSerializer(read_only=True, many=True)
 
     class Meta:
@@ -29,6 +186,231 @@ class OrderSerializer(ModelSerializer):
             'delivery_address',
             'promocode',
             'creation_time',
+            'updated_at',
+            'user_id',
+            'subtotal',
+            'total',
+            'products_count',
+            'products',
+        ]
+
+    @classmethod
+    def setup_queryset(cls, queryset: QuerySet, fields: FieldsSpec = None, expand: FieldsSpec = None) -> QuerySet:
+        """ Загружает только нужные для выбранных полей колонки и связи, включая товары """
+        selected, nested_fields = split_fields(fields)
+        expanded, nested_expand = split_fields(expand or ())
+        if selected is not None:
+            queryset = queryset.only('id', *{
+                column for name, column in cls.columns.items() if name in selected | expanded
+            })
+        if 'user' in expanded:
+            queryset = queryset.select_related('user')
+        if selected is None or 'products' in selected:
+            products = ProductSerializer.setup_queryset(
+                Product.objects.all(),
+                nested_fields.get('products'),
+                nested_expand.get('products'),
+            )
+            queryset = queryset.prefetch_related(Prefetch('products', queryset=products))
+        return queryset
+
+
+class OrderProductsBulkSerializer(Serializer):
+    """ Параметры массового добавления товаров в заказы или их удаления """
+    action = ChoiceField(choices=ACTIONS)
+    products = ListField(child=IntegerField(min_value=1), allow_empty=False)
+    orders = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        required=False,
+        help_text='Without orders, remove takes the products out of every order that has them',
+    )
+
+
+class ProductBulkSerializer(ModelSerializer):
+    """ Товар в массовом создании: автор передаётся id и проверяется одним запросом на пачку """
+    created_by_id = IntegerField(min_value=1)
+
+    class Meta:
+        model = Product
+        fields = [
+            'name',
+            'description',
+            'price',
+            'discount',
+            'archived',
+            'created_by_id',
+        ]
+
+
+class ProductBulkUpdateSerializer(ProductBulkSerializer):
+    """ Частичное изменение товара в массовом обновлении, ``pk`` обязателен """
+    pk = IntegerField(min_value=1)
+
+    class Meta(ProductBulkSerializer.Meta):
+        fields = ['pk', *ProductBulkSerializer.Meta.fields]
+
+
+class OrderBulkSerializer(ModelSerializer):
+    """ Заказ в массовом создании: покупатель и товары передаются id """
+    user_id = IntegerField(min_value=1)
+    products = ListField(child=IntegerField(min_value=1), required=False)
+
+    class Meta:
+        model = Order
+        fields = [
+            'delivery_address',
+            'promocode',
             'user_id',
             'products',
         ]
+
+
+class OrderBulkUpdateSerializer(ModelSerializer):
+    """ Частичное изменение заказа в массовом обновлении, ``pk`` обязателен """
+    pk = IntegerField(min_value=1)
+    user_id = IntegerField(min_value=1)
+
+    class Meta:
+        model = Order
+        fields = [
+            'pk',
+            'delivery_address',
+            'promocode',
+            'user_id',
+        ]
+
+
+class BulkArchiveSerializer(Serializer):
+    """ Параметры массовой архивации товаров """
+    pks = ListField(child=IntegerField(min_value=1), allow_empty=False)
+    archived = BooleanField(default=True, help_text='false returns the products to sale')
+
+
+class BulkItemErrorSerializer(Serializer):
+    index = IntegerField(help_text='Position of the item in the request list')
+    errors = DictField()
+
+
+class BulkResultSerializer(Serializer):
+    """ Ответ массовых операций """
+    count = IntegerField()
+    pks = ListField(child=IntegerField())
+    errors = BulkItemErrorSerializer(many=True)
+
+
+class ValuesSerializer:
+    """
+    Быстрая сериализация списков из словарей ``QuerySet.values()``.
+
+    Не создаёт экземпляры моделей: каждая колонка приводится к представлению
+    тем же полем DRF, что и в ``model_serializer_class``, поэтому результат
+    совпадает с ответом обычного сериализатора без раскрытых связей.
+    Связи "многие ко многим" подгружаются одним запросом на всю страницу
+    """
+    model_serializer_class = None
+
+    def __init__(self, fields: FieldsSpec = None):
+        self.selected_fields, self.nested_fields = split_fields(fields)
+        serializer = self.model_serializer_class(fields=fields)
+        self.columns, self.related = {}, []
+        for name, field in serializer.fields.items():
+            if isinstance(field, ManyRelatedField) or getattr(field, 'many', False):
+                self.related.append(name)
+            else:
+                self.columns[name] = field
+
+    def values(self, queryset: QuerySet, extra_sources: Iterable[str] = ()) -> QuerySet:
+        """ ``extra_sources`` - колонки, нужные помимо выводимых, например для сортировки """
+        sources = dict.fromkeys(['pk', *(field.source for field in self.columns.values()), *extra_sources])
+        return queryset.select_related(None).prefetch_related(None).values(*sources)
+
+    def to_representation(self, rows: List[Dict]) -> List[Dict]:
+        pks = [row['pk'] for row in rows]
+        related = {name: getattr(self, f'load_{name}')(pks) for name in self.related}
+        return self.represent(rows, related)
+
+    async def ato_representation(self, rows: List[Dict]) -> List[Dict]:
+        """ Асинхронный вариант: связи подгружаются методами ``aload_<поле>`` """
+        pks = [row['pk'] for row in rows]
+        related = {name: await getattr(self, f'aload_{name}')(pks) for name in self.related}
+        return self.represent(rows, related)
+
+    def represent(self, rows: List[Dict], related: Dict[str, Dict]) -> List[Dict]:
+        data = []
+        for row in rows:
+            item = {}
+            for name, field in self.columns.items():
+                value = row[field.source]
+                if value is not None and not isinstance(field, RelatedField):
+                    value = field.to_representation(value)
+                item[name] = value
+            for name in self.related:
+                item[name] = related[name].get(row['pk'], [])
+            data.append(item)
+        return data
+
+    def serialize_by_pk(self, queryset: QuerySet) -> Dict[int, Dict]:
+        rows = list(self.values(queryset))
+        return {row['pk']: item for row, item in zip(rows, self.to_representation(rows))}
+
+    async def aserialize_by_pk(self, queryset: QuerySet) -> Dict[int, Dict]:
+        rows = [row async for row in self.values(queryset)]
+        return {row['pk']: item for row, item in zip(rows, await self.ato_representation(rows))}
+
+
+def group_pairs(pairs: Iterable[Tuple[int, Any]]) -> Dict[int, List]:
+    """ ``[(1, a), (1, b), (2, c)]`` -> ``{1: [a, b], 2: [c]}`` """
+    groups = {}
+    for key, value in pairs:
+        groups.setdefault(key, []).append(value)
+    return groups
+
+
+class ProductValuesSerializer(ValuesSerializer):
+    model_serializer_class = ProductSerializer
+
+    @staticmethod
+    def images_queryset(product_pks: List[int]) -> QuerySet:
+        return (
+            ProductImage.objects
+            .filter(product_id__in=product_pks)
+            .order_by('pk')
+            .values_list('product_id', 'pk')
+        )
+
+    def load_images(self, product_pks: List[int]) -> Dict[int, List[int]]:
+        return group_pairs(self.images_queryset(product_pks))
+
+    async def aload_images(self, product_pks: List[int]) -> Dict[int, List[int]]:
+        return group_pairs([row async for row in self.images_queryset(product_pks)])
+
+
+class OrderValuesSerializer(ValuesSerializer):
+    model_serializer_class = OrderSerializer
+
+    @staticmethod
+    def links_queryset(order_pks: List[int]) -> QuerySet:
+        return (
+            Order.products.through.objects
+            .filter(order_id__in=order_pks)
+            .order_by('product__price', 'product_id')
+            .values_list('order_id', 'product_id')
+        )
+
+    def products_reader(self) -> ProductValuesSerializer:
+        return ProductValuesSerializer(fields=self.nested_fields.get('products'))
+
+    def load_products(self, order_pks: List[int]) -> Dict[int, List[Dict]]:
+        links = list(self.links_queryset(order_pks))
+        products = self.products_reader().serialize_by_pk(
+            Product.objects.filter(pk__in={product_id for _, product_id in links})
+        )
+        return group_pairs((order_id, products[product_id]) for order_id, product_id in links)
+
+    async def aload_products(self, order_pks: List[int]) -> Dict[int, List[Dict]]:
+        links = [link async for link in self.links_queryset(order_pks)]
+        products = await self.products_reader().aserialize_by_pk(
+            Product.objects.filter(pk__in={product_id for _, product_id in links})
+        )
+        return group_pairs((order_id, products[product_id]) for order_id, product_id in links)
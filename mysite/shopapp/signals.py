@@ -0,0 +1,172 @@
+"""
+Модуль с обработчиками сигналов моделей приложения shopapp.
+
+Следит за изменениями заказов, их состава и товаров и сбрасывает
+кеш заказов только тех пользователей, которых эти изменения касаются.
+Также поддерживает в актуальном состоянии поисковый индекс товаров,
+закешированное число товаров в продаже, поле ``updated_at``, итоги
+заказов (см. ``totals``) и отметки изменения списков (см. ``cache.get_changed``)
+при изменениях, которые не проходят через ``save()`` самой записи
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.db.models import QuerySet
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import search, thumbnails
+from .cache import (
+    adjust_available_products_count,
+    invalidate_products_orders,
+    invalidate_user_orders,
+    touch_changed,
+)
+from .models import Order, Product, ProductImage
+from .order_products import order_products_bulk_changed
+from .totals import product_order_ids, update_order_totals
+
+
+@receiver(post_init, sender=Order)
+def remember_order_user(sender, instance: Order, **kwargs):
+    # user_id may be deferred, reading it through the attribute would query the database
+    instance._loaded_user_id = instance.__dict__.get('user_id')
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance: Order, **kwargs):
+    invalidate_user_orders({instance.user_id, instance._loaded_user_id} - {None})
+    instance._loaded_user_id = instance.user_id
+    touch_changed('orders')
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance: Order, **kwargs):
+    invalidate_user_orders([instance.user_id])
+    touch_changed('orders')
+
+
+def touch_orders(orders: QuerySet) -> None:
+    orders.update(updated_at=timezone.now())
+    touch_changed('orders')
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def order_products_changed(sender, instance, action: str, reverse: bool, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_user_orders([instance.user_id])
+            touch_orders(Order.objects.filter(pk=instance.pk))
+            update_order_totals([instance.pk])
+        return
+
+    # product.orders.add/remove/clear: instance is a product, pk_set holds order ids
+    if action == 'pre_clear':
+        invalidate_products_orders([instance.pk])
+        touch_orders(Order.objects.filter(products=instance))
+        instance._cleared_order_ids = list(product_order_ids([instance.pk]))
+    elif action == 'post_clear':
+        update_order_totals(instance._cleared_order_ids)
+    elif action in ('post_add', 'post_remove'):
+        invalidate_user_orders(
+            Order.objects.filter(pk__in=pk_set).values_list('user_id', flat=True)
+        )
+        touch_orders(Order.objects.filter(pk__in=pk_set))
+        update_order_totals(pk_set)
+
+
+@receiver(order_products_bulk_changed, sender=Order)
+def orders_products_bulk_changed(sender, order_ids, **kwargs):
+    orders = Order.objects.filter(pk__in=order_ids)
+    invalidate_user_orders(orders.values_list('user_id', flat=True))
+    touch_orders(orders)
+    update_order_totals(order_ids)
+
+
+@receiver(post_init, sender=Product)
+def remember_product_archived(sender, instance: Product, **kwargs):
+    instance._loaded_archived = instance.__dict__.get('archived')
+    instance._loaded_pricing = instance.__dict__.get('price'), instance.__dict__.get('discount')
+
+
+def load_product_archived(instance: Product, using: str) -> None:
+    # archived was deferred on load, fetch the stored value before it is overwritten
+    if instance._loaded_archived is None and instance.pk is not None:
+        instance._loaded_archived = (
+            Product.objects.using(using)
+            .filter(pk=instance.pk)
+            .values_list('archived', flat=True)
+            .first()
+        )
+
+
+@receiver(pre_save, sender=Product)
+def product_saving(sender, instance: Product, using: str, **kwargs):
+    if not instance._state.adding:
+        load_product_archived(instance, using)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance: Product, created: bool, using: str, **kwargs):
+    search.index_products([instance], using=using)
+    was_available = instance._loaded_archived is False and not created
+    adjust_available_products_count(int(not instance.archived) - int(was_available))
+    instance._loaded_archived = instance.archived
+    touch_changed('products')
+    if not created:
+        invalidate_products_orders([instance.pk])
+        # deferred price or discount compare unequal, the totals are recalculated then
+        if (instance.price, instance.discount) != instance._loaded_pricing:
+            update_order_totals(product_order_ids([instance.pk]))
+    instance._loaded_pricing = instance.price, instance.discount
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleted(sender, instance: Product, using: str, **kwargs):
+    load_product_archived(instance, using)
+    if instance._loaded_archived is False:
+        adjust_available_products_count(-1)
+    invalidate_products_orders([instance.pk])
+    # the product disappears from its orders without m2m_changed
+    touch_orders(Order.objects.filter(products=instance))
+    instance._order_ids = list(product_order_ids([instance.pk]))
+
+
+@receiver(post_delete, sender=Product)
+def product_removed(sender, instance: Product, using: str, **kwargs):
+    search.remove_products([instance.pk], using=using)
+    touch_changed('products')
+    update_order_totals(instance._order_ids)
+
+
+@receiver(post_init, sender=ProductImage)
+def remember_image_name(sender, instance: ProductImage, **kwargs):
+    image = instance.__dict__.get('image')
+    instance._loaded_image_name = getattr(image, 'name', image)
+
+
+@receiver(pre_save, sender=ProductImage)
+def product_image_saving(sender, instance: ProductImage, **kwargs):
+    # renditions of the replaced file must not be served for the new one
+    if not instance._state.adding and instance.image.name != instance._loaded_image_name:
+        thumbnails.delete_renditions(instance)
+        instance.renditions = {}
+
+
+@receiver(post_save, sender=ProductImage)
+def product_image_saved(sender, instance: ProductImage, **kwargs):
+    if instance.image.name != instance._loaded_image_name or not instance.renditions:
+        thumbnails.enqueue(instance.pk)
+    instance._loaded_image_name = instance.image.name
+
+
+@receiver(post_delete, sender=ProductImage)
+def product_image_deleted(sender, instance: ProductImage, **kwargs):
+    thumbnails.delete_renditions(instance)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance: ProductImage, **kwargs):
+    invalidate_products_orders([instance.product_id])
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+    touch_changed('products')
@@ -1,25 +1,60 @@
+"""
+Модуль с картами сайта приложения shopapp.
+
+Разделы читают только ``pk`` и ``creation_time`` через ``values()``
+и делятся на страницы по ``limit`` адресов, а дата последнего изменения
+раздела для индекса считается одним агрегатным запросом
+"""
+
+from datetime import datetime
+from typing import Dict, Optional
+
 from django.contrib.sitemaps import Sitemap
+from django.db.models import Max, QuerySet
+from django.urls import reverse
 
 from .models import Product, Order
 
 
-class ShopProductSitemap(Sitemap):
+class ShopSitemap(Sitemap):
+    """ Раздел карты сайта по словарям ``values('pk', 'creation_time')`` записей ``model`` """
     changefreq = 'never'
     priority = 0.5
+    limit = 5000
+    model = None
+    url_name = None
+    ordering = 'pk',
+    # name of the change stamp in shopapp.cache bumped when the section changes
+    stamp = None
+
+    def queryset(self) -> QuerySet:
+        return self.model._default_manager.all()
 
     def items(self):
-        return Product.objects.filter(archived=False).order_by('name')
+        return self.queryset().order_by(*self.ordering).values('pk', 'creation_time')
 
-    def lastmod(self, obj: Product):
-        return obj.creation_time
+    def location(self, item: Dict) -> str:
+        return reverse(self.url_name, kwargs={'pk': item['pk']})
 
+    def lastmod(self, item: Dict) -> datetime:
+        return item['creation_time']
 
-class ShopOrderSitemap(Sitemap):
-    changefreq = 'never'
-    priority = 0.5
+    def get_latest_lastmod(self) -> Optional[datetime]:
+        return self.queryset().aggregate(latest=Max('creation_time'))['latest']
+
+
+class ShopProductSitemap(ShopSitemap):
+    model = Product
+    url_name = 'shopapp:product_details'
+    ordering = 'name', 'pk'
+    stamp = 'products'
+
+    def queryset(self) -> QuerySet:
+        return super().queryset().filter(archived=False)
 
-    def items(self):
-        return Order.objects.order_by('creation_time')
 
-    def lastmod(self, obj: Order):
-        return obj.creation_time
+class ShopOrderSitemap(ShopSitemap):
+    model = Order
+    url_name = 'shopapp:order_details'
+    ordering = 'creation_time', 'pk'
+    stamp = 'orders'
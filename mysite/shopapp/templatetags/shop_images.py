@@ -0,0 +1,12 @@
+from django import template
+
+from shopapp.models import ProductImage
+from shopapp.thumbnails import rendition_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition(image: ProductImage, preset: str) -> str:
+    """ ``{% rendition img 'medium' %}`` - адрес уменьшенной копии изображения товара """
+    return rendition_url(image, preset)
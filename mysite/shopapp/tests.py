@@ -1,8 +1,59 @@
+import csv
+import json
+import logging
+import re
+import tempfile
+from base64 import urlsafe_b64encode
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO, StringIO
+from os import getenv
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib import admin
 from django.contrib.auth.models import User, Permission
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.http import HttpResponse
+from django.db import connection
+from django.db.models import Count, QuerySet
+from django.db.models.signals import m2m_changed
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.views import View
 from django.shortcuts import reverse
-from .models import Order
+from myauth.models import Profile
+from mysite.log import BackgroundHandler, JsonFormatter, SamplingFilter, parse_sample_rates
+from mysite.media import serve_media
+from mysite.metrics import MetricsMiddleware, get_metrics
+from mysite.tracing import traces_sampler, view_name_for_path
+from .bulk import create_products
+from .benchmarks import DatasetScale, build_dataset, load_budgets, measure_views, save_budgets
+from .admin import OrderInline, ProductInline, mark_archived, mark_unarchived
+from .cache import (
+    available_products_count_key,
+    get_available_products_count,
+    get_cache,
+    user_orders_export_key,
+    user_orders_fragment_key,
+)
+from .conditional import ConditionalGetMixin
+from .export import iter_order_chunks
+from .models import Order, Product, ProductImage
+from .order_import import OrderImportError, import_orders
+from .order_products import OrderProductsError, change_order_products, order_products_bulk_changed
+from .seeding import SeedConfig, seed_shop
+from .serializers import OrderSerializer, ProductSerializer
+from .sitemap import ShopOrderSitemap, ShopProductSitemap
+from .thumbnails import generate_renditions
+from .totals import discounted_price
+from .pagination import InvalidCursor, KeysetPaginator
+from .views import LatestProductsFeed, OrderListView, ProductListView
 from django.conf import settings
+from PIL import Image
 
 
 class OrderDetailViewTestCase(TestCase):
@@ -91,3 +142,1431 @@ class OrdersExportTestCase(TestCase):
         self.user.save()
         response = self.client.get(self.aim_url)
         self.assertEqual(response.status_code, 403)
+
+
+@override_settings(LANGUAGE_CODE='en')
+class OrdersStreamingExportTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test streaming export', password='testexport', is_staff=True)
+        cls.products = [
+            Product.objects.create(name=f'product {num}', price=num, created_by=cls.user)
+            for num in range(1, 4)
+        ]
+        cls.orders = []
+        for num in range(5):
+            order = Order.objects.create(
+                delivery_address=f'address {num}',
+                promocode=f'PROMO{num}',
+                user=cls.user,
+            )
+            order.products.set(cls.products[:num % 3 + 1])
+            cls.orders.append(order)
+        cls.aim_url = reverse('shopapp:export_order')
+
+    def setUp(self) -> None:
+        self.client.force_login(self.user)
+
+    def expected_rows(self):
+        return [
+            {
+                'pk': order.pk,
+                'delivery_address': order.delivery_address,
+                'promocode': order.promocode,
+                'user_id': order.user.pk,
+                'products_id': [product.pk for product in order.products.all()],
+            }
+            for order in Order.objects.order_by('pk')
+        ]
+
+    def get_streamed(self, export_format: str) -> str:
+        response = self.client.get(self.aim_url, {'format': export_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_chunks_query_count(self):
+        with self.assertNumQueries(7):
+            chunks = list(iter_order_chunks(chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual([row for chunk in chunks for row in chunk], self.expected_rows())
+
+    def test_stream_json(self):
+        self.assertEqual(json.loads(self.get_streamed('json')), {'orders': self.expected_rows()})
+
+    def test_stream_ndjson(self):
+        lines = self.get_streamed('ndjson').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected_rows())
+
+    def test_stream_csv(self):
+        rows = list(csv.DictReader(self.get_streamed('csv').splitlines()))
+        self.assertEqual(
+            [row['products'] for row in rows],
+            [','.join(map(str, row['products_id'])) for row in self.expected_rows()],
+        )
+        self.assertEqual(rows[0]['delivery_address'], 'address 0')
+
+    def test_unknown_format(self):
+        response = self.client.get(self.aim_url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class OrdersImportTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test orders import', password='testimport')
+        cls.products = [
+            Product.objects.create(name=f'product {num}', price=num, created_by=cls.user)
+            for num in range(1, 4)
+        ]
+
+    def make_csv(self, rows) -> str:
+        lines = ['delivery_address,promocode,user_id,products']
+        lines.extend(
+            f'"same street, 1",PROMO,{user_id},"{",".join(map(str, product_ids))}"'
+            for user_id, product_ids in rows
+        )
+        return '\n'.join(lines) + '\n'
+
+    def test_import_links_each_order(self):
+        first, second, third = (product.pk for product in self.products)
+        rows = [
+            (self.user.pk, [first]),
+            (self.user.pk, [second, third]),
+            (self.user.pk, [first, third]),
+        ]
+        # per batch: users and products lookups, orders insert, links insert, totals select and update
+        with self.assertNumQueries(2 * 6 + 2 * 2):
+            stats = import_orders(StringIO(self.make_csv(rows)), batch_size=2)
+        self.assertEqual(stats.orders, 3)
+        self.assertEqual(stats.links, 5)
+        self.assertEqual(stats.batches, 2)
+        orders = Order.objects.order_by('pk').prefetch_related('products')
+        self.assertEqual(
+            [sorted(product.pk for product in order.products.all()) for order in orders],
+            [sorted(product_ids) for _, product_ids in rows],
+        )
+
+    def test_import_unknown_product(self):
+        csv_data = self.make_csv([(self.user.pk, [self.products[0].pk]), (self.user.pk, [0])])
+        with self.assertRaisesMessage(OrderImportError, 'Line 3: products with ids [0] do not exist'):
+            import_orders(StringIO(csv_data), atomic=True)
+        self.assertFalse(Order.objects.exists())
+
+    def test_import_orders_command(self):
+        csv_data = self.make_csv([(self.user.pk, [product.pk]) for product in self.products])
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as csv_file:
+            csv_file.write(csv_data)
+            csv_file.flush()
+            call_command('import_orders', csv_file.name, batch_size=2, stdout=StringIO())
+        self.assertEqual(Order.objects.count(), 3)
+        with self.assertRaises(CommandError):
+            call_command('import_orders', '/nonexistent/orders.csv', stdout=StringIO())
+
+
+@override_settings(LANGUAGE_CODE='en')
+class UserOrdersExportCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test cached export', password='testexport')
+        product = Product.objects.create(name='cached product', price=10, created_by=cls.user)
+        cls.order = Order.objects.create(delivery_address='cached address', user=cls.user)
+        cls.order.products.add(product)
+        cls.aim_url = reverse('shopapp:export_orders_by_user', kwargs={'user_id': cls.user.pk})
+
+    def setUp(self) -> None:
+        get_cache().clear()
+        self.client.force_login(self.user)
+
+    def test_export_is_cached(self):
+        response = self.client.get(self.aim_url)
+        self.assertContains(response, 'cached address')
+        cached = get_cache().get(user_orders_export_key(self.user.pk))
+        self.assertEqual([order['pk'] for order in cached], [self.order.pk])
+        with self.assertNumQueries(1):  # user only, the session is in the cache
+            response = self.client.get(self.aim_url)
+        self.assertContains(response, 'cached address')
+
+
+class UserOrdersCacheInvalidationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test invalidation', password='testinvalidation')
+        cls.other_user = User.objects.create_user(username='test invalidation other', password='testinvalidation')
+        cls.product = Product.objects.create(name='invalidated product', price=10, created_by=cls.user)
+        cls.order = Order.objects.create(delivery_address='invalidated address', user=cls.user)
+        cls.order.products.add(cls.product)
+
+    def setUp(self) -> None:
+        self.cache = get_cache()
+        self.cache.clear()
+        for user in (self.user, self.other_user):
+            self.cache.set(user_orders_export_key(user.pk), ['cached'])
+            self.cache.set(user_orders_fragment_key(user.pk), 'cached')
+
+    def assertEvicted(self, user: User, evicted: bool = True):
+        keys = user_orders_export_key(user.pk), user_orders_fragment_key(user.pk)
+        self.assertEqual(self.cache.get_many(keys) == {}, evicted)
+
+    def test_order_created(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(delivery_address='new address', user=self.user)
+        self.assertEvicted(self.user)
+        self.assertEvicted(self.other_user, False)
+
+    def test_order_moved_to_other_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.get(pk=self.order.pk)
+            order.user = self.other_user
+            order.save()
+        self.assertEvicted(self.user)
+        self.assertEvicted(self.other_user)
+
+    def test_order_products_changed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.products.remove(self.product)
+        self.assertEvicted(self.user)
+        self.assertEvicted(self.other_user, False)
+
+    def test_order_products_edited_in_admin_inline(self):
+        request = RequestFactory().post('/')
+        request.user = User.objects.create_superuser(username='test invalidation admin', password='testinvalidation')
+        other_product = Product.objects.create(name='other invalidated product', price=5, created_by=self.user)
+        link = Order.products.through.objects.get(order=self.order, product=self.product)
+        stamp = Order.objects.get(pk=self.order.pk).updated_at
+        self.setUp()
+        formset_class = ProductInline(Order, admin.site).get_formset(request, self.order)
+        formset = formset_class({
+            'Order_products-TOTAL_FORMS': 2,
+            'Order_products-INITIAL_FORMS': 1,
+            'Order_products-0-id': link.pk,
+            'Order_products-0-order': self.order.pk,
+            'Order_products-0-product': self.product.pk,
+            'Order_products-0-DELETE': 'on',
+            'Order_products-1-order': self.order.pk,
+            'Order_products-1-product': other_product.pk,
+        }, instance=self.order)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            formset.save()
+        self.assertQuerysetEqual(self.order.products.all(), [other_product])
+        self.assertEvicted(self.user)
+        self.assertEvicted(self.other_user, False)
+        self.assertGreater(Order.objects.get(pk=self.order.pk).updated_at, stamp)
+
+    def test_product_orders_cleared(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.orders.clear()
+        self.assertEvicted(self.user)
+
+    def test_product_price_changed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 20
+            self.product.save()
+        self.assertEvicted(self.user)
+        self.assertEvicted(self.other_user, False)
+
+    def test_orders_imported(self):
+        csv_data = (
+            'delivery_address,promocode,user_id,products\n'
+            f'imported address,,{self.other_user.pk},{self.product.pk}\n'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            import_orders(StringIO(csv_data))
+        self.assertEvicted(self.user, False)
+        self.assertEvicted(self.other_user)
+
+
+@override_settings(LANGUAGE_CODE='en', SHOP_API_MAX_PAGE_SIZE=4)
+class ApiCursorPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test cursor', password='testcursor')
+        cls.products = [
+            Product.objects.create(name=f'product {num}', price=num // 2, created_by=cls.user)
+            for num in range(7)
+        ]
+        cls.aim_url = reverse('shopapp:product-list')
+
+    def collect_pages(self, params: dict, on_first_page=None) -> list:
+        response = self.client.get(self.aim_url, params)
+        pages = [response.json()]
+        if on_first_page is not None:
+            on_first_page()
+        while pages[-1]['next']:
+            pages.append(self.client.get(pages[-1]['next']).json())
+        return pages
+
+    def test_page_number_by_default(self):
+        response = self.client.get(self.aim_url)
+        self.assertEqual(response.json()['count'], 7)
+
+    def test_cursor_skips_count(self):
+        with self.assertNumQueries(2):  # products and images prefetch
+            response = self.client.get(self.aim_url, {'pagination': 'cursor', 'page_size': 3})
+        self.assertNotIn('count', response.json())
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_cursor_ordering_with_ties(self):
+        pages = self.collect_pages({'pagination': 'cursor', 'ordering': 'price', 'page_size': 2})
+        pks = [product['pk'] for page in pages for product in page['results']]
+        self.assertEqual(pks, [product.pk for product in sorted(self.products, key=lambda p: (p.price, p.pk))])
+
+    def test_cursor_ordering_by_several_fields(self):
+        pages = self.collect_pages({'pagination': 'cursor', 'ordering': 'price,-name', 'page_size': 2})
+        pks = [product['pk'] for page in pages for product in page['results']]
+        products = sorted(self.products, key=lambda p: p.name, reverse=True)
+        self.assertEqual(pks, [product.pk for product in sorted(products, key=lambda p: p.price)])
+
+    def test_cursor_stable_under_inserts(self):
+        def insert_product():
+            Product.objects.create(name='inserted', price=100, created_by=self.user)
+
+        pages = self.collect_pages({'pagination': 'cursor', 'page_size': 3}, insert_product)
+        pks = [product['pk'] for page in pages for product in page['results']]
+        self.assertEqual(pks, [product.pk for product in reversed(self.products)])
+
+    def test_page_size_cap(self):
+        response = self.client.get(self.aim_url, {'pagination': 'cursor', 'page_size': 100})
+        self.assertEqual(len(response.json()['results']), 4)
+
+
+@override_settings(LANGUAGE_CODE='en')
+class ApiFieldSelectionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test fields', password='testfields')
+        cls.products = [
+            Product.objects.create(name=f'product {num}', description='text', price=num, created_by=cls.user)
+            for num in range(1, 4)
+        ]
+        ProductImage.objects.create(product=cls.products[0], image='products/test.jpg')
+        for num in range(3):
+            order = Order.objects.create(delivery_address=f'address {num}', user=cls.user)
+            order.products.set(cls.products[num:])
+        cls.products_url = reverse('shopapp:product-list')
+        cls.orders_url = reverse('shopapp:order-list')
+
+    def test_fast_list_matches_serializer(self):
+        response = self.client.get(self.products_url)
+        expected = ProductSerializer(Product.objects.order_by('-pk'), many=True).data
+        self.assertEqual(
+            sorted(response.json()['results'], key=lambda item: item['pk']),
+            sorted(json.loads(json.dumps(expected)), key=lambda item: item['pk']),
+        )
+        response = self.client.get(self.orders_url)
+        expected = OrderSerializer(Order.objects.all(), many=True).data
+        self.assertEqual(
+            sorted(response.json()['results'], key=lambda item: item['pk']),
+            sorted(json.loads(json.dumps(expected)), key=lambda item: item['pk']),
+        )
+
+    def test_sparse_fields(self):
+        with self.assertNumQueries(2):  # count and products
+            response = self.client.get(self.products_url, {'fields': 'pk,price'})
+        self.assertEqual(set(response.json()['results'][0]), {'pk', 'price'})
+
+    def test_nested_sparse_fields(self):
+        with self.assertNumQueries(4):  # count, orders, links and products
+            response = self.client.get(self.orders_url, {'fields': 'pk,products.pk,products.price'})
+        order = response.json()['results'][0]
+        self.assertEqual(set(order), {'pk', 'products'})
+        self.assertEqual(set(order['products'][0]), {'pk', 'price'})
+
+    def test_expand(self):
+        product = self.products[0]
+        response = self.client.get(
+            reverse('shopapp:product-detail', kwargs={'pk': product.pk}),
+            {'fields': 'pk', 'expand': 'created_by,images'},
+        )
+        data = response.json()
+        self.assertEqual(data['created_by'], {'pk': self.user.pk, 'username': self.user.username})
+        self.assertEqual(len(data['images']), 1)
+        self.assertIn('image', data['images'][0])
+
+    def test_unknown_field(self):
+        response = self.client.get(self.products_url, {'fields': 'pk,secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(LANGUAGE_CODE='en')
+class ProductSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='test search', password='testsearch')
+        cls.guitar = Product.objects.create(name='Гитара', description='Акустическая', created_by=cls.user)
+        cls.strings = Product.objects.create(name='Струны', description='Для гитары', created_by=cls.user)
+        cls.hat = Product.objects.create(name='Шляпа', description='Фетровая', created_by=cls.user)
+        cls.aim_url = reverse('shopapp:product-list')
+
+    def search(self, text: str) -> list:
+        response = self.client.get(self.aim_url, {'search': text, 'fields': 'pk'})
+        return [product['pk'] for product in response.json()['results']]
+
+    def test_prefix_search_ranked(self):
+        self.assertEqual(self.search('гитар'), [self.guitar.pk, self.strings.pk])
+
+    def test_all_words_required(self):
+        self.assertEqual(self.search('струны гит'), [self.strings.pk])
+
+    def test_index_follows_changes(self):
+        self.hat.name = 'Кепка'
+        self.hat.save()
+        self.assertEqual(self.search('шляп'), [])
+        self.assertEqual(self.search('кепк'), [self.hat.pk])
+        self.guitar.delete()
+        self.assertEqual(self.search('гитар'), [self.strings.pk])
+
+    def test_admin_search(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin:shopapp_product_changelist'), {'q': 'фетр'})
+        self.assertContains(response, 'Шляпа')
+        self.assertNotContains(response, 'Струны')
+
+    def test_admin_search_ranked(self):
+        Product.objects.filter(pk=self.guitar.pk).update(price=100)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin:shopapp_product_changelist'), {'q': 'гитар'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.guitar, self.strings])
+        # a column chosen by the user still wins
+        response = self.client.get(reverse('admin:shopapp_product_changelist'), {'q': 'гитар', 'o': '4'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.strings, self.guitar])
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Проверяет планы запросов горячих представлений: ни один из них
+    не должен читать таблицы магазина полным сканированием
+    """
+    full_scan = re.compile(r'\bSCAN (shopapp_\w+)\s*$', re.MULTILINE)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test query plans', password='testplans')
+
+    def assertNoFullScan(self, queryset):
+        plan = queryset.explain()
+        self.assertIsNone(self.full_scan.search(plan), f'Full table scan in plan:\n{plan}\nfor query:\n{queryset.query}')
+
+    def test_product_queries(self):
+        querysets = {
+            'product list': ProductListView.queryset.order_by(*ProductListView.ordering)[:51],
+            'product list page': ProductListView.queryset.filter(
+                KeysetPaginator(Product.objects.all(), ProductListView.ordering, 50).after_condition(['10.00', 1])
+            ).order_by(*ProductListView.ordering)[:51],
+            'order form products': Product.objects.filter(archived=False),
+            'latest products feed': LatestProductsFeed().items(),
+            'products revision': Product.objects.order_by('-updated_at').values_list('updated_at')[:1],
+            'products sitemap': ShopProductSitemap().items(),
+            'product details': Product.objects.filter(pk=1),
+        }
+        for name, queryset in querysets.items():
+            with self.subTest(name):
+                self.assertNoFullScan(queryset)
+
+    def test_order_queries(self):
+        querysets = {
+            'user orders list': Order.objects.filter(user_id=self.user.pk),
+            'user orders export': Order.objects.filter(user_id=self.user.pk).order_by('pk'),
+            'user orders by time': Order.objects.filter(user_id=self.user.pk).order_by('-creation_time'),
+            'orders sitemap': ShopOrderSitemap().items(),
+            'orders export chunk': Order.objects.filter(pk__gt=0).order_by('pk')[:500],
+            'order details': Order.objects.filter(pk=1),
+            'orders list page': Order.objects.filter(
+                KeysetPaginator(Order.objects.all(), OrderListView.ordering, 50)
+                .after_condition(['2023-08-02 18:45:13+00:00', 10])
+            ).order_by(*OrderListView.ordering)[:51],
+        }
+        for name, queryset in querysets.items():
+            with self.subTest(name):
+                self.assertNoFullScan(queryset)
+
+
+@override_settings(LANGUAGE_CODE='en')
+class ViewBudgetTestCase(TestCase):
+    """
+    Обходит все страницы shopapp, myauth и blogapp на синтетическом наборе данных
+    и сравнивает число запросов с бюджетами из view_budgets.json.
+
+    Время ответа зависит от машины, поэтому сравнивается только с
+    ``SHOP_BUDGET_CHECK_TIME=1``, ``SHOP_BUDGET_TIME_FACTOR`` задаёт допустимое
+    превышение. ``SHOP_UPDATE_BUDGETS=1`` перезаписывает файл текущими замерами
+    """
+    check_time = getenv('SHOP_BUDGET_CHECK_TIME') == '1'
+    time_factor = float(getenv('SHOP_BUDGET_TIME_FACTOR', '5'))
+    min_time_budget_ms = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.budgets = load_budgets()
+        cls.scale = DatasetScale(**cls.budgets['scale'])
+        cls.dataset = build_dataset(cls.scale)
+        cls.user = User.objects.create_superuser(username='test budgets', password='testbudgets')
+        Profile.objects.create(user=cls.user)
+
+    def assertWithinTime(self, value: float, budget: float, label: str):
+        limit = max(budget, self.min_time_budget_ms) * self.time_factor
+        self.assertLessEqual(value, limit, f'{label}: {value:.1f}ms over budget {budget:.1f}ms')
+
+    def test_views_within_budget(self):
+        results = measure_views(self.client, self.user, self.dataset, before_request=get_cache().clear)
+        if getenv('SHOP_UPDATE_BUDGETS') == '1':
+            save_budgets(self.scale, results)
+            self.skipTest('View budgets updated')
+
+        budgets = self.budgets['views']
+        self.assertEqual(sorted(set(results) - set(budgets)), [], 'Views without budget')
+        for name, result in results.items():
+            with self.subTest(name):
+                budget = budgets[name]
+                self.assertLess(result.status, 500)
+                self.assertLessEqual(result.queries, budget['queries'], 'Query count over budget')
+                if self.check_time:
+                    self.assertWithinTime(result.db_ms, budget['db_ms'], 'DB time')
+                    self.assertWithinTime(result.wall_ms, budget['wall_ms'], 'Wall time')
+
+
+def make_cursor(data) -> str:
+    """ Курсор с произвольным содержимым, как у подделанной ссылки """
+    return urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+@override_settings(LANGUAGE_CODE='en')
+class OrderListViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test order list', password='testlist')
+        cls.other_user = User.objects.create_user(username='test order list other', password='testlist')
+        cls.orders = Order.objects.bulk_create(
+            Order(delivery_address=f'address {num}', user=cls.user if num % 2 else cls.other_user)
+            for num in range(7)
+        )
+        # creation times: 2023-01-01 .. 2023-01-07, two orders share the last one
+        for num, order in enumerate(cls.orders):
+            order.creation_time = timezone.make_aware(datetime(2023, 1, min(num + 1, 6)))
+        Order.objects.bulk_update(cls.orders, ['creation_time'])
+        cls.aim_url = reverse('shopapp:order_list')
+
+    def test_keyset_pages(self):
+        with mock.patch.object(OrderListView, 'per_page', 3):
+            response = self.client.get(self.aim_url)
+            pages = [response]
+            while response.context['page'].has_next:
+                response = self.client.get(f'{self.aim_url}?{response.context["next_page_query"]}')
+                pages.append(response)
+            pks = [order.pk for page in pages for order in page.context['orders']]
+            previous = self.client.get(f'{self.aim_url}?{pages[1].context["previous_page_query"]}')
+        expected = sorted(self.orders, key=lambda order: (order.creation_time, order.pk), reverse=True)
+        self.assertEqual(pks, [order.pk for order in expected])
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(
+            [order.pk for order in previous.context['orders']],
+            [order.pk for order in pages[0].context['orders']],
+        )
+        self.assertFalse(previous.context['page'].has_previous)
+
+    def test_single_query_per_page(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.aim_url)
+        self.assertContains(response, self.user.username)
+
+    def test_filters(self):
+        response = self.client.get(self.aim_url, {'since': '2023-01-02', 'until': '2023-01-04', 'user': self.user.pk})
+        self.assertEqual(
+            sorted(order.pk for order in response.context['orders']),
+            [self.orders[1].pk, self.orders[3].pk],
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.aim_url, {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_bad_values(self):
+        for values in (['abc', 'xyz'], [{'a': 1}, 2], [None, 1]):
+            with self.subTest(values=values):
+                cursor = make_cursor({'d': 'next', 'v': values})
+                with self.assertRaises(InvalidCursor):
+                    KeysetPaginator(Order.objects.all(), OrderListView.ordering, 50).get_page(cursor)
+                self.assertEqual(self.client.get(self.aim_url, {'cursor': cursor}).status_code, 404)
+
+
+@override_settings(LANGUAGE_CODE='en')
+class ProductListViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test product list', password='testlist')
+        cls.products = Product.objects.bulk_create(
+            Product(name=f'list product {num}', price=num % 3 + 1, archived=num == 4, created_by=cls.user)
+            for num in range(7)
+        )
+        cls.aim_url = reverse('shopapp:product_list')
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_keyset_pages(self):
+        with mock.patch.object(ProductListView, 'per_page', 4):
+            first = self.client.get(self.aim_url)
+            second = self.client.get(f'{self.aim_url}?{first.context["next_page_query"]}')
+        pks = [product.pk for response in (first, second) for product in response.context['products']]
+        expected = sorted(
+            (product for product in self.products if not product.archived),
+            key=lambda product: (product.price, product.pk),
+        )
+        self.assertEqual(pks, [product.pk for product in expected])
+        self.assertFalse(second.context['page'].has_next)
+        self.assertContains(first, '6 products are available')
+
+    def test_cursor_with_bad_price(self):
+        response = self.client.get(self.aim_url, {'cursor': make_cursor({'d': 'next', 'v': ['abc', '1']})})
+        self.assertEqual(response.status_code, 404)
+
+    def test_count_is_cached(self):
+        self.client.get(self.aim_url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.aim_url)
+        self.assertEqual(response.context['available_products_count'], 6)
+
+    @override_settings(SHOP_CACHE_ATOMIC_INCR=False)
+    def test_count_recounted_without_atomic_incr(self):
+        get_available_products_count()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='list product recounted', price=5, created_by=self.user)
+        self.assertIsNone(get_cache().get(available_products_count_key()))
+        with self.assertNumQueries(1):
+            self.assertEqual(get_available_products_count(), 7)
+
+    def test_change_during_recount_is_not_overwritten(self):
+        queryset_count = QuerySet.count
+
+        def count_and_change(queryset):
+            count = queryset_count(queryset)
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.create(name='list product during recount', price=5, created_by=self.user)
+            return count
+
+        for atomic_incr in (True, False):
+            with self.subTest(atomic_incr=atomic_incr), self.settings(SHOP_CACHE_ATOMIC_INCR=atomic_incr):
+                get_cache().clear()
+                expected = Product.objects.filter(archived=False).count()
+                with mock.patch.object(QuerySet, 'count', autospec=True, side_effect=count_and_change):
+                    self.assertEqual(get_available_products_count(), expected)
+                self.assertIsNone(get_cache().get(available_products_count_key()))
+                self.assertEqual(get_available_products_count(), expected + 1)
+
+    def test_count_follows_changes(self):
+        get_available_products_count()
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='list product new', price=5, created_by=self.user)
+        self.assertEqual(get_available_products_count(), 7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.archived = True
+            product.save()
+        self.assertEqual(get_available_products_count(), 6)
+
+        deferred = Product.objects.only('name').get(pk=self.products[4].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            deferred.delete()
+        self.assertEqual(get_available_products_count(), 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(pk=self.products[0].pk).delete()
+        self.assertEqual(get_available_products_count(), 5)
+
+    def test_admin_actions_adjust_count(self):
+        get_available_products_count()
+        queryset = Product.objects.filter(pk__in=[self.products[3].pk, self.products[4].pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_archived(None, None, queryset)
+        self.assertEqual(get_available_products_count(), 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_unarchived(None, None, queryset)
+        self.assertEqual(get_available_products_count(), 7)
+
+
+@override_settings(LANGUAGE_CODE='en', SHOP_API_MAX_PAGE_SIZE=2)
+class AsyncApiTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test async api', password='testasync')
+        cls.products = [
+            Product.objects.create(name=f'async product {num}', description='text', price=num, created_by=cls.user)
+            for num in range(1, 4)
+        ]
+        ProductImage.objects.create(product=cls.products[0], image='products/test.jpg')
+        cls.order = Order.objects.create(delivery_address='async address', user=cls.user)
+        cls.order.products.set(cls.products)
+
+    async def test_list_pages_match_sync_api(self):
+        url = reverse('shopapp:async_product_list')
+        response = await self.async_client.get(url, {'page_size': 10})
+        first = response.json()
+        self.assertEqual(len(first['results']), 2)
+        self.assertIsNone(first['previous'])
+        second = (await self.async_client.get(first['next'])).json()
+        self.assertIsNone(second['next'])
+
+        sync_first = (await self.async_client.get(
+            reverse('shopapp:product-list'), {'pagination': 'cursor', 'page_size': 10}
+        )).json()
+        sync_second = (await self.async_client.get(sync_first['next'])).json()
+        self.assertEqual(first['results'] + second['results'], sync_first['results'] + sync_second['results'])
+
+    async def test_order_details(self):
+        response = await self.async_client.get(
+            reverse('shopapp:async_order_details', kwargs={'pk': self.order.pk}),
+            {'fields': 'pk,products.pk,products.images'},
+        )
+        self.assertEqual(response.json(), {
+            'pk': self.order.pk,
+            'products': [
+                {'pk': product.pk, 'images': [image.pk async for image in product.images.all()]}
+                for product in self.products
+            ],
+        })
+
+    async def test_errors(self):
+        response = await self.async_client.get(reverse('shopapp:async_product_details', kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(reverse('shopapp:async_order_list'), {'fields': 'secret'})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get(reverse('shopapp:async_order_list'), {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
+        for name in ('shopapp:async_order_list', 'shopapp:async_product_list'):
+            response = await self.async_client.get(reverse(name), {'cursor': make_cursor({'d': 'next', 'v': ['x']})})
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+        response = await self.async_client.post(reverse('shopapp:async_order_list'))
+        self.assertEqual(response.status_code, 405)
+
+
+@override_settings(LANGUAGE_CODE='en')
+class SitemapTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test sitemap', password='testsitemap')
+        cls.products = Product.objects.bulk_create(
+            Product(name=f'sitemap product {num}', created_by=cls.user) for num in range(3)
+        )
+        Order.objects.create(delivery_address='sitemap address', user=cls.user)
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_index_and_shards(self):
+        with mock.patch.object(ShopProductSitemap, 'limit', 2):
+            index = self.client.get(reverse('sitemap'))
+            section_url = reverse('sitemap-section', kwargs={'section': 'shopapp_product'})
+            self.assertContains(index, f'{section_url}?p=2')
+            second_page = self.client.get(section_url, {'p': 2})
+        self.assertContains(second_page, reverse('shopapp:product_details', kwargs={'pk': self.products[2].pk}))
+        self.assertNotContains(second_page, reverse('shopapp:product_details', kwargs={'pk': self.products[0].pk}))
+
+    def test_cached_pages_and_conditional_requests(self):
+        url = reverse('sitemap-section', kwargs={'section': 'shopapp_order'})
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(not_modified.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(delivery_address='new sitemap address', user=self.user)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertContains(changed, reverse('shopapp:order_details', kwargs={'pk': order.pk}))
+
+    def test_unknown_section(self):
+        response = self.client.get(reverse('sitemap-section', kwargs={'section': 'missing'}))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(LANGUAGE_CODE='en')
+class ConditionalGetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='test conditional', password='testconditional')
+        cls.product = Product.objects.create(name='conditional product', price=10, created_by=cls.user)
+        cls.order = Order.objects.create(delivery_address='conditional address', user=cls.user)
+        cls.order.products.add(cls.product)
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.force_login(self.user)
+
+    def assertNotModifiedWithoutQueries(self, url: str, response):
+        with self.assertNumQueries(2):  # user and the updated_at stamp
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_detail_views(self):
+        for url in (
+            reverse('shopapp:product_details', kwargs={'pk': self.product.pk}),
+            reverse('shopapp:product-detail', kwargs={'pk': self.product.pk}),
+        ):
+            with self.subTest(url):
+                response = self.client.get(url)
+                self.assertTrue(response.has_header('Last-Modified'))
+                self.assertNotModifiedWithoutQueries(url, response)
+
+    def test_view_without_validators(self):
+        class PlainView(View):
+            def get(self, request, *args, **kwargs):
+                return HttpResponse('plain')
+
+        class ConditionalView(ConditionalGetMixin, PlainView):
+            pass
+
+        response = ConditionalView.as_view()(RequestFactory().get('/', HTTP_IF_NONE_MATCH='"plain"'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_order_changes_with_its_products(self):
+        url = reverse('shopapp:order-detail', kwargs={'pk': self.order.pk})
+        response = self.client.get(url)
+        self.assertNotModifiedWithoutQueries(url, response)
+
+        Product.objects.filter(pk=self.product.pk).update(updated_at=timezone.now())
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+        self.order.products.clear()
+        self.assertNotEqual(self.client.get(url)['ETag'], changed['ETag'])
+
+    def test_list_changes_on_commit(self):
+        url = reverse('shopapp:product-list')
+        response = self.client.get(url)
+        with self.assertNumQueries(1):  # user, the session and the stamp are in the cache
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_archived(None, None, Product.objects.filter(pk=self.product.pk))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_missing_object(self):
+        response = self.client.get(reverse('shopapp:product-detail', kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+@override_settings(LANGUAGE_CODE='en')
+class LatestProductsFeedTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test feed', password='testfeed')
+        cls.products = Product.objects.bulk_create(
+            Product(name=f'feed product {num}', created_by=cls.user) for num in range(7)
+        )
+        for num, product in enumerate(cls.products):
+            product.creation_time = timezone.make_aware(datetime(2023, 1, num + 1))
+        Product.objects.bulk_update(cls.products, ['creation_time'])
+        cls.aim_url = reverse('shopapp:product_feed')
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_newest_products_first(self):
+        response = self.client.get(self.aim_url)
+        titles = re.findall(r'<item><title>(.*?)</title>', response.content.decode())
+        self.assertEqual(titles, [f'feed product {num}' for num in range(6, 1, -1)])
+
+    def test_cached_and_conditional(self):
+        response = self.client.get(self.aim_url)
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.aim_url)
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(self.aim_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_new_revision(self):
+        response = self.client.get(self.aim_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='feed product new', created_by=self.user)
+        changed = self.client.get(self.aim_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(changed, 'feed product new')
+
+
+def make_image_file(name: str = 'photo.png', size=(1600, 1200)) -> SimpleUploadedFile:
+    content = BytesIO()
+    Image.new('RGB', size, 'orange').save(content, 'PNG')
+    return SimpleUploadedFile(name, content.getvalue(), content_type='image/png')
+
+
+@override_settings(LANGUAGE_CODE='en', MEDIA_ROOT=tempfile.mkdtemp())
+class ThumbnailsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='test thumbnails', password='testthumbnails')
+        cls.product = Product.objects.create(name='thumbnails product', created_by=cls.user)
+
+    def setUp(self):
+        self.image = ProductImage.objects.create(product=self.product, image=make_image_file())
+
+    def test_renditions(self):
+        self.assertEqual(self.image.renditions, {})
+        renditions = generate_renditions(self.image)
+        self.assertEqual(set(renditions), set(settings.SHOP_THUMBNAIL_PRESETS))
+        storage = self.image.image.storage
+        with storage.open(renditions['small']) as small, Image.open(small) as picture:
+            self.assertEqual(picture.size, (160, 120))
+        self.assertRegex(renditions['medium'], r'^renditions/products/product_\d+/images/photo\w*\.medium\.[0-9a-f]{12}\.jpg$')
+        self.assertEqual(generate_renditions(self.image), renditions)
+        self.assertEqual(ProductImage.objects.get(pk=self.image.pk).renditions, renditions)
+
+    def test_replaced_image_drops_renditions(self):
+        old = generate_renditions(self.image)
+        self.image.image = make_image_file('other.png', size=(300, 200))
+        self.image.save()
+        self.assertEqual(self.image.renditions, {})
+        self.assertFalse(self.image.image.storage.exists(old['small']))
+        self.assertNotEqual(generate_renditions(self.image)['small'], old['small'])
+
+    def test_template_tag_and_serializer(self):
+        template = Template("{% load shop_images %}{% rendition img 'medium' %}")
+        self.assertEqual(template.render(Context({'img': self.image})), self.image.image.url)
+        generate_renditions(self.image)
+        self.assertIn('.medium.', template.render(Context({'img': self.image})))
+
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('shopapp:product-detail', kwargs={'pk': self.product.pk}),
+            {'expand': 'images'},
+        )
+        renditions = response.json()['images'][0]['renditions']
+        self.assertTrue(renditions['large'].startswith('http://testserver/media/renditions/'))
+
+    def test_command_generates_missing(self):
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('Обработано изображений: 1', out.getvalue())
+        self.assertEqual(set(ProductImage.objects.get(pk=self.image.pk).renditions), set(settings.SHOP_THUMBNAIL_PRESETS))
+
+
+MEDIA_TEST_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TEST_ROOT, MEDIA_DELIVERY='file')
+class MediaDeliveryTestCase(SimpleTestCase):
+    rendition = 'renditions/products/photo.small.0123456789ab.jpg'
+    original = 'products/photo.jpg'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in (cls.rendition, cls.original):
+            path = Path(MEDIA_TEST_ROOT, name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(bytes(range(256)) * 4)
+        cls.factory = RequestFactory()
+
+    def get(self, name: str, **headers):
+        return serve_media(self.factory.get(f'/media/{name}', **headers), name)
+
+    def test_full_file_and_cache_headers(self):
+        response = self.client.get(f'/media/{self.rendition}')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(256)) * 4)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.get(self.original)['Cache-Control'], f'public, max-age={settings.MEDIA_MAX_AGE}')
+        self.assertEqual(self.get(self.rendition, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_if_none_match_lists_and_weak_tags(self):
+        etag = self.get(self.original)['ETag']
+        for header in (f'"other", {etag}', f'W/{etag}', '*'):
+            with self.subTest(header):
+                self.assertEqual(self.get(self.original, HTTP_IF_NONE_MATCH=header).status_code, 304)
+        self.assertEqual(self.get(self.original, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_ranges(self):
+        response = self.get(self.original, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+        response = self.get(self.original, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(252, 256)))
+        self.assertEqual(self.get(self.original, HTTP_RANGE='bytes=5000-').status_code, 416)
+        self.assertEqual(self.get(self.original, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_offload_modes(self):
+        with self.settings(MEDIA_DELIVERY='x-accel'):
+            response = self.get(self.original)
+            self.assertEqual(response['X-Accel-Redirect'], '/protected-media/products/photo.jpg')
+            self.assertEqual(response.content, b'')
+        with self.settings(MEDIA_DELIVERY='x-sendfile'):
+            self.assertEqual(self.get(self.original)['X-Sendfile'], str(Path(MEDIA_TEST_ROOT, self.original)))
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get('/media/products/missing.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+
+
+class SqliteBackendTestCase(TestCase):
+    def test_pragmas_are_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)  # MEMORY
+
+    def test_atomic_begins_immediate(self):
+        with mock.patch.object(connection, 'cursor') as cursor:
+            connection._start_transaction_under_autocommit()
+        cursor.return_value.execute.assert_called_once_with('BEGIN IMMEDIATE')
+
+
+class LoggingPipelineTestCase(SimpleTestCase):
+    def make_record(self, name, level=logging.INFO, msg='Called products list view', args=()):
+        return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+    def test_parse_sample_rates(self):
+        self.assertEqual(parse_sample_rates(' shopapp.views=0.01, blogapp=0.5,'), {'shopapp.views': 0.01, 'blogapp': 0.5})
+        self.assertEqual(parse_sample_rates(''), {})
+
+    def test_sampling_filter(self):
+        sampling = SamplingFilter({'shopapp': 1.0, 'shopapp.views': 0.0})
+        self.assertFalse(sampling.filter(self.make_record('shopapp.views')))
+        self.assertFalse(sampling.filter(self.make_record('shopapp.views.products')))
+        self.assertTrue(sampling.filter(self.make_record('shopapp.views', logging.WARNING)))
+        self.assertTrue(sampling.filter(self.make_record('shopapp.api')))
+        self.assertTrue(sampling.filter(self.make_record('shopapp_views')))
+
+    def test_background_handler_writes_json(self):
+        stream = StringIO()
+        handler = BackgroundHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        values = ['before']
+        handler.handle(self.make_record('shopapp.views', msg='Values: %s', args=(values,)))
+        values.append('after')
+        handler.close()
+
+        data = json.loads(stream.getvalue())
+        self.assertEqual(data['message'], "Values: ['before']")
+        self.assertEqual((data['level'], data['logger']), ('INFO', 'shopapp.views'))
+
+    def test_background_handler_drops_records_when_full(self):
+        handler = BackgroundHandler(StringIO(), queue_size=1)
+        handler.enqueue(self.make_record('shopapp.views'))
+        handler.enqueue(self.make_record('shopapp.views'))
+        self.assertEqual(handler.dropped, 1)
+        handler.close()
+
+
+@override_settings(SENTRY_TRACES_SAMPLE_RATE=0.25, SENTRY_TRACES_SAMPLE_RATES={'ProductListView': 0.01})
+class TracingTestCase(SimpleTestCase):
+    def test_view_name_for_path(self):
+        self.assertEqual(view_name_for_path('/en/shop/products/'), 'ProductListView')
+        self.assertEqual(view_name_for_path('/ru/shop/products/'), 'ProductListView')
+        self.assertEqual(view_name_for_path('/en/shop/api/products/'), 'ProductViewSet')
+        self.assertEqual(view_name_for_path('/en/shop/'), 'shop_index')
+        self.assertIsNone(view_name_for_path('/missing/'))
+
+    def test_traces_sampler(self):
+        self.assertEqual(traces_sampler({'wsgi_environ': {'PATH_INFO': '/en/shop/products/'}}), 0.01)
+        self.assertEqual(traces_sampler({'wsgi_environ': {'PATH_INFO': '/en/shop/orders/'}}), 0.25)
+        self.assertEqual(traces_sampler({'asgi_scope': {'path': '/missing/'}}), 0.25)
+        self.assertEqual(traces_sampler({}), 0.25)
+
+    def test_parent_decision_is_kept(self):
+        context = {'wsgi_environ': {'PATH_INFO': '/en/shop/products/'}}
+        self.assertEqual(traces_sampler({**context, 'parent_sampled': True}), 1.0)
+        self.assertEqual(traces_sampler({**context, 'parent_sampled': False}), 0.0)
+
+
+@override_settings(LANGUAGE_CODE='en')
+class MetricsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='metrics_staff', password='qwerty', is_staff=True)
+        Product.objects.create(name='Metered', price=10, created_by=cls.staff)
+
+    def setUp(self) -> None:
+        get_cache().clear()
+        get_metrics().reset()
+
+    def test_view_latency_and_queries_are_recorded(self):
+        self.client.get(reverse('shopapp:product_list'))
+        self.client.get(reverse('shopapp:product_list'))
+        self.client.get('/missing/')
+
+        views = get_metrics().snapshot()['views']
+        stats = views['shopapp:product_list']
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(sum(stats['histogram_ms'].values()), 2)
+        self.assertGreater(stats['queries_max'], 0)
+        self.assertEqual(views['<unresolved>']['count'], 1)
+
+    async def test_async_view_queries_are_counted(self):
+        await self.async_client.get(reverse('shopapp:async_product_list'))
+        stats = get_metrics().snapshot()['views']['shopapp:async_product_list']
+        self.assertGreater(stats['queries_max'], 0)
+
+    def test_middleware_supports_async_chain(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(MetricsMiddleware(get_response)))
+        self.assertFalse(iscoroutinefunction(MetricsMiddleware(lambda request: HttpResponse())))
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('mysite.metrics', 'WARNING') as logs:
+            self.client.get(reverse('shopapp:product_list'))
+        self.assertIn('shopapp:product_list', logs.output[0])
+        self.assertEqual(get_metrics().snapshot()['views']['shopapp:product_list']['slow'], 1)
+
+    def test_metrics_endpoint_access(self):
+        self.client.get(reverse('shopapp:product_list'))
+        # local addresses get no access, behind a reverse proxy every client has one
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 404)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('shopapp:product_list', response.json()['views'])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TEST_ROOT)
+class SeedShopTestCase(TestCase):
+    config = SeedConfig(users=5, products=40, orders=30, images_per_product=1, batch_size=7)
+
+    def setUp(self) -> None:
+        get_cache().clear()
+
+    def test_seed_shop(self):
+        stages = seed_shop(self.config)
+        self.assertEqual([stage.rows for stage in stages[:3]], [10, 40, 40])
+        self.assertEqual(User.objects.filter(username__startswith='seed_user_').count(), 5)
+        self.assertEqual(Profile.objects.filter(user__username__startswith='seed_user_').count(), 5)
+        self.assertEqual(ProductImage.objects.count(), 40)
+        self.assertTrue(ProductImage.objects.first().image.storage.exists(ProductImage.objects.first().image.name))
+
+        orders = Order.objects.filter(user__username__startswith='seed_user_')
+        self.assertEqual(orders.count(), 30)
+        links = Order.products.through.objects.filter(order__in=orders).count()
+        self.assertEqual(stages[3].rows, 30 + links)
+        self.assertTrue(30 <= links <= 150)
+        self.assertEqual(get_available_products_count(), Product.objects.filter(archived=False).count())
+
+    def test_same_seed_gives_same_data(self):
+        seed_shop(self.config._replace(images_per_product=0))
+        seed_shop(self.config._replace(images_per_product=0, username_prefix='again_'))
+        first, second = (
+            list(
+                Product.objects.filter(created_by__username__startswith=prefix)
+                .order_by('pk')
+                .values_list('name', 'price', 'discount', 'archived')
+            )
+            for prefix in ('seed_user_', 'again_')
+        )
+        self.assertEqual(len(first), 40)
+        self.assertEqual(first, second)
+
+    def test_zipf_popularity_is_skewed(self):
+        seed_shop(self.config._replace(products=200, orders=300, images_per_product=0))
+        counts = sorted(
+            Product.objects.annotate(orders_count=Count('orders')).values_list('orders_count', flat=True),
+            reverse=True,
+        )
+        self.assertGreater(sum(counts[:20]), sum(counts) / 2)
+
+    def test_command_reports_instant_run(self):
+        stdout = StringIO()
+        with mock.patch('shopapp.seeding.perf_counter', return_value=0.0):
+            call_command('seed_shop', users=1, products=2, orders=1, images_per_product=0, stdout=stdout)
+        self.assertIn('(0 строк/с)', stdout.getvalue())
+
+    def test_command_refuses_existing_prefix(self):
+        User.objects.create(username='seed_user_0')
+        with self.assertRaises(CommandError):
+            call_command('seed_shop', users=1, stdout=StringIO())
+
+
+@override_settings(LANGUAGE_CODE='en')
+class OrderProductsBulkTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='bulk_staff', password='qwerty', is_staff=True)
+        cls.products = [Product.objects.create(name=f'Bulk {num}', created_by=cls.staff) for num in range(3)]
+        cls.orders = [Order.objects.create(user=cls.staff, delivery_address=f'Bulk {num}') for num in range(5)]
+        cls.orders[0].products.add(cls.products[0])
+
+    def setUp(self) -> None:
+        get_cache().clear()
+
+    def links(self):
+        return set(Order.products.through.objects.values_list('order_id', 'product_id'))
+
+    def test_add_in_batches_with_one_notification_per_batch(self):
+        bulk_receiver, m2m_receiver = mock.Mock(), mock.Mock()
+        order_products_bulk_changed.connect(bulk_receiver, sender=Order)
+        m2m_changed.connect(m2m_receiver, sender=Order.products.through)
+        self.addCleanup(order_products_bulk_changed.disconnect, bulk_receiver, sender=Order)
+        self.addCleanup(m2m_changed.disconnect, m2m_receiver, sender=Order.products.through)
+
+        order_ids = [order.pk for order in self.orders]
+        product_ids = [product.pk for product in self.products[:2]]
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = change_order_products('add', product_ids, order_ids, batch_size=2)
+
+        # the first order already had the first product
+        self.assertEqual(stats, (5, 9, 3))
+        self.assertEqual(self.links(), {(order_id, product_id) for order_id in order_ids for product_id in product_ids})
+        self.assertEqual(bulk_receiver.call_count, 3)
+        self.assertEqual(bulk_receiver.call_args_list[0].kwargs['order_ids'], set(order_ids[:2]))
+        m2m_receiver.assert_not_called()
+
+    def test_batch_queries(self):
+        order_ids = [order.pk for order in self.orders]
+        # id checks, then in a savepoint: existing links, insert, order users, the updated_at update
+        # and the totals select and update
+        with self.assertNumQueries(2 + 2 + 6):
+            change_order_products('add', [self.products[1].pk], order_ids, batch_size=5)
+
+    def test_remove_from_all_orders_touches_orders(self):
+        stamp = Order.objects.get(pk=self.orders[0].pk).updated_at
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = change_order_products('remove', [self.products[0].pk])
+        self.assertEqual(stats, (1, 1, 1))
+        self.assertEqual(self.links(), set())
+        self.assertGreater(Order.objects.get(pk=self.orders[0].pk).updated_at, stamp)
+        self.assertEqual(Order.objects.get(pk=self.orders[1].pk).updated_at, self.orders[1].updated_at)
+
+    def test_unknown_ids(self):
+        with self.assertRaisesMessage(OrderProductsError, 'products with ids [0] do not exist'):
+            change_order_products('add', [0], [self.orders[0].pk])
+        with self.assertRaises(OrderProductsError):
+            change_order_products('add', [self.products[0].pk])
+
+    def test_command(self):
+        stdout = StringIO()
+        call_command(
+            'bulk_order_products', 'add',
+            '--products', f'{self.products[1].pk}-{self.products[2].pk}',
+            '--orders', f'{self.orders[1].pk},{self.orders[2].pk}',
+            stdout=stdout,
+        )
+        self.assertIn('4', stdout.getvalue())
+        self.assertEqual(len(self.links()), 5)
+
+    def test_api_action(self):
+        url = reverse('shopapp:order-bulk-products')
+        payload = {'action': 'add', 'products': [self.products[2].pk], 'orders': [self.orders[3].pk]}
+        self.assertEqual(self.client.post(url, payload, content_type='application/json').status_code, 403)
+
+        self.client.force_login(self.staff)
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'orders': 1, 'links': 1, 'batches': 1})
+        self.assertIn((self.orders[3].pk, self.products[2].pk), self.links())
+
+        response = self.client.post(url, {**payload, 'orders': [0]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(LANGUAGE_CODE='en')
+class BulkApiTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='bulk_api_staff', password='qwerty', is_staff=True)
+        cls.customer = User.objects.create_user(username='bulk_api_customer', password='qwerty')
+        cls.products = [Product.objects.create(name=f'Bulk api {num}', created_by=cls.staff) for num in range(3)]
+        cls.order = Order.objects.create(user=cls.customer, delivery_address='Bulk api street')
+
+    def setUp(self) -> None:
+        get_cache().clear()
+        self.client.force_login(self.staff)
+
+    def send(self, method: str, name: str, payload):
+        return getattr(self.client, method)(reverse(name), payload, content_type='application/json')
+
+    def test_staff_only(self):
+        self.client.force_login(self.customer)
+        self.assertEqual(self.send('post', 'shopapp:product-bulk', []).status_code, 403)
+        self.assertEqual(self.send('patch', 'shopapp:order-bulk', []).status_code, 403)
+
+    def test_not_a_list(self):
+        self.assertEqual(self.send('post', 'shopapp:product-bulk', {'name': 'Single'}).status_code, 400)
+
+    def test_create_products_reports_invalid_items(self):
+        count = get_available_products_count()
+        payload = [
+            {'name': 'Bulk new 1', 'price': '10.50', 'created_by_id': self.staff.pk},
+            {'name': '', 'created_by_id': self.staff.pk},
+            {'name': 'Bulk new 2', 'created_by_id': 0},
+            {'name': 'Bulk new 3', 'archived': True, 'created_by_id': self.staff.pk},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.send('post', 'shopapp:product-bulk', payload)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([error['index'] for error in data['errors']], [1, 2])
+        self.assertIn('name', data['errors'][0]['errors'])
+        self.assertIn('created_by_id', data['errors'][1]['errors'])
+        self.assertQuerysetEqual(
+            Product.objects.filter(pk__in=data['pks']).order_by('pk'),
+            ['Bulk new 1', 'Bulk new 3'],
+            transform=lambda product: product.name,
+        )
+        self.assertEqual(get_available_products_count(), count + 1)
+
+    def test_create_products_in_chunks(self):
+        with mock.patch('shopapp.bulk.BULK_CHUNK_SIZE', 2), mock.patch('shopapp.bulk.search.index_products') as index:
+            result = create_products([{'name': f'Chunk {num}', 'created_by_id': self.staff.pk} for num in range(5)])
+        self.assertEqual(len(result.pks), 5)
+        self.assertEqual(index.call_count, 3)
+
+    def test_update_products(self):
+        stamp = Product.objects.get(pk=self.products[0].pk).updated_at
+        payload = [
+            {'pk': self.products[0].pk, 'price': '99.00', 'archived': True},
+            {'pk': 0, 'price': '1.00'},
+            {'price': '1.00'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.send('patch', 'shopapp:product-bulk', payload)
+        data = response.json()
+        self.assertEqual(data['pks'], [self.products[0].pk])
+        self.assertEqual([error['index'] for error in data['errors']], [1, 2])
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.assertEqual((str(product.price), product.archived), ('99.00', True))
+        self.assertGreater(product.updated_at, stamp)
+        self.assertEqual(product.name, 'Bulk api 0')
+
+    def test_archive_like_admin_action(self):
+        count = get_available_products_count()
+        missing = self.products[2].pk + 1000
+        payload = {'pks': [self.products[1].pk, self.products[2].pk, missing]}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.send('post', 'shopapp:product-bulk-archive', payload)
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['errors'], [{'index': 2, 'errors': {'pk': [f'Product with id {missing} does not exist']}}])
+        self.assertEqual(Product.objects.filter(archived=True).count(), 2)
+        self.assertEqual(get_available_products_count(), count - 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.send('post', 'shopapp:product-bulk-archive', {**payload, 'archived': False})
+        self.assertEqual(Product.objects.filter(archived=True).count(), 0)
+        self.assertEqual(get_available_products_count(), count)
+
+    def test_create_orders_with_products(self):
+        product_ids = [product.pk for product in self.products[:2]]
+        payload = [
+            {'delivery_address': 'Bulk order 1', 'user_id': self.customer.pk, 'products': product_ids},
+            {'delivery_address': 'Bulk order 2', 'user_id': self.customer.pk, 'products': [0]},
+        ]
+        response = self.send('post', 'shopapp:order-bulk', payload)
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['errors'][0]['index'], 1)
+        self.assertIn('products', data['errors'][0]['errors'])
+        order = Order.objects.get(pk=data['pks'][0])
+        self.assertEqual(set(order.products.values_list('pk', flat=True)), set(product_ids))
+
+    def test_update_orders(self):
+        payload = [{'pk': self.order.pk, 'promocode': 'BULK', 'user_id': self.staff.pk}]
+        response = self.send('patch', 'shopapp:order-bulk', payload)
+        self.assertEqual(response.json()['pks'], [self.order.pk])
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual((order.promocode, order.user_id), ('BULK', self.staff.pk))
+        self.assertEqual(order.delivery_address, 'Bulk api street')
+
+
+@override_settings(LANGUAGE_CODE='en')
+class OrderTotalsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='totals_staff', password='qwerty', is_staff=True)
+        cls.cheap = Product.objects.create(name='Totals cheap', price='10.00', created_by=cls.staff)
+        cls.discounted = Product.objects.create(name='Totals sale', price='99.99', discount=15, created_by=cls.staff)
+        cls.order = Order.objects.create(user=cls.staff, delivery_address='Totals street')
+
+    def setUp(self) -> None:
+        get_cache().clear()
+
+    def totals(self, order: Order = None):
+        order = Order.objects.get(pk=(order or self.order).pk)
+        return order.subtotal, order.total, order.products_count
+
+    def test_discounted_price(self):
+        self.assertEqual(discounted_price(Decimal('99.99'), 15), Decimal('84.99'))
+        self.assertEqual(discounted_price(Decimal('10.00'), 100), Decimal('0.00'))
+
+    def test_products_added_and_removed(self):
+        self.assertEqual(self.totals(), (0, 0, 0))
+        self.order.products.add(self.cheap, self.discounted)
+        self.assertEqual(self.totals(), (Decimal('109.99'), Decimal('94.99'), 2))
+        self.cheap.orders.remove(self.order)
+        self.assertEqual(self.totals(), (Decimal('99.99'), Decimal('84.99'), 1))
+        self.discounted.orders.clear()
+        self.assertEqual(self.totals(), (0, 0, 0))
+
+    def test_product_price_and_delete(self):
+        self.order.products.add(self.cheap, self.discounted)
+        self.cheap.price = Decimal('20.00')
+        self.cheap.save()
+        self.assertEqual(self.totals(), (Decimal('119.99'), Decimal('104.99'), 2))
+        self.discounted.delete()
+        self.assertEqual(self.totals(), (Decimal('20.00'), Decimal('20.00'), 1))
+
+    def test_admin_inline_moves_product_to_other_order(self):
+        other_order = Order.objects.create(user=self.staff, delivery_address='Totals other street')
+        self.order.products.add(self.cheap, self.discounted)
+        link = Order.products.through.objects.get(order=self.order, product=self.discounted)
+        request = RequestFactory().post('/')
+        request.user = User.objects.create_superuser(username='totals_admin', password='qwerty')
+        formset_class = OrderInline(Product, admin.site).get_formset(request, self.discounted)
+        formset = formset_class({
+            'Order_products-TOTAL_FORMS': 1,
+            'Order_products-INITIAL_FORMS': 1,
+            'Order_products-0-id': link.pk,
+            'Order_products-0-order': other_order.pk,
+            'Order_products-0-product': self.discounted.pk,
+        }, instance=self.discounted)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        formset.save()
+        self.assertEqual(self.totals(), (Decimal('10.00'), Decimal('10.00'), 1))
+        self.assertEqual(self.totals(other_order), (Decimal('99.99'), Decimal('84.99'), 1))
+
+    def test_unchanged_price_skips_recalculation(self):
+        self.order.products.add(self.cheap)
+        product = Product.objects.get(pk=self.cheap.pk)
+        product.name = 'Totals renamed'
+        # product update, search index and orders for the cache
+        with self.assertNumQueries(3):
+            product.save()
+
+    def test_bulk_paths(self):
+        change_order_products('add', [self.cheap.pk], [self.order.pk])
+        self.assertEqual(self.totals(), (Decimal('10.00'), Decimal('10.00'), 1))
+        self.client.force_login(self.staff)
+        self.client.patch(
+            reverse('shopapp:product-bulk'),
+            [{'pk': self.cheap.pk, 'discount': 50}],
+            content_type='application/json',
+        )
+        self.assertEqual(self.totals(), (Decimal('10.00'), Decimal('5.00'), 1))
+
+    def test_backfill_command(self):
+        self.order.products.add(self.cheap, self.discounted)
+        Order.objects.update(subtotal=0, total=0, products_count=0)
+        stdout = StringIO()
+        call_command('backfill_order_totals', '--batch-size', '1', stdout=stdout)
+        self.assertIn('1', stdout.getvalue())
+        self.assertEqual(self.totals(), (Decimal('109.99'), Decimal('94.99'), 2))
+
+    def test_api_filter_and_ordering(self):
+        expensive = Order.objects.create(user=self.staff, delivery_address='Totals avenue')
+        expensive.products.add(self.cheap, self.discounted)
+        self.order.products.add(self.cheap)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('shopapp:order-list'), {'ordering': '-total'})
+        self.assertEqual([item['pk'] for item in response.json()['results']], [expensive.pk, self.order.pk])
+        self.assertEqual(response.json()['results'][0]['total'], '94.99')
+        response = self.client.get(reverse('shopapp:order-list'), {'total__gte': '50', 'fields': 'pk,products_count'})
+        self.assertEqual(response.json()['results'], [{'pk': expensive.pk, 'products_count': 2}])
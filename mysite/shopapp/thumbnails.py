@@ -0,0 +1,147 @@
+"""
+Модуль с уменьшенными копиями (рендициями) изображений товаров.
+
+Размеры задаются именованными пресетами в настройке ``SHOP_THUMBNAIL_PRESETS``.
+Рендиции сохраняются в хранилище рядом с медиафайлами в каталоге
+``SHOP_THUMBNAIL_DIR``, имя файла содержит хеш исходного изображения
+и параметров пресета, поэтому по одному адресу всегда лежит одно и то же
+содержимое и его можно кешировать сколь угодно долго. Пути готовых рендиций
+хранятся в ``ProductImage.renditions``.
+
+Генерация не выполняется во время запроса: после сохранения изображения
+его id ставится в очередь фонового потока (``SHOP_THUMBNAIL_WORKER``),
+а пропущенные рендиции создаёт команда ``generate_thumbnails``.
+Пока рендиции нет, вместо неё отдаётся оригинал
+"""
+
+import logging
+from hashlib import sha256
+from io import BytesIO
+from pathlib import PurePosixPath
+from queue import Queue
+from threading import Lock, Thread
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import touch_changed
+from .models import Product, ProductImage
+
+logger = logging.getLogger(__name__)
+
+_queue: 'Queue[int]' = Queue()
+_worker: Optional[Thread] = None
+_worker_lock = Lock()
+
+
+def preset_spec(preset: str) -> str:
+    width, height = settings.SHOP_THUMBNAIL_PRESETS[preset]
+    return f'{width}x{height}q{settings.SHOP_THUMBNAIL_QUALITY}'
+
+
+def rendition_name(image: ProductImage, preset: str, source_digest: str) -> str:
+    """ ``renditions/products/product_1/images/photo.medium.3f2a9c1e0b7d.jpg`` """
+    source = PurePosixPath(image.image.name)
+    digest = sha256(f'{source_digest}:{preset_spec(preset)}'.encode()).hexdigest()[:12]
+    return str(PurePosixPath(settings.SHOP_THUMBNAIL_DIR, source.parent, f'{source.stem}.{preset}.{digest}.jpg'))
+
+
+def render(source: bytes, preset: str) -> bytes:
+    size = settings.SHOP_THUMBNAIL_PRESETS[preset]
+    with Image.open(BytesIO(source)) as picture:
+        picture = ImageOps.exif_transpose(picture).convert('RGB')
+        picture.thumbnail(size, Image.LANCZOS)
+        output = BytesIO()
+        picture.save(output, 'JPEG', quality=settings.SHOP_THUMBNAIL_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def generate_renditions(image: ProductImage, force: bool = False) -> Dict[str, str]:
+    """
+    Создаёт недостающие рендиции всех пресетов и сохраняет их пути в ``image.renditions``.
+
+    Уже существующие файлы с тем же хешем не пересоздаются, если не задан ``force``
+    """
+    storage = image.image.storage
+    with image.image.open('rb') as source_file:
+        source = source_file.read()
+    source_digest = sha256(source).hexdigest()
+
+    renditions = {}
+    for preset in settings.SHOP_THUMBNAIL_PRESETS:
+        name = rendition_name(image, preset, source_digest)
+        if force and storage.exists(name):
+            storage.delete(name)
+        if not storage.exists(name):
+            name = storage.save(name, ContentFile(render(source, preset)))
+        renditions[preset] = name
+
+    for stale in set(image.renditions.values()) - set(renditions.values()):
+        storage.delete(stale)
+    # update() keeps post_save (and another round of generation) out of it,
+    # the product page shows renditions, so its stamps are bumped here
+    ProductImage.objects.filter(pk=image.pk).update(renditions=renditions)
+    Product.objects.filter(pk=image.product_id).update(updated_at=timezone.now())
+    touch_changed('products')
+    image.renditions = renditions
+    return renditions
+
+
+def delete_renditions(image: ProductImage) -> None:
+    for name in image.renditions.values():
+        image.image.storage.delete(name)
+
+
+def rendition_url(image: ProductImage, preset: str) -> str:
+    """ Адрес рендиции пресета или оригинала, если её ещё нет """
+    if preset not in settings.SHOP_THUMBNAIL_PRESETS:
+        raise ValueError(f'Unknown thumbnail preset: {preset!r}')
+    name = image.renditions.get(preset)
+    if name is None:
+        return image.image.url
+    return image.image.storage.url(name)
+
+
+def pending_images() -> Iterable[ProductImage]:
+    """ Изображения, у которых есть не все рендиции текущих пресетов """
+    presets = set(settings.SHOP_THUMBNAIL_PRESETS)
+    for image in ProductImage.objects.order_by('pk').iterator():
+        if set(image.renditions) != presets:
+            yield image
+
+
+def process(image_pk: int) -> None:
+    image = ProductImage.objects.filter(pk=image_pk).first()
+    if image is None:
+        return
+    try:
+        generate_renditions(image)
+    except (OSError, ValueError):
+        logger.exception('Failed to generate renditions for product image %s', image_pk)
+
+
+def run_worker() -> None:
+    while True:
+        image_pk = _queue.get()
+        try:
+            close_old_connections()
+            process(image_pk)
+        finally:
+            close_old_connections()
+            _queue.task_done()
+
+
+def enqueue(image_pk: int) -> None:
+    """ Ставит генерацию рендиций в очередь фонового потока после фиксации транзакции """
+    global _worker
+    if not settings.SHOP_THUMBNAIL_WORKER:
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = Thread(target=run_worker, name='shop-thumbnails', daemon=True)
+            _worker.start()
+    transaction.on_commit(lambda: _queue.put(image_pk))
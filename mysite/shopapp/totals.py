@@ -0,0 +1,83 @@
+"""
+Модуль итогов заказов, хранящихся в самом заказе.
+
+``Order.subtotal`` - сумма цен товаров, ``Order.total`` - сумма цен
+со скидками товаров, ``Order.products_count`` - число товаров. Поля
+пересчитываются пачками заказов: один запрос цен и скидок по связям
+заказ-товар и один ``bulk_update`` на пачку.
+
+Пересчёт вызывают обработчики ``m2m_changed``, изменения цены и скидки
+товара и ``order_products_bulk_changed`` (см. ``signals``), который
+отправляют и формсеты связей в ``admin``, а также массовые пути без
+сигналов: ``bulk``, ``order_import`` и ``seeding``.
+Для уже существующих заказов есть команда ``backfill_order_totals``
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple
+
+from django.db.models import QuerySet
+
+from .models import Order
+
+TOTALS_BATCH_SIZE = 1000
+TOTALS_FIELDS = 'subtotal', 'total', 'products_count'
+CENT = Decimal('0.01')
+
+
+class OrderTotals(NamedTuple):
+    subtotal: Decimal = Decimal('0.00')
+    total: Decimal = Decimal('0.00')
+    products_count: int = 0
+
+
+def discounted_price(price: Decimal, discount: int) -> Decimal:
+    """ Цена со скидкой ``discount`` процентов, округлённая до копеек """
+    return (price * (100 - discount) / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def compute_totals(order_ids: Iterable[int]) -> Dict[int, OrderTotals]:
+    """ Итоги заказов по ценам их товаров, у заказов без товаров - нулевые """
+    totals = {order_id: OrderTotals() for order_id in order_ids}
+    links = (
+        Order.products.through.objects
+        .filter(order_id__in=totals)
+        .values_list('order_id', 'product__price', 'product__discount')
+    )
+    for order_id, price, discount in links:
+        subtotal, total, products_count = totals[order_id]
+        totals[order_id] = OrderTotals(subtotal + price, total + discounted_price(price, discount), products_count + 1)
+    return totals
+
+
+def iter_id_batches(ids: Iterable[int], batch_size: int) -> Iterator[List[int]]:
+    ids = iter(ids)
+    while True:
+        batch = list(islice(ids, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def update_order_totals(order_ids: Iterable[int], batch_size: int = TOTALS_BATCH_SIZE) -> int:
+    """ Пересчитывает и сохраняет итоги заказов ``order_ids``, возвращает число заказов """
+    updated = 0
+    for batch in iter_id_batches(sorted(set(order_ids)), batch_size):
+        totals = compute_totals(batch)
+        Order.objects.bulk_update(
+            [Order(pk=order_id, **order_totals._asdict()) for order_id, order_totals in totals.items()],
+            TOTALS_FIELDS,
+        )
+        updated += len(totals)
+    return updated
+
+
+def product_order_ids(product_ids: Iterable[int]) -> QuerySet:
+    """ id заказов, в которых есть товары ``product_ids`` """
+    return (
+        Order.products.through.objects
+        .filter(product_id__in=product_ids)
+        .values_list('order_id', flat=True)
+        .distinct()
+    )
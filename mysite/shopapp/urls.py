@@ -22,6 +22,12 @@ from .api import (
     ProductViewSet,
     OrderViewSet,
 )
+from .async_api import (
+    AsyncProductListView,
+    AsyncProductDetailView,
+    AsyncOrderListView,
+    AsyncOrderDetailView,
+)
 
 app_name = 'shopapp'
 
@@ -31,6 +37,10 @@ routers.register('orders', OrderViewSet)
 
 urlpatterns = [
     path('', shop_index, name='index'),
+    path('api/async/products/', AsyncProductListView.as_view(), name='async_product_list'),
+    path('api/async/products/<int:pk>/', AsyncProductDetailView.as_view(), name='async_product_details'),
+    path('api/async/orders/', AsyncOrderListView.as_view(), name='async_order_list'),
+    path('api/async/orders/<int:pk>/', AsyncOrderDetailView.as_view(), name='async_order_details'),
     path('api/', include(routers.urls)),
     path('products/', ProductListView.as_view(), name='product_list'),
     path('products/create/', ProductCreateView.as_view(), name='create_product'),
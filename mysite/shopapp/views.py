@@ -1,20 +1,45 @@
 import json
 import logging
+from datetime import datetime, time, timedelta
+from typing import Optional
 
 from django.contrib.auth.models import User
 from django.contrib.syndication.views import Feed
 from django.shortcuts import render, reverse, get_object_or_404
-from django.http import HttpRequest, HttpResponseRedirect, JsonResponse
+from django.http import (
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.translation import get_language
 from django.views import View
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin
 from django.core.serializers.json import DjangoJSONEncoder
-from django.core.cache import cache
 
 from myauth.models import Profile
+from .conditional import (
+    ConditionalGetMixin,
+    Validators,
+    get_validators,
+    lists_changed,
+    not_modified,
+    order_changed,
+    product_changed,
+    products_revision,
+    set_validators,
+)
+from .cache import get_available_products_count, get_or_set, get_timeout, make_key, user_orders_export_key
 from .models import Product, Order
-from .forms import ProductForm, OrderForm
+from .export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, iter_order_chunks
+from .forms import ProductForm, OrderForm, OrderFilterForm
+from .pagination import InvalidCursor, KeysetPaginator
 from .serializers import OrderSerializer
 
 logger = logging.getLogger(__name__)
@@ -26,7 +51,6 @@ def shop_index(request: HttpRequest):
         'products': request.build_absolute_uri() + 'products/',
         'orders': request.build_absolute_uri() + 'orders/',
     }
-    print(page_urls)
     context = {
         'page_urls': page_urls,
     }
@@ -34,18 +58,67 @@ def shop_index(request: HttpRequest):
     return render(request, 'shopapp/shop-index.html', context=context)
 
 
-class ProductListView(ListView):
-    queryset = Product.objects.filter(archived=False)
+class KeysetPaginationMixin:
+    """
+    Keyset-пагинация для ListView.
+
+    Страница выбирается курсором из параметра ``cursor`` по полям ``ordering``,
+    в контекст попадают ``page`` и строки запроса соседних страниц
+    с сохранением остальных параметров
+    """
+    ordering = 'pk',
+    per_page = 50
+
+    def get_page_query(self, cursor: str) -> str:
+        query = self.request.GET.copy()
+        query['cursor'] = cursor
+        return query.urlencode()
+
+    def get_context_data(self, **kwargs):
+        paginator = KeysetPaginator(self.object_list, self.ordering, self.per_page)
+        try:
+            page = paginator.get_page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Invalid page cursor')
+        context = super().get_context_data(object_list=page.object_list, **kwargs)
+        context['page'] = page
+        if page.has_next:
+            context['next_page_query'] = self.get_page_query(page.next_cursor)
+        if page.has_previous:
+            context['previous_page_query'] = self.get_page_query(page.previous_cursor)
+        return context
+
+
+class ProductListView(ConditionalGetMixin, KeysetPaginationMixin, ListView):
+    """
+    Список товаров в продаже по возрастанию цены.
+
+    Страницы переключаются keyset-курсором, а общее число товаров в продаже
+    берётся из кеша, поэтому время ответа не зависит от размера каталога
+    """
+    queryset = Product.objects.filter(archived=False).only('name', 'description', 'price')
     context_object_name = 'products'
+    ordering = 'price', 'pk'
+
+    def get_validators(self) -> Validators:
+        return get_validators(self.request, lists_changed('products'))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['available_products_count'] = get_available_products_count()
+        return context
 
     def get(self, *args, **kwargs):
         logger.info('Called products list view')
         return super().get(*args, **kwargs)
 
 
-class ProductDetailView(LoginRequiredMixin, DetailView):
+class ProductDetailView(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     queryset = Product.objects.prefetch_related('images')
 
+    def get_validators(self) -> Optional[Validators]:
+        return get_validators(self.request, product_changed(self.kwargs['pk']))
+
 
 class ProductCreateView(PermissionRequiredMixin, CreateView):
     permission_required = 'shopapp.add_product'
@@ -96,22 +169,68 @@ class ProductDeleteView(DeleteView):
         return HttpResponseRedirect(success_url)
 
 
-class OrderListView(ListView):
-    model = Order
+class OrderListView(ConditionalGetMixin, KeysetPaginationMixin, ListView):
+    """
+    Список заказов, новые первыми.
+
+    Страницы переключаются keyset-курсором, поэтому время ответа не зависит
+    от размера таблицы. Можно отфильтровать заказы по дате создания и по id
+    пользователя
+    """
     context_object_name = 'orders'
+    ordering = '-creation_time', '-pk'
+    per_page = 50
+
+    def get_validators(self) -> Validators:
+        return get_validators(self.request, lists_changed('orders'))
+
+    def get_filter_form(self) -> OrderFilterForm:
+        if not hasattr(self, 'filter_form'):
+            self.filter_form = OrderFilterForm(self.request.GET)
+        return self.filter_form
+
+    def get_queryset(self):
+        queryset = (
+            Order.objects
+            .select_related('user')
+            .only('creation_time', 'user__username')
+        )
+        form = self.get_filter_form()
+        if not form.is_valid():
+            return queryset
+        since, until, user_id = (form.cleaned_data[field] for field in ('since', 'until', 'user'))
+        if since:
+            queryset = queryset.filter(
+                creation_time__gte=timezone.make_aware(datetime.combine(since, time.min)),
+            )
+        if until:
+            queryset = queryset.filter(
+                creation_time__lt=timezone.make_aware(datetime.combine(until + timedelta(days=1), time.min)),
+            )
+        if user_id:
+            queryset = queryset.filter(user_id=user_id)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filter_form'] = self.get_filter_form()
+        return context
 
     def get(self, *args, **kwargs):
         logger.info('Called orders list view')
         return super().get(*args, **kwargs)
 
 
-class OrderDetailView(DetailView):
+class OrderDetailView(ConditionalGetMixin, DetailView):
     queryset = (
         Order.objects
         .select_related('user')
         .prefetch_related('products')
     )
 
+    def get_validators(self) -> Optional[Validators]:
+        return get_validators(self.request, order_changed(self.kwargs['pk']))
+
 
 class OrderCreateView(CreateView):
     model = Order
@@ -157,33 +276,70 @@ class OrderDeleteView(DeleteView):
 
 
 class OrdersExportView(UserPassesTestMixin, View):
+    """
+    Выгрузка всех заказов.
+
+    Без параметров возвращает JSON целиком, с параметром ``format``
+    (json, ndjson, csv) отдаёт заказы потоком, пачками по ``chunk_size``
+    """
+    chunk_size = EXPORT_CHUNK_SIZE
+
     def test_func(self):
         return self.request.user.is_staff
 
-    def get(self, request: HttpRequest) -> JsonResponse:
+    def get(self, request: HttpRequest) -> HttpResponse:
         logger.info('Called orders export view')
-        orders = Order.objects.order_by('pk').all()
-        orders_data = [
-            {
-                'pk': order.pk,
-                'delivery_address': order.delivery_address,
-                'promocode': order.promocode,
-                'user_id': order.user.pk,
-                'products_id': [product.pk for product in order.products.all()],
-            }
-            for order in orders
-        ]
-        logger.debug('Returning orders info: %s', orders_data)
-        return JsonResponse({'orders': orders_data})
+        export_format = request.GET.get('format')
+        chunks = iter_order_chunks(chunk_size=self.chunk_size)
+        if export_format is None:
+            orders_data = [row for chunk in chunks for row in chunk]
+            logger.debug('Returning info about %s orders', len(orders_data))
+            return JsonResponse({'orders': orders_data})
+
+        if export_format not in EXPORT_FORMATS:
+            return HttpResponseBadRequest(
+                f'Unknown export format {export_format!r}, '
+                f'expected one of: {", ".join(EXPORT_FORMATS)}'
+            )
+        renderer, content_type = EXPORT_FORMATS[export_format]
+        logger.debug('Streaming orders export in %s format', export_format)
+        response = StreamingHttpResponse(renderer(chunks), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
 
 
 class LatestProductsFeed(Feed):
+    """
+    Лента последних добавленных товаров.
+
+    Отрисованная лента кешируется с ключом по последней ревизии товаров,
+    а по ней же отдаются ETag и Last-Modified, так что повторный опрос
+    читалкой стоит не больше одного запроса по индексу
+    """
     title = 'The freshest products'
     description = 'News about adding products or changing the existing ones'
     link = reverse_lazy('shopapp:product_list')
 
+    def __call__(self, request, *args, **kwargs):
+        revision = products_revision()
+        validators = get_validators(request, revision)
+        response = not_modified(request, validators)
+        if response is not None:
+            return response
+        content = get_or_set(
+            make_key('products_feed', revision.timestamp(), request.get_host(), get_language()),
+            lambda: super(LatestProductsFeed, self).__call__(request, *args, **kwargs).content,
+            'products_feed',
+        )
+        return set_validators(HttpResponse(content, content_type=self.feed_type.content_type), validators)
+
     def items(self):
-        return Product.objects.filter(archived=False).order_by('name')[:5]
+        return (
+            Product.objects
+            .filter(archived=False)
+            .order_by('-creation_time', '-pk')
+            .only('name', 'description')[:5]
+        )
 
     def item_title(self, item: Product):
         return item.name
@@ -214,25 +370,28 @@ class UserOrdersListView(LoginRequiredMixin, ListView):
             .prefetch_related('products')
         )
         context['profile_id'] = Profile.objects.filter(user_id=self.owner.pk).values('pk')[0]['pk']
+        context['orders_list_cache_timeout'] = get_timeout('orders_list_fragment')
         return context
 
 
 class UserOrdersExportView(LoginRequiredMixin, TemplateView):
     template_name = 'shopapp/users_orders_export.html'
 
+    def get_orders_data(self):
+        user = get_object_or_404(User, pk=self.kwargs['user_id'])
+        users_orders = OrderSerializer.setup_queryset(Order.objects.filter(user_id=user.pk).order_by('pk'))
+        orders_serializer = OrderSerializer(users_orders, many=True)
+
+        encoder = DjangoJSONEncoder()
+        orders_data = encoder.encode(orders_serializer.data)
+        return json.loads(orders_data)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cache_key = f'export_orders_user_{self.kwargs["user_id"]}'
-        orders_data_json = cache.get(cache_key)
-        if orders_data_json is None:
-            user = get_object_or_404(User, pk=self.kwargs['user_id'])
-            users_orders = Order.objects.filter(user_id=user.pk).order_by('pk')
-            orders_serializer = OrderSerializer(users_orders, many=True)
-
-            encoder = DjangoJSONEncoder()
-            orders_data = encoder.encode(orders_serializer.data)
-            orders_data_json = json.loads(orders_data)
-
-            cache.set(cache_key, orders_data_json, 300)
+        orders_data_json = get_or_set(
+            user_orders_export_key(self.kwargs['user_id']),
+            self.get_orders_data,
+            'orders_export',
+        )
         context['orders_json'] = {'orders': orders_data_json}
         return context